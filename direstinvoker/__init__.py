@@ -60,5 +60,16 @@ class APIError(Exception):
         self.status = status
         self.ret_dic = ret_dic
 
+    @property
+    def error_code(self):
+        """
+        DIRestPlus 返回的错误码，wind 接口为 error_code，iFinD 接口为 errcode，没有则返回 None
+        """
+        if isinstance(self.ret_dic, dict):
+            for key in ('error_code', 'errcode'):
+                if key in self.ret_dic:
+                    return self.ret_dic[key]
+        return None
+
     def __str__(self):
         return "APIError:status=POST / {} {}".format(self.status, self.ret_dic)
@@ -0,0 +1,369 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/8/22 9:48
+@File    : aio.py
+@contact : mmmaaaggg@163.com
+@desc    : 基于 asyncio 的异步 invoker，方法签名与 WindRestInvoker、IFinDInvoker 保持一致，各接口方法返回 coroutine
+需要安装 aiohttp：pip install aiohttp
+"""
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from direstinvoker import APIError
+from direstinvoker.base import copy_ret
+from direstinvoker.iwind import WindRestInvoker
+from direstinvoker.ifind import IFinDInvoker
+from direstinvoker.utils.http_utils import fill_avg_stats, compress_request, ACCEPT_ENCODING
+from direstinvoker.utils.retry import RETRYABLE, NO_DATA
+from direstinvoker.utils.tracing import NETWORK
+from direstinvoker.utils.replay import REPLAY
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger('aio')
+
+
+class _LeaderCancelledError(Exception):
+    """
+    single_flight 在途请求的发起方被取消，等待该请求的其他调用方需重新发送请求
+    """
+
+
+class AsyncInvokerMixin:
+    """
+    异步 invoker 公共实现
+    所有请求共用一个 aiohttp.ClientSession 连接池，并通过 asyncio.Semaphore 限制同时在途的请求数量
+    缓存读写、请求存档的录制与回放等磁盘 IO 在默认线程池中执行，不阻塞事件循环
+    """
+
+    def __init__(self, url_str, pool_size=100, max_concurrency=100, **kwargs):
+        """
+        :param url_str: DIRestPlus 服务地址
+        :param pool_size: 连接池最大连接数
+        :param max_concurrency: 最大同时在途请求数量
+        :param kwargs: keep_alive、connect_timeout、read_timeout 等参数，与同步版本一致
+        """
+        if aiohttp is None:
+            raise ImportError('%s 需要安装 aiohttp：pip install aiohttp' % self.__class__.__name__)
+        super().__init__(url_str, pool_size=pool_size, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._client_session = None
+        self._semaphore = None
+        self._aio_stat_dic = {
+            'request_count': 0,
+            'new_conn_count': 0,
+            'connect_time': 0.0,
+            'elapsed_time': 0.0,
+            'session_count': 0,
+            'request_bytes': 0,
+            'request_raw_bytes': 0,
+            'response_bytes': 0,
+            'response_raw_bytes': 0,
+        }
+
+    async def _on_conn_create_start(self, session, trace_config_ctx, params):
+        trace_config_ctx.conn_start_time = time.time()
+
+    async def _on_conn_create_end(self, session, trace_config_ctx, params):
+        self._aio_stat_dic['new_conn_count'] += 1
+        self._aio_stat_dic['connect_time'] += time.time() - trace_config_ctx.conn_start_time
+
+    def _get_client_session(self):
+        """
+        ClientSession、Semaphore 需要在事件循环中创建，因此在第一次请求时创建
+        :return:
+        """
+        if self._client_session is None or self._client_session.closed:
+            session_pool = self.session_pool
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_start.append(self._on_conn_create_start)
+            trace_config.on_connection_create_end.append(self._on_conn_create_end)
+            connector = aiohttp.TCPConnector(limit=session_pool.pool_size, force_close=not session_pool.keep_alive)
+            timeout = aiohttp.ClientTimeout(connect=session_pool.connect_timeout,
+                                            sock_read=session_pool.read_timeout)
+            headers = {'Accept-Encoding': ACCEPT_ENCODING if session_pool.compress else 'identity'}
+            self._client_session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers,
+                                                         trace_configs=[trace_config])
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._aio_stat_dic['session_count'] += 1
+        return self._client_session
+
+    async def _post(self, path: str, req_data: str, hook_list=()):
+        """
+        发送请求
+        :param path:
+        :param req_data:
+        :param hook_list: 本次调用需要调用的 trace hook 列表
+        :return: (status_code, content)
+        """
+        if self.archive is not None and self.archive.mode == REPLAY:
+            ret_data = await asyncio.get_event_loop().run_in_executor(None, self.archive.replay, path, req_data)
+            return ret_data.status_code, ret_data.content
+        session = self._get_client_session()
+        data, headers, request_raw_bytes = compress_request(req_data, self.header, self.session_pool.compress_min_size)
+        async with self._semaphore:
+            start_time = time.time()
+            try:
+                async with session.post(self._url(path), data=data, headers=headers) as resp:
+                    content = await resp.read()
+                    status_code = resp.status
+                    # aiohttp 自动解压，压缩时按 Content-Length 计算实际传输的字节数
+                    response_bytes = len(content)
+                    if resp.headers.get('Content-Encoding', 'identity') != 'identity' \
+                            and resp.content_length is not None:
+                        response_bytes = resp.content_length
+            finally:
+                elapsed_time = time.time() - start_time
+                self._aio_stat_dic['request_count'] += 1
+                self._aio_stat_dic['elapsed_time'] += elapsed_time
+        self._aio_stat_dic['request_bytes'] += len(data)
+        self._aio_stat_dic['request_raw_bytes'] += request_raw_bytes
+        self._aio_stat_dic['response_bytes'] += response_bytes
+        self._aio_stat_dic['response_raw_bytes'] += len(content)
+        if self.metrics is not None:
+            self.metrics.observe_request(path, elapsed_time, len(data), response_bytes)
+        self._trace(path, NETWORK, elapsed_time, response_bytes, hook_list)
+        if self.archive is not None:
+            await asyncio.get_event_loop().run_in_executor(
+                None, self.archive.record, path, req_data, status_code, content)
+        return status_code, content
+
+    async def _public_post(self, path: str, req_data: str, hook_list=()):
+        status_code, content = await self._post(path, req_data, hook_list)
+        ret_dic = self._decode(path, req_data, content, hook_list)
+
+        return self._check_ret(path, req_data, status_code, ret_dic)
+
+    async def _invoke(self, path: str, req_data_dic: dict, parse_func=None, retry_budget=None, hook_list=None):
+        if hook_list is None:
+            hook_list = self._sample_hooks()
+        if not self.single_flight:
+            return await self._fetch(path, req_data_dic, parse_func, retry_budget, hook_list)
+        # 事件循环中单线程执行，无需加锁
+        key = self._inflight_key(path, req_data_dic, parse_func)
+        future = self._inflight_dic.get(key, None)
+        if future is not None:
+            self._coalesced_count += 1
+        while future is not None:
+            try:
+                return copy_ret(await asyncio.shield(future))
+            except _LeaderCancelledError:
+                # 发起方被取消时，第一个恢复执行的等待方成为新的发起方重新发送请求，其余等待方等待其结果
+                future = self._inflight_dic.get(key, None)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight_dic[key] = future
+        try:
+            ret_data = await self._fetch(path, req_data_dic, parse_func, retry_budget, hook_list)
+        except BaseException as exp:
+            # 发起方被取消时不取消 future，避免等待同一请求的其他调用方收到 CancelledError
+            future.set_exception(_LeaderCancelledError() if isinstance(exp, asyncio.CancelledError) else exp)
+            # 没有其他调用方等待时，避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(ret_data)
+        finally:
+            del self._inflight_dic[key]
+        return ret_data
+
+    async def _fetch(self, path: str, req_data_dic: dict, parse_func=None, retry_budget=None, hook_list=()):
+        use_cache = self._use_cache(path)
+        loop = asyncio.get_event_loop()
+        if use_cache:
+            data_df = await loop.run_in_executor(None, self.cache.get, path, req_data_dic)
+            if data_df is not None:
+                return data_df
+        json_dic = await self._post_with_retry(path, self._encode(path, req_data_dic, hook_list), retry_budget,
+                                               hook_list)
+        ret_data = self._parse(path, json_dic, parse_func, hook_list)
+        if self.rate_limiter is not None:
+            self.rate_limiter.consume_points(path, self._count_points(ret_data))
+        if use_cache:
+            await loop.run_in_executor(None, self.cache.put, path, req_data_dic, ret_data)
+        return ret_data
+
+    async def _post_with_retry(self, path: str, req_data: str, retry_budget=None, hook_list=()):
+        if retry_budget is None:
+            retry_budget = self.retry_policy.new_budget()
+        retry_count = 0
+        while True:
+            try:
+                return await self._limited_post(path, req_data, hook_list)
+            except Exception as exp:
+                if self.metrics is not None:
+                    self.metrics.observe_error(path, exp)
+                category, delay = self.retry_policy.check(exp, retry_count, retry_budget)
+                if category == NO_DATA:
+                    logger.warning('%s post %s 没有数据：%s', self._url(path), req_data, exp)
+                    return None
+                elif category != RETRYABLE:
+                    raise
+                retry_count += 1
+                logger.warning('%s post %s 出错：%s，%.2fs 后第 %d 次重试',
+                               self._url(path), req_data, exp, delay, retry_count)
+            await asyncio.sleep(delay)
+
+    async def _limited_post(self, path: str, req_data: str, hook_list=()):
+        # 回放时不发送请求，不需要限流
+        if self.rate_limiter is None or (self.archive is not None and self.archive.mode == REPLAY):
+            return await self._public_post(path, req_data, hook_list)
+        await self.rate_limiter.acquire_async(path)
+        try:
+            json_dic = await self._public_post(path, req_data, hook_list)
+        except APIError as exp:
+            if self.rate_limiter.is_throttle_error(exp):
+                self.rate_limiter.on_throttled(path)
+            raise
+        self.rate_limiter.on_success(path)
+        return json_dic
+
+    async def _post_chunks(self, path: str, req_data_dic_list: list, parse_func=None, max_workers=None,
+                           hook_list=None):
+        """
+        并发发送分段请求，语义与 InvokerBase._post_chunks 一致
+        max_workers 限制本次调用的并发数，全局并发数由 max_concurrency 限制
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        chunk_count = len(req_data_dic_list)
+        ret_list = [None] * chunk_count
+        retry_budget = self.retry_policy.new_budget()
+        if hook_list is None:
+            hook_list = self._sample_hooks()
+        if max_workers is not None and max_workers <= 1:
+            for num, req_data_dic in enumerate(req_data_dic_list):
+                try:
+                    ret_list[num] = await self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)
+                except Exception as exp:
+                    return ret_list, exp
+            return ret_list, None
+
+        call_semaphore = asyncio.Semaphore(max_workers) if max_workers is not None else None
+
+        async def invoke(req_data_dic):
+            if call_semaphore is None:
+                return await self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)
+            async with call_semaphore:
+                return await self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)
+
+        if chunk_count == 0:
+            return ret_list, None
+        task_list = [asyncio.ensure_future(invoke(req_data_dic)) for req_data_dic in req_data_dic_list]
+        _, pending = await asyncio.wait(task_list, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        if len(pending) > 0:
+            await asyncio.wait(pending)
+        exp_first = None
+        for num, task in enumerate(task_list):
+            if task.cancelled():
+                continue
+            exp = task.exception()
+            if exp is None:
+                ret_list[num] = task.result()
+            elif exp_first is None:
+                exp_first = exp
+        return ret_list, exp_first
+
+    async def _iter_chunks(self, path: str, req_data_dic_list: list, parse_func, max_workers=None):
+        """
+        InvokerBase._iter_chunks 的异步版本（async generator，需要 python 3.6 及以上版本），用法：
+        async for data_df in invoker.iter_wsi(...)
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        if max_workers is None:
+            max_workers = self.max_concurrency
+        retry_budget = self.retry_policy.new_budget()
+        hook_list = self._sample_hooks()
+        task_deque = deque()
+        req_iter = iter(req_data_dic_list)
+        try:
+            for req_data_dic in itertools.islice(req_iter, max(max_workers, 1)):
+                task_deque.append(
+                    asyncio.ensure_future(self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)))
+            while len(task_deque) > 0:
+                ret_data = await task_deque.popleft()
+                for req_data_dic in itertools.islice(req_iter, 1):
+                    task_deque.append(
+                        asyncio.ensure_future(self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)))
+                if ret_data is not None:
+                    yield ret_data
+        finally:
+            for task in task_deque:
+                task.cancel()
+            if len(task_deque) > 0:
+                await asyncio.wait(list(task_deque))
+
+    async def _invoke_chunks(self, path: str, req_data_dic_list: list, parse_func, merge_func, max_workers=None,
+                             compact=None):
+        hook_list = self._sample_hooks()
+        ret_list, exp = await self._post_chunks(path, req_data_dic_list, parse_func, max_workers=max_workers,
+                                                hook_list=hook_list)
+        return self._merge(path, merge_func, ret_list, exp, compact, hook_list)
+
+    def get_stats(self) -> dict:
+        stat_dic = fill_avg_stats(self._aio_stat_dic.copy())
+        stat_dic['coalesced_count'] = self._coalesced_count
+        if self.rate_limiter is not None:
+            stat_dic['rate_limiter'] = self.rate_limiter.get_stats()
+        stat_dic['retry'] = self.retry_policy.get_stats()
+        if self.cache is not None:
+            stat_dic['cache'] = self.cache.get_stats()
+        if self.metrics is not None:
+            stat_dic['metrics'] = self.metrics.snapshot()
+        return stat_dic
+
+    async def close(self):
+        if self._client_session is not None:
+            await self._client_session.close()
+            self._client_session = None
+        self.session_pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class AsyncWindRestInvoker(AsyncInvokerMixin, WindRestInvoker):
+    """
+    WindRestInvoker 异步版本，用法：data_df = await invoker.wsd(...)
+    calendar 需通过同步版本的 invoker 创建：TradingCalendar(WindRestInvoker(url_str))，
+    calendar 首次加载或查询日期超出已加载区间时同步请求服务器：tdaysoffset 在线程池中执行；
+    wsd、wsi 等按交易日切分时间区间时在调用线程中加载，会阻塞事件循环，
+    可预先加载：await loop.run_in_executor(None, invoker.calendar.refresh)
+    """
+
+    async def tdaysoffset(self, offset, beginTime, options=""):
+        if self.calendar is not None and options == "":
+            # 设置 calendar 时在本地计算，可能需要加载交易日历，在线程池中执行
+            return await asyncio.get_event_loop().run_in_executor(
+                None, super().tdaysoffset, offset, beginTime, options)
+        return await super().tdaysoffset(offset, beginTime, options)
+
+
+class AsyncIFinDInvoker(AsyncInvokerMixin, IFinDInvoker):
+    """
+    IFinDInvoker 异步版本，用法：data_df = await invoker.THS_DateSerial(...)
+    """
+    pass
+
+
+if __name__ == "__main__":
+    async def main():
+        url_str = "http://localhost:5000/iFind/"
+        async with AsyncIFinDInvoker(url_str) as invoker:
+            data_df = await invoker.THS_DateQuery('SSE', 'dateType:0,period:D,dateFormat:0', '2018-06-15', '2018-06-21')
+            print(data_df)
+
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,541 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/8/20 10:35
+@File    : base.py
+@contact : mmmaaaggg@163.com
+@desc    : WindRestInvoker、IFinDInvoker 公共基类，负责 HTTP 请求发送
+"""
+import copy
+import json
+import logging
+import time
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_EXCEPTION
+import requests
+import pandas as pd
+from direstinvoker import APIError
+from direstinvoker.utils.fh_utils import split_chunk, split_time_range
+from direstinvoker.utils.http_utils import SessionPool, get_last_post_bytes
+from direstinvoker.utils.json_utils import get_json_loads
+from direstinvoker.utils.schema import compact_df
+from direstinvoker.utils.retry import RetryPolicy, RETRYABLE, NO_DATA
+from direstinvoker.utils.tracing import ENCODE, NETWORK, DECODE, FRAME, CONCAT, COMPACT
+from direstinvoker.utils.replay import REPLAY
+
+logger = logging.getLogger(__name__)
+
+
+def copy_ret(ret_data):
+    """
+    复制请求结果，合并请求时各调用方获得各自的副本，互不影响
+    :param ret_data:
+    :return:
+    """
+    if isinstance(ret_data, (pd.DataFrame, pd.Series)):
+        return ret_data.copy()
+    if isinstance(ret_data, (dict, list)):
+        return copy.deepcopy(ret_data)
+    return ret_data
+
+
+class InvokerBase:
+    # 可使用本地缓存的历史数据接口，由子类设置
+    cache_path_set = set()
+
+    def __init__(self, url_str, pool_size=10, keep_alive=True, max_requests_per_conn=None,
+                 connect_timeout=None, read_timeout=None, max_workers=None, window_days_dic=None, cache=None,
+                 calendar=None, single_flight=True, rate_limiter=None, retry_policy=None, json_backend=None,
+                 compress=True, compress_min_size=None, compact=False, metrics=None, trace_hooks=None,
+                 archive=None):
+        """
+        :param url_str: DIRestPlus 服务地址，例如 http://localhost:5000/wind/
+        :param pool_size: 连接池最大连接数，不小于 max_workers
+        :param keep_alive: 是否保持长连接
+        :param max_requests_per_conn: 连接平均最大复用次数，None 为不限制
+        :param connect_timeout: 建立连接超时时间（秒）
+        :param read_timeout: 读取数据超时时间（秒）
+        :param max_workers: 分段请求的默认并发数，None 或 1 为串行发送
+        :param window_days_dic: 各接口默认的时间区间切分天数，例如 {'wsi/': 5, 'wst/': 1}，未设置的接口不切分
+        :param cache: ResponseCache 对象，对 cache_path_set 中的接口启用本地缓存，None 为不使用缓存
+        :param calendar: TradingCalendar 对象，设置后 tdaysoffset 在本地计算，时间区间切分按交易日对齐，
+        也可在创建 invoker 后通过 invoker.calendar = TradingCalendar(invoker) 设置
+        :param single_flight: 是否合并相同的并发请求，True 时相同 (path, 请求参数) 的请求在途时，后续调用等待其结果而不重复发送
+        :param rate_limiter: RateLimiter 对象，按接口限制请求速率，可在多个 invoker 之间共用，None 为不限流
+        :param retry_policy: RetryPolicy 对象，按错误码分类重试，None 则使用默认参数的 RetryPolicy，
+        RetryPolicy(max_retries=0) 为不重试，无数据错误默认抛出 APIError，RetryPolicy(no_data_as_empty=True) 时返回空数据
+        :param json_backend: json 解码器 'orjson'、'ujson'、'json'，None 则自动选择已安装的最快的解码器
+        :param compress: 是否接受压缩的返回数据
+        :param compress_min_size: 请求数据不小于该字节数时以 gzip 压缩发送，None 为不压缩
+        :param compact: 是否压缩分段请求结果的内存占用（数值类型降级、重复字符串转为 category），可在调用时单独设置
+        :param metrics: Metrics 对象，按接口统计请求次数、耗时分布、传输字节数、返回行数及错误次数，
+        可在多个 invoker 之间共用，None 为不统计
+        :param trace_hooks: trace hook 列表，请求的每个阶段完成后调用 hook(path, phase, elapsed_time, size)，
+        阶段详见 utils.tracing.PHASE_LIST，也可通过 add_trace_hook 添加
+        :param archive: ReplayArchive 对象，RECORD 模式下录制每个请求及返回数据，REPLAY 模式下从录制文件返回数据而不发送请求，
+        None 为不录制
+        """
+        self.url = url_str
+        self.header = {'Content-Type': 'application/json'}
+        self.max_workers = max_workers
+        self.window_days_dic = {} if window_days_dic is None else window_days_dic
+        self.cache = cache
+        self.calendar = calendar
+        self.single_flight = single_flight
+        self.rate_limiter = rate_limiter
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self.json_loads = get_json_loads(json_backend)
+        self.compact = compact
+        self.metrics = metrics
+        self.archive = archive
+        self._trace_hook_list = [] if trace_hooks is None else list(trace_hooks)
+        # 在途请求表 (path, req_data, parse_func) -> Future
+        self._inflight_dic = {}
+        self._inflight_lock = threading.Lock()
+        self._coalesced_count = 0
+        if max_workers is not None and max_workers > pool_size:
+            pool_size = max_workers
+        self.session_pool = SessionPool(pool_size=pool_size, keep_alive=keep_alive,
+                                        max_requests_per_conn=max_requests_per_conn,
+                                        connect_timeout=connect_timeout, read_timeout=read_timeout,
+                                        compress=compress, compress_min_size=compress_min_size)
+
+    def _url(self, path: str) -> str:
+        return self.url + path
+
+    def add_trace_hook(self, hook):
+        """
+        添加 trace hook，例如 utils.tracing.Profiler
+        :param hook: hook(path, phase, elapsed_time, size)
+        :return:
+        """
+        self._trace_hook_list.append(hook)
+
+    def remove_trace_hook(self, hook):
+        self._trace_hook_list.remove(hook)
+
+    def _sample_hooks(self) -> list:
+        """
+        每次顶层调用（_invoke、_invoke_chunks）开始时决定一次是否抽样，返回本次调用需要调用的 trace hook 列表，
+        hook 有 sample 方法时（例如 Profiler）由其决定本次调用是否抽样，否则全部记录
+        """
+        return [hook for hook in self._trace_hook_list if not hasattr(hook, 'sample') or hook.sample()]
+
+    def _timing(self, hook_list) -> bool:
+        """
+        本次调用是否需要记录各阶段耗时，启用 metrics 时全部记录，否则仅记录被抽样的调用
+        :param hook_list: _sample_hooks 返回的 trace hook 列表
+        """
+        return self.metrics is not None or len(hook_list) > 0
+
+    @staticmethod
+    def _trace(path: str, phase: str, elapsed_time: float, size: int, hook_list):
+        for hook in hook_list:
+            try:
+                hook(path, phase, elapsed_time, size)
+            except Exception:
+                logger.exception('trace hook %s 出错', hook)
+
+    def _post(self, path: str, req_data: str, hook_list=()) -> requests.Response:
+        if self.archive is not None and self.archive.mode == REPLAY:
+            return self.archive.replay(path, req_data)
+        if not self._timing(hook_list):
+            ret_data = self.session_pool.post(self._url(path), data=req_data, headers=self.header)
+        else:
+            start_time = time.time()
+            ret_data = self.session_pool.post(self._url(path), data=req_data, headers=self.header)
+            elapsed_time = time.time() - start_time
+            request_bytes, response_bytes = get_last_post_bytes()
+            if self.metrics is not None:
+                self.metrics.observe_request(path, elapsed_time, request_bytes, response_bytes)
+            self._trace(path, NETWORK, elapsed_time, response_bytes, hook_list)
+        if self.archive is not None:
+            self.archive.record(path, req_data, ret_data.status_code, ret_data.content)
+        return ret_data
+
+    def _decode(self, path: str, req_data: str, content, hook_list=()):
+        """
+        json 解码，解码失败时返回 None
+        :param path:
+        :param req_data:
+        :param content: 返回的数据
+        :param hook_list: 本次调用需要调用的 trace hook 列表
+        :return:
+        """
+        start_time = time.time() if self._timing(hook_list) else None
+        try:
+            ret_dic = self.json_loads(content)
+        except ValueError:
+            logger.exception('%s post %s got error\n', self._url(path), req_data)
+            ret_dic = None
+        if start_time is not None:
+            elapsed_time = time.time() - start_time
+            if self.metrics is not None:
+                self.metrics.observe_decode(path, elapsed_time)
+            self._trace(path, DECODE, elapsed_time, len(content), hook_list)
+        return ret_dic
+
+    def _public_post(self, path: str, req_data: str, hook_list=()):
+        """
+        发送请求并返回解析后的 json 数据，由子类实现
+        """
+        raise NotImplementedError()
+
+    def _check_ret(self, path: str, req_data: str, status_code: int, ret_dic):
+        """
+        检查返回状态，返回 json 数据或抛出 APIError，由子类实现
+        """
+        raise NotImplementedError()
+
+    def _invoke(self, path: str, req_data_dic: dict, parse_func=None, retry_budget=None, hook_list=None):
+        """
+        发送单次请求，并通过 parse_func 对返回的 json 数据进行转换
+        各接口方法统一通过 _invoke、_invoke_chunks 发送请求，异步版本的 invoker 重载这两个方法即可
+        single_flight 为 True 时，相同请求在途期间的后续调用等待在途请求的结果，并获得结果的副本
+        :param path:
+        :param req_data_dic:
+        :param parse_func:
+        :param retry_budget: 重试预算，分段请求时各分段共用，None 则为本次请求新建
+        :param hook_list: 本次调用需要调用的 trace hook 列表，分段请求时各分段共用，None 则为本次请求抽样
+        :return:
+        """
+        if hook_list is None:
+            hook_list = self._sample_hooks()
+        if not self.single_flight:
+            return self._fetch(path, req_data_dic, parse_func, retry_budget, hook_list)
+        key = self._inflight_key(path, req_data_dic, parse_func)
+        with self._inflight_lock:
+            future = self._inflight_dic.get(key, None)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight_dic[key] = future
+            else:
+                self._coalesced_count += 1
+        if not is_leader:
+            return copy_ret(future.result())
+
+        try:
+            ret_data = self._fetch(path, req_data_dic, parse_func, retry_budget, hook_list)
+        except BaseException as exp:
+            future.set_exception(exp)
+            raise
+        else:
+            future.set_result(ret_data)
+        finally:
+            with self._inflight_lock:
+                del self._inflight_dic[key]
+        return ret_data
+
+    @staticmethod
+    def _inflight_key(path: str, req_data_dic: dict, parse_func) -> tuple:
+        # 相同参数不同的解析函数（例如 tdays、get_trade_date_list）不能合并
+        return path, json.dumps(req_data_dic, sort_keys=True, default=str), parse_func
+
+    def _fetch(self, path: str, req_data_dic: dict, parse_func=None, retry_budget=None, hook_list=()):
+        """
+        查询缓存或发送请求，并通过 parse_func 对返回的 json 数据进行转换
+        :param path:
+        :param req_data_dic:
+        :param parse_func:
+        :param retry_budget:
+        :param hook_list:
+        :return:
+        """
+        use_cache = self._use_cache(path)
+        if use_cache:
+            data_df = self.cache.get(path, req_data_dic)
+            if data_df is not None:
+                return data_df
+        json_dic = self._post_with_retry(path, self._encode(path, req_data_dic, hook_list), retry_budget, hook_list)
+        ret_data = self._parse(path, json_dic, parse_func, hook_list)
+        if self.rate_limiter is not None:
+            self.rate_limiter.consume_points(path, self._count_points(ret_data))
+        if use_cache:
+            self.cache.put(path, req_data_dic, ret_data)
+        return ret_data
+
+    def _post_with_retry(self, path: str, req_data: str, retry_budget=None, hook_list=()):
+        """
+        发送请求，按 retry_policy 对可重试错误进行重试，retry_policy.no_data_as_empty 为 True 时无数据错误返回 None
+        :param path:
+        :param req_data:
+        :param retry_budget:
+        :param hook_list:
+        :return:
+        """
+        if retry_budget is None:
+            retry_budget = self.retry_policy.new_budget()
+        retry_count = 0
+        while True:
+            try:
+                return self._limited_post(path, req_data, hook_list)
+            except Exception as exp:
+                if self.metrics is not None:
+                    self.metrics.observe_error(path, exp)
+                category, delay = self.retry_policy.check(exp, retry_count, retry_budget)
+                if category == NO_DATA:
+                    logger.warning('%s post %s 没有数据：%s', self._url(path), req_data, exp)
+                    return None
+                elif category != RETRYABLE:
+                    raise
+                retry_count += 1
+                logger.warning('%s post %s 出错：%s，%.2fs 后第 %d 次重试',
+                               self._url(path), req_data, exp, delay, retry_count)
+            time.sleep(delay)
+
+    def _limited_post(self, path: str, req_data: str, hook_list=()):
+        # 回放时不发送请求，不需要限流
+        if self.rate_limiter is None or (self.archive is not None and self.archive.mode == REPLAY):
+            return self._public_post(path, req_data, hook_list)
+        self.rate_limiter.acquire(path)
+        try:
+            json_dic = self._public_post(path, req_data, hook_list)
+        except APIError as exp:
+            if self.rate_limiter.is_throttle_error(exp):
+                self.rate_limiter.on_throttled(path)
+            raise
+        self.rate_limiter.on_success(path)
+        return json_dic
+
+    def _parse(self, path: str, json_dic, parse_func=None, hook_list=()):
+        """
+        通过 parse_func 对返回的 json 数据进行转换
+        """
+        if parse_func is None:
+            return json_dic
+        if not self._timing(hook_list):
+            return parse_func(json_dic)
+        start_time = time.time()
+        ret_data = parse_func(json_dic)
+        elapsed_time = time.time() - start_time
+        cell_count = self._count_points(ret_data)
+        if self.metrics is not None:
+            row_count = ret_data.shape[0] if isinstance(ret_data, (pd.DataFrame, pd.Series)) else 0
+            self.metrics.observe_frame(path, elapsed_time, row_count, cell_count)
+        self._trace(path, FRAME, elapsed_time, cell_count, hook_list)
+        return ret_data
+
+    def _encode(self, path: str, req_data_dic: dict, hook_list=()) -> str:
+        if not hook_list:
+            return json.dumps(req_data_dic)
+        start_time = time.time()
+        req_data = json.dumps(req_data_dic)
+        self._trace(path, ENCODE, time.time() - start_time, len(req_data), hook_list)
+        return req_data
+
+    def _merge(self, path: str, merge_func, ret_list: list, exp, compact=None, hook_list=()):
+        """
+        通过 merge_func 合并各分段结果，并按 compact 设置压缩内存占用
+        """
+        if compact is None:
+            compact = self.compact
+        if not hook_list:
+            ret_data = merge_func(ret_list, exp)
+            return compact_df(ret_data) if compact else ret_data
+        start_time = time.time()
+        ret_data = merge_func(ret_list, exp)
+        self._trace(path, CONCAT, time.time() - start_time, self._count_points(ret_data), hook_list)
+        if compact:
+            start_time = time.time()
+            ret_data = compact_df(ret_data)
+            self._trace(path, COMPACT, time.time() - start_time, self._count_points(ret_data), hook_list)
+        return ret_data
+
+    @staticmethod
+    def _count_points(ret_data) -> int:
+        """
+        返回结果中的数据点数，用于按数据点数限流
+        """
+        if isinstance(ret_data, (pd.DataFrame, pd.Series)):
+            return ret_data.size
+        return 0
+
+    def _use_cache(self, path: str) -> bool:
+        return self.cache is not None and path in self.cache_path_set
+
+    @staticmethod
+    def _split_codes(codes, max_code_num=None) -> list:
+        """
+        将代码列表按 max_code_num 分段，每段以 ',' 链接
+        :param codes: 代码 list 或以 ',' 分隔的字符串
+        :param max_code_num: 每段最大代码数量，None 为不分段
+        :return:
+        """
+        if max_code_num is None:
+            if isinstance(codes, list):
+                codes = ','.join(codes)
+            return [codes]
+        if isinstance(codes, str):
+            codes = codes.split(',')
+        return [','.join(a_list) for a_list in split_chunk(codes, max_code_num)]
+
+    def _split_time_range(self, path: str, time_from, time_to, window_days=None, trade_date_list=None,
+                          with_time=False) -> list:
+        """
+        将查询时间区间按 window_days 天（trade_date_list 不为空时为交易日）切分为多个区间
+        :param path:
+        :param time_from:
+        :param time_to:
+        :param window_days: 每个区间的天数，None 则使用 window_days_dic 中的设置，仍为 None 则不切分
+        :param trade_date_list: 交易日列表，可通过 get_trade_date_list 获取，None 且设置了 calendar 时由 calendar 提供
+        :param with_time: 区间是否带时间
+        :return: [(time_from, time_to), ...]
+        """
+        if window_days is None:
+            window_days = self.window_days_dic.get(path, None)
+        if window_days is None or time_from is None or time_to is None:
+            return [(time_from, time_to)]
+        if trade_date_list is None and self.calendar is not None:
+            trade_date_list = self.calendar.get_range(time_from, time_to)
+        return split_time_range(time_from, time_to, window_days, trade_date_list=trade_date_list, with_time=with_time)
+
+    def _post_chunks(self, path: str, req_data_dic_list: list, parse_func=None, max_workers=None, hook_list=None):
+        """
+        发送分段请求，max_workers > 1 时通过线程池并发发送
+        任何一段请求出错后，尚未开始的分段将被取消，已完成的分段结果保留
+        :param path:
+        :param req_data_dic_list: 分段请求参数列表
+        :param parse_func: 对每一段返回的 json 数据进行转换，例如：转换为 DataFrame
+        :param max_workers: 并发数，None 则使用 self.max_workers
+        :param hook_list: 各分段共用的 trace hook 列表，None 则为本次调用抽样
+        :return: (ret_list, exp) ret_list 与 req_data_dic_list 顺序一致，失败或被取消的分段为 None；
+        exp 为排序最靠前的分段所抛出的异常，没有异常则为 None
+        """
+        # 各分段共用重试预算，仅重试出错的分段
+        retry_budget = self.retry_policy.new_budget()
+        if hook_list is None:
+            hook_list = self._sample_hooks()
+
+        def invoke(req_data_dic):
+            return self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)
+
+        if max_workers is None:
+            max_workers = self.max_workers
+        chunk_count = len(req_data_dic_list)
+        ret_list = [None] * chunk_count
+        if max_workers is None or max_workers <= 1 or chunk_count <= 1:
+            for num, req_data_dic in enumerate(req_data_dic_list):
+                try:
+                    ret_list[num] = invoke(req_data_dic)
+                except Exception as exp:
+                    return ret_list, exp
+            return ret_list, None
+
+        exp_first = None
+        with ThreadPoolExecutor(max_workers=min(max_workers, chunk_count)) as executor:
+            future_list = [executor.submit(invoke, req_data_dic) for req_data_dic in req_data_dic_list]
+            _, not_done = wait(future_list, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+            wait(future_list)
+            for num, future in enumerate(future_list):
+                if future.cancelled():
+                    continue
+                exp = future.exception()
+                if exp is None:
+                    ret_list[num] = future.result()
+                elif exp_first is None:
+                    exp_first = exp
+        return ret_list, exp_first
+
+    def _iter_chunks(self, path: str, req_data_dic_list: list, parse_func, max_workers=None):
+        """
+        发送分段请求，按分段顺序逐个返回各分段结果，结果为空的分段跳过
+        max_workers > 1 时最多同时有 max_workers 个分段在途，内存占用不随分段数量增长；
+        任何一段请求出错时抛出异常，调用方已获得之前各分段的结果
+        :param path:
+        :param req_data_dic_list: 分段请求参数列表
+        :param parse_func: 对每一段返回的 json 数据进行转换
+        :param max_workers: 并发数，None 则使用 self.max_workers
+        :return: generator
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        retry_budget = self.retry_policy.new_budget()
+        hook_list = self._sample_hooks()
+        if max_workers is None or max_workers <= 1 or len(req_data_dic_list) <= 1:
+            for req_data_dic in req_data_dic_list:
+                ret_data = self._invoke(path, req_data_dic, parse_func, retry_budget, hook_list)
+                if ret_data is not None:
+                    yield ret_data
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        future_deque = deque()
+        req_iter = iter(req_data_dic_list)
+        try:
+            for req_data_dic in itertools.islice(req_iter, max_workers):
+                future_deque.append(executor.submit(self._invoke, path, req_data_dic, parse_func, retry_budget,
+                                                     hook_list))
+            while len(future_deque) > 0:
+                ret_data = future_deque.popleft().result()
+                # 取出一个分段结果后再发送下一个分段
+                for req_data_dic in itertools.islice(req_iter, 1):
+                    future_deque.append(executor.submit(self._invoke, path, req_data_dic, parse_func,
+                                                         retry_budget, hook_list))
+                if ret_data is not None:
+                    yield ret_data
+        finally:
+            # 出错或调用方提前结束迭代时取消尚未开始的分段
+            for future in future_deque:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _invoke_chunks(self, path: str, req_data_dic_list: list, parse_func, merge_func, max_workers=None,
+                       compact=None):
+        """
+        发送分段请求，并通过 merge_func 合并结果
+        :param path:
+        :param req_data_dic_list: 分段请求参数列表
+        :param parse_func: 对每一段返回的 json 数据进行转换
+        :param merge_func: merge_func(ret_list, exp) 合并各分段结果
+        :param max_workers: 并发数，None 则使用 self.max_workers
+        :param compact: 是否压缩合并结果的内存占用，None 则使用 self.compact
+        :return:
+        """
+        hook_list = self._sample_hooks()
+        ret_list, exp = self._post_chunks(path, req_data_dic_list, parse_func, max_workers=max_workers,
+                                          hook_list=hook_list)
+        return self._merge(path, merge_func, ret_list, exp, compact, hook_list)
+
+    def batch(self, max_workers=None, merge=True):
+        """
+        创建批量查询，详见 utils.batch.BatchQuery
+        :param max_workers: 并发查询数
+        :param merge: 是否合并除代码外其他参数相同的 wss、edb 查询
+        :return:
+        """
+        # batch 模块引用了本模块，在此处导入避免循环引用
+        from direstinvoker.utils.batch import BatchQuery
+        return BatchQuery(self, max_workers=max_workers, merge=merge)
+
+    def get_stats(self) -> dict:
+        """
+        返回连接池统计信息，详见 SessionPool.get_stats，coalesced_count 为被合并的请求次数，
+        启用限流时 rate_limiter 字段为限流统计信息，retry 字段为重试统计信息，启用缓存时 cache 字段为缓存统计信息，
+        启用 metrics 时 metrics 字段为按接口统计的指标
+        :return:
+        """
+        stat_dic = self.session_pool.get_stats()
+        stat_dic['coalesced_count'] = self._coalesced_count
+        if self.rate_limiter is not None:
+            stat_dic['rate_limiter'] = self.rate_limiter.get_stats()
+        stat_dic['retry'] = self.retry_policy.get_stats()
+        if self.cache is not None:
+            stat_dic['cache'] = self.cache.get_stats()
+        if self.metrics is not None:
+            stat_dic['metrics'] = self.metrics.snapshot()
+        return stat_dic
+
+    def close(self):
+        self.session_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
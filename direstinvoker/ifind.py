@@ -4,40 +4,98 @@ Created on 2016-12-22
 @author: MG
 """
 import pandas as pd
-import requests
-import json
 import logging
-from direstinvoker.utils.fh_utils import split_chunk
+import functools
 from direstinvoker import format_2_date_str, APIError
-from simplejson.errors import JSONDecodeError
+from direstinvoker.base import InvokerBase
+from direstinvoker.utils.fh_utils import merge_time_window_df, extract_date_list
 
 logger = logging.getLogger('ifind')
 
 
-class IFinDInvoker:
-    def __init__(self, url_str):
-        self.url = url_str
-        self.header = {'Content-Type': 'application/json','Connection': 'close'}
+class IFinDInvoker(InvokerBase):
+    cache_path_set = {'THS_DateSerial/', 'THS_HistoryQuotes/', 'THS_EDBQuery/'}
 
-    def _url(self, path: str) -> str:
-        return self.url + path
-
-    def _public_post(self, path: str, req_data: str) -> list:
+    def _public_post(self, path: str, req_data: str, hook_list=()) -> list:
 
         # print('self._url(path):', self._url(path))
-        ret_data = requests.post(self._url(path), data=req_data, headers=self.header)
-        try:
-            ret_dic = ret_data.json()
-        except JSONDecodeError:
-            logger.exception('%s post %s got error\n', self._url(path), req_data)
-            ret_dic = None
+        ret_data = self._post(path, req_data, hook_list)
+        ret_dic = self._decode(path, req_data, ret_data.content, hook_list)
+
+        return self._check_ret(path, req_data, ret_data.status_code, ret_dic)
 
-        if ret_data.status_code != 200:
-            raise APIError(ret_data.status_code, ret_dic)
+    def _check_ret(self, path: str, req_data: str, status_code: int, ret_dic):
+        if status_code != 200:
+            raise APIError(status_code, ret_dic)
         else:
             return ret_dic
 
-    def THS_DateSerial(self, thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime, max_code_num=None) -> pd.DataFrame:
+    @staticmethod
+    def _json_2_df(json_dic) -> pd.DataFrame:
+        if json_dic is None or len(json_dic) == 0:
+            return None
+        return pd.DataFrame(json_dic)
+
+    @staticmethod
+    def _merge_chunks(ret_list, exp, func_str, warn_if_no_data=False, window_count=1) -> pd.DataFrame:
+        """
+        合并分段查询结果
+        对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
+        :param ret_list: 各分段 DataFrame，顺序与分段顺序一致
+        :param exp: 分段查询中产生的异常
+        :param func_str: 日志中显示的函数调用信息
+        :param warn_if_no_data: errcode == -4001 时仅记录警告，返回 None
+        :param window_count: 每个代码分段对应的时间区间数量，同一代码分段的各时间区间按时间顺序合并
+        :return:
+        """
+        if window_count > 1:
+            ret_list = [merge_time_window_df(ret_list[num:num + window_count], time_col='time',
+                                             code_col='thscode')
+                        for num in range(0, len(ret_list), window_count)]
+        df_list = [df for df in ret_list if df is not None]
+        if exp is not None:
+            if not isinstance(exp, APIError):
+                raise exp
+            if len(df_list) == 0:
+                if warn_if_no_data and exp.ret_dic is not None and exp.ret_dic.get('errcode', None) == -4001:
+                    logger.warning('%s 没有数据', func_str)
+                else:
+                    raise exp
+            else:
+                logger.error('%s 失败', func_str, exc_info=exp)
+
+        if len(df_list) > 0:
+            df = pd.concat(df_list)
+        else:
+            df = None
+        return df
+
+    def _invoke_code_chunks(self, path, req_data_dic_list, func_str, max_workers=None, warn_if_no_data=False,
+                            window_count=1, compact=None):
+        return self._invoke_chunks(
+            path, req_data_dic_list, self._json_2_df,
+            functools.partial(self._merge_chunks, func_str=func_str, warn_if_no_data=warn_if_no_data,
+                              window_count=window_count),
+            max_workers=max_workers, compact=compact)
+
+    def get_trade_date_list(self, begintime, endtime, exchange='SSE') -> list:
+        """
+        获取区间内的交易日列表，可用于 THS_HighFrequenceSequence 的 trade_date_list 参数
+        :param begintime:开始时间
+        :param endtime:截止时间
+        :param exchange:交易所简称。例如'SSE'
+        :return: date 列表
+        """
+        path = 'THS_DateQuery/'
+        req_data_dic = {"exchange": exchange,
+                        "params": 'dateType:0,period:D,dateFormat:0',
+                        "begintime": format_2_date_str(begintime),
+                        "endtime": format_2_date_str(endtime)
+                        }
+        return self._invoke(path, req_data_dic, extract_date_list)
+
+    def THS_DateSerial(self, thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime, max_code_num=None,
+                       max_workers=None, compact=None) -> pd.DataFrame:
         """
         日期序列
         :param thscode:同花顺代码，可以是单个代码也可以是多个代码，代码之间用逗号(‘,’)隔开。例如 600004.SH,600007.SH
@@ -46,54 +104,39 @@ class IFinDInvoker:
         :param globalparam:参数，可以是默认参数也根据说明可以对参数进行自定义赋值，参数和参数之间用逗号 (‘, ’) 隔开， 参 数 的 赋 值 用 冒 号 (‘:’) 。 例 如 Days:Tradedays,Fill:Previous,Interval:D
         :param begintime:开始时间，时间格式为 YYYY-MM-DD，例如 2018-06-24
         :param endtime:截止时间，时间格式为 YYYY-MM-DD，例如 2018-07-24
+        :param max_code_num:最大截取数量，如果有值，自动分段切割
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'THS_DateSerial/'
-        code_list = []
-        if type(thscode) == list:
-            # 如果是 list 数据，自动 ',' 链接
-            if max_code_num is None:
-                code_list.append(','.join(thscode))
-            else:
-                # 如果 max_code_num 有值，自动分段切割
-                for a_list in split_chunk(thscode, max_code_num):
-                    code_list.append(','.join(a_list))
-        else:
-            code_list.append(thscode)
+        req_data_dic_list = self._date_serial_req_list(thscode, jsonIndicator, jsonparam, globalparam, begintime,
+                                                       endtime, max_code_num)
+        func_str = 'THS_DateSerial(%s, %s, %s, %s, %s, %s, %s)' % (
+            thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime, max_code_num)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, max_workers=max_workers,
+                                        warn_if_no_data=True, compact=compact)
 
-        df_list = []
-        try:
-            for sub_list in code_list:
-                req_data_dic = {"thscode": sub_list, "jsonIndicator": jsonIndicator,
-                                "jsonparam": jsonparam, "globalparam": globalparam,
-                                "begintime": format_2_date_str(begintime),
-                                "endtime": format_2_date_str(endtime)
-                                }
-                req_data = json.dumps(req_data_dic)
-                json_dic = self._public_post(path, req_data)
-                if json_dic is None or len(json_dic) == 0:
-                    continue
-                df = pd.DataFrame(json_dic)
-                df_list.append(df)
-        except APIError as exp:
-            if len(df_list) == 0:
-                if 'errcode' in exp.ret_dic and exp.ret_dic['errcode'] == -4001:
-                    logger.warning('THS_DateSerial(%s, %s, %s, %s, %s, %s, %s) 没有数据',
-                                   thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime, max_code_num)
-                else:
-                    raise exp from exp
-            else:
-                # 对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
-                logger.exception('THS_DateSerial(%s, %s, %s, %s, %s, %s, %s) 失败',
-                                 thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime, max_code_num)
-        finally:
-            if len(df_list) > 0:
-                df = pd.concat(df_list)
-            else:
-                df = None
-        return df
+    def iter_THS_DateSerial(self, thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime,
+                            max_code_num=None, max_workers=None):
+        """
+        THS_DateSerial 的分段迭代版本，按代码分段逐个返回 DataFrame，参数与 THS_DateSerial 一致
+        """
+        req_data_dic_list = self._date_serial_req_list(thscode, jsonIndicator, jsonparam, globalparam, begintime,
+                                                       endtime, max_code_num)
+        return self._iter_chunks('THS_DateSerial/', req_data_dic_list, self._json_2_df, max_workers=max_workers)
+
+    def _date_serial_req_list(self, thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime,
+                              max_code_num) -> list:
+        return [{"thscode": sub_list, "jsonIndicator": jsonIndicator,
+                 "jsonparam": jsonparam, "globalparam": globalparam,
+                 "begintime": format_2_date_str(begintime),
+                 "endtime": format_2_date_str(endtime)
+                 } for sub_list in self._split_codes(thscode, max_code_num)]
 
-    def THS_HighFrequenceSequence(self, thscode, jsonIndicator, jsonparam, begintime, endtime,max_code_num=None) -> pd.DataFrame:
+    def THS_HighFrequenceSequence(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num=None,
+                                  max_workers=None, window_days=None, trade_date_list=None,
+                                  compact=None) -> pd.DataFrame:
         """
         高频序列
         :param thscode:同花顺代码，可以是单个代码也可以是多个代码，代码之间用逗号(‘,’)隔开。例如 600004.SH,600007.SH
@@ -101,95 +144,69 @@ class IFinDInvoker:
         :param jsonparam:参数，可以是默认参数也根据说明可以对参数进行自定义赋值，参数和参数之间用逗号 (‘ , ’) 隔开， 参 数 的 赋 值 用 冒 号 (‘:’) 。 例 如 100;100
         :param begintime:开始时间，时间格式为YYYY-MM-DD HH:MM:SS，例如2018-05-15 09:30:00
         :param endtime:截止时间，时间格式为YYYY-MM-DD HH:MM:SS，例如2018-05-15 10:00:00
+        :param max_code_num:最大截取数量，如果有值，自动分段切割
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param window_days:按天数（交易日数）切分查询时间区间，None 则使用 window_days_dic 中的设置
+        :param trade_date_list:交易日列表，不为空时按交易日切分时间区间，可通过 get_trade_date_list 获取
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'THS_HighFrequenceSequence/'
-        code_list = []
-        if type(thscode) == list:
-            # 如果是 list 数据，自动 ',' 链接
-            if max_code_num is None:
-                code_list = ','.join(thscode)
-            else:
-                for a_list in split_chunk(thscode, max_code_num):
-                    code_list.append(','.join(a_list))
-        else:
-            code_list.append(thscode)
+        req_data_dic_list, window_count = self._hfs_req_list(thscode, jsonIndicator, jsonparam, begintime, endtime,
+                                                             max_code_num, window_days, trade_date_list)
+        func_str = 'THS_HighFrequenceSequence(%s, %s, %s, %s, %s, %s)' % (
+            thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, max_workers=max_workers,
+                                        window_count=window_count, compact=compact)
 
-        df_list = []
-        try:
-            for sub_list in code_list:
-                req_data_dic = {"thscode": sub_list, "jsonIndicator": jsonIndicator,
-                                "jsonparam": jsonparam,
-                                "begintime": format_2_date_str(begintime),
-                                "endtime": format_2_date_str(endtime)
-                                }
-                req_data = json.dumps(req_data_dic)
-                json_dic = self._public_post(path, req_data)
-                if json_dic is None or len(json_dic) == 0:
-                    continue
-                df = pd.DataFrame(json_dic)
-                df_list.append(df)
-        except APIError as exp:
-            if len(df_list) == 0:
-                raise exp from exp
-            else:
-                # 对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
-                logger.exception('THS_HighFrequenceSequence(%s, %s, %s, %s, %s, %s) 失败',
-                                 thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num)
-        finally:
-            if len(df_list) > 0:
-                df = pd.concat(df_list)
-            else:
-                df = None
-        return df
+    def iter_THS_HighFrequenceSequence(self, thscode, jsonIndicator, jsonparam, begintime, endtime,
+                                       max_code_num=None, max_workers=None, window_days=None, trade_date_list=None):
+        """
+        THS_HighFrequenceSequence 的分段迭代版本，按代码分段、时间区间逐个返回 DataFrame，内存占用不随查询范围增长，
+        参数与 THS_HighFrequenceSequence 一致
+        """
+        req_data_dic_list, _ = self._hfs_req_list(thscode, jsonIndicator, jsonparam, begintime, endtime,
+                                                  max_code_num, window_days, trade_date_list)
+        return self._iter_chunks('THS_HighFrequenceSequence/', req_data_dic_list, self._json_2_df,
+                                 max_workers=max_workers)
+
+    def _hfs_req_list(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num, window_days,
+                      trade_date_list):
+        """
+        生成按代码、时间区间分段的请求参数列表
+        :return: (req_data_dic_list, window_count)
+        """
+        time_range_list = self._split_time_range('THS_HighFrequenceSequence/', begintime, endtime, window_days,
+                                                 trade_date_list, with_time=True)
+        req_data_dic_list = [{"thscode": sub_list, "jsonIndicator": jsonIndicator,
+                              "jsonparam": jsonparam,
+                              "begintime": format_2_date_str(time_from),
+                              "endtime": format_2_date_str(time_to)
+                              } for sub_list in self._split_codes(thscode, max_code_num)
+                             for time_from, time_to in time_range_list]
+        return req_data_dic_list, len(time_range_list)
 
-    def THS_RealtimeQuotes(self, thscode, jsonIndicator, jsonparam="", max_code_num=None) -> pd.DataFrame:
+    def THS_RealtimeQuotes(self, thscode, jsonIndicator, jsonparam="", max_code_num=None,
+                           max_workers=None, compact=None) -> pd.DataFrame:
         """
         实时序列
         :param thscode:同花顺代码，可以是单个代码也可以是多个代码，代码之间用逗号(‘,’)隔开。例如 600004.SH,600007.SH
         :param jsonIndicator:指标，可以是单个指标也可以是多个指标，指标之间用分号(‘;’)隔开。例如'close;open'
         :param jsonparam:参数，可以是默认参数也可以根据说明对参数进行自定义赋值，参数和参数之间用逗号(‘，’)隔开，参数的赋值用冒号(‘:’)。例如'pricetype:1'
+        :param max_code_num:最大截取数量，如果有值，自动分段切割
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'THS_RealtimeQuotes/'
-        code_list = []
-        if type(thscode) == list:
-            # 如果是 list 数据，自动 ',' 链接
-            if max_code_num is None:
-                code_list = ','.join(thscode)
-            else:
-                for a_list in split_chunk(thscode, max_code_num):
-                    code_list.append(','.join(a_list))
-        else:
-            code_list.append(thscode)
+        req_data_dic_list = [{"thscode": sub_list, "jsonIndicator": jsonIndicator,
+                              "jsonparam": jsonparam
+                              } for sub_list in self._split_codes(thscode, max_code_num)]
+        func_str = 'THS_RealtimeQuotes(%s, %s, %s, %s)' % (thscode, jsonIndicator, jsonparam, max_code_num)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, max_workers=max_workers, compact=compact)
 
-        df_list = []
-        try:
-            for sub_list in code_list:
-                req_data_dic = {"thscode": sub_list, "jsonIndicator": jsonIndicator,
-                                "jsonparam": jsonparam
-                                }
-                req_data = json.dumps(req_data_dic)
-                json_dic = self._public_post(path, req_data)
-                if json_dic is None or len(json_dic) == 0:
-                    continue
-                df = pd.DataFrame(json_dic)
-                df_list.append(df)
-        except APIError as exp:
-            if len(df_list) == 0:
-                raise exp from exp
-            else:
-                # 对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
-                logger.exception('THS_RealtimeQuotes(%s, %s, %s, %s) 失败',
-                                 thscode, jsonIndicator, jsonparam, max_code_num)
-        finally:
-            if len(df_list) > 0:
-                df = pd.concat(df_list)
-            else:
-                df = None
-        return df
-
-    def THS_HistoryQuotes(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num=None) -> pd.DataFrame:
+    def THS_HistoryQuotes(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num=None,
+                          max_workers=None, compact=None) -> pd.DataFrame:
         """
         历史序列
         :param thscode:同花顺代码，可以是单个代码也可以是多个代码，代码之间用逗号(‘,’)隔开。例如 600004.SH,600007.SH
@@ -197,50 +214,36 @@ class IFinDInvoker:
         :param jsonparam:参数，可以是默认参数也根据说明可以对参数进行自定义赋值，参数和参数之间用逗号(‘，’)隔开，参数的赋值用冒号(‘:’)。例如' period:D,pricetype:1,rptcategory:1'
         :param begintime:开始时间，时间格式为YYYY-MM-DD，例如2015-06-23
         :param endtime:截止时间，时间格式为YYYY-MM-DD，例如2016-06-23
+        :param max_code_num:最大截取数量，如果有值，自动分段切割
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'THS_HistoryQuotes/'
-        code_list = []
-        if type(thscode) == list:
-            # 如果是 list 数据，自动 ',' 链接
-            if max_code_num is None:
-                code_list.append(','.join(thscode))
-            else:
-                # 如果 max_code_num 有值，自动分段切割
-                for a_list in split_chunk(thscode, max_code_num):
-                    code_list.append(','.join(a_list))
-        else:
-            code_list.append(thscode)
+        req_data_dic_list = [{"thscode": sub_list, "jsonIndicator": jsonIndicator,
+                              "jsonparam": jsonparam,
+                              "begintime": format_2_date_str(begintime),
+                              "endtime": format_2_date_str(endtime)
+                              } for sub_list in self._split_codes(thscode, max_code_num)]
+        func_str = 'THS_HistoryQuotes(%s, %s, %s, %s, %s, %s)' % (
+            thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, max_workers=max_workers, compact=compact)
 
-        df_list = []
-        try:
-            for sub_list in code_list:
-                req_data_dic = {"thscode": sub_list, "jsonIndicator": jsonIndicator,
-                                "jsonparam": jsonparam,
-                                "begintime": format_2_date_str(begintime),
-                                "endtime": format_2_date_str(endtime)
-                                }
-                req_data = json.dumps(req_data_dic)
-                json_dic = self._public_post(path, req_data)
-                if json_dic is None or len(json_dic) == 0:
-                    continue
-                df = pd.DataFrame(json_dic)
-                df_list.append(df)
-        except APIError as exp:
-            if len(df_list) == 0:
-                raise exp from exp
-            else:
-                # 对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
-                logger.exception('THS_HistoryQuotes(%s, %s, %s, %s, %s, %s) 失败',
-                                 thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num)
-        finally:
-            if len(df_list) > 0:
-                df = pd.concat(df_list)
-            else:
-                df = None
-        return df
+    def iter_THS_HistoryQuotes(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num=None,
+                               max_workers=None):
+        """
+        THS_HistoryQuotes 的分段迭代版本，按代码分段逐个返回 DataFrame，参数与 THS_HistoryQuotes 一致
+        """
+        path = 'THS_HistoryQuotes/'
+        req_data_dic_list = [{"thscode": sub_list, "jsonIndicator": jsonIndicator,
+                              "jsonparam": jsonparam,
+                              "begintime": format_2_date_str(begintime),
+                              "endtime": format_2_date_str(endtime)
+                              } for sub_list in self._split_codes(thscode, max_code_num)]
+        return self._iter_chunks(path, req_data_dic_list, self._json_2_df, max_workers=max_workers)
 
-    def THS_Snapshot(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num=None) -> pd.DataFrame:
+    def THS_Snapshot(self, thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num=None,
+                     max_workers=None, compact=None) -> pd.DataFrame:
         """
         日内快照序列
         :param thscode:同花顺代码，可以是单个代码也可以是多个代码，代码之间用逗号(‘,’)隔开。例如 600004.SH,600007.SH
@@ -248,97 +251,39 @@ class IFinDInvoker:
         :param jsonparam:参数，当前参数只能是dataType:Original
         :param begintime:开始时间，时间格式为YYYY-MM-DD HH:MM:SS，例如2017-05-15 09:30:00。
         :param endtime:截止时间，时间格式为YYYY-MM-DD HH:MM:SS，例如2017-05-15 10:00:00
+        :param max_code_num:最大截取数量，如果有值，自动分段切割
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'THS_Snapshot/'
-        code_list = []
-        if type(thscode) == list:
-            # 如果是 list 数据，自动 ',' 链接
-            if max_code_num is None:
-                code_list.append(','.join(thscode))
-            else:
-                # 如果 max_code_num 有值，自动分段切割
-                for a_list in split_chunk(thscode, max_code_num):
-                    code_list.append(','.join(a_list))
-        else:
-            code_list.append(thscode)
-
-        df_list = []
-        try:
-            for sub_list in code_list:
-                req_data_dic = {"thscode": sub_list, "jsonIndicator": jsonIndicator,
-                                "jsonparam": jsonparam,
-                                "begintime": format_2_date_str(begintime),
-                                "endtime": format_2_date_str(endtime)
-                                }
-                req_data = json.dumps(req_data_dic)
-                json_dic = self._public_post(path, req_data)
-                if json_dic is None or len(json_dic) == 0:
-                    continue
-                df = pd.DataFrame(json_dic)
-                df_list.append(df)
-        except APIError as exp:
-            if len(df_list) == 0:
-                raise exp from exp
-            else:
-                # 对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
-                logger.exception('THS_Snapshot(%s, %s, %s, %s, %s, %s) 失败',
-                                 thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num)
-        finally:
-            if len(df_list) > 0:
-                df = pd.concat(df_list)
-            else:
-                df = None
-        return df
+        req_data_dic_list = [{"thscode": sub_list, "jsonIndicator": jsonIndicator,
+                              "jsonparam": jsonparam,
+                              "begintime": format_2_date_str(begintime),
+                              "endtime": format_2_date_str(endtime)
+                              } for sub_list in self._split_codes(thscode, max_code_num)]
+        func_str = 'THS_Snapshot(%s, %s, %s, %s, %s, %s)' % (
+            thscode, jsonIndicator, jsonparam, begintime, endtime, max_code_num)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, max_workers=max_workers, compact=compact)
 
-    def THS_BasicData(self, thsCode, indicatorName, paramOption, max_code_num=None) -> pd.DataFrame:
+    def THS_BasicData(self, thsCode, indicatorName, paramOption, max_code_num=None, max_workers=None,
+                      compact=None) -> pd.DataFrame:
         """
         基础数据序列
         :param thsCode:同花顺代码，可以是单个代码也可以是多个代码，代码之间用逗号(‘,’)隔开。例如 600004.SH,600007.SH
         :param indicatorName:指标，可以是单个指标也可以是多个指标，指标之间用分号(‘;’)隔开。例如'ths_stock_short_name_stock;ths_np_stock'
         :param paramOption:函数对应的参数，参数和参数之间用逗号(‘，’)隔开。例如';2017-12-31,100'
         :param max_code_num:最大截取数量
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'THS_BasicData/'
-        code_list = []
-        if type(thsCode) == list:
-            # 如果是 list 数据，自动 ',' 链接
-            if max_code_num is None:
-                code_list.append(','.join(thsCode))
-            else:
-                # 如果 max_code_num 有值，自动分段切割
-                for a_list in split_chunk(thsCode, max_code_num):
-                    code_list.append(','.join(a_list))
-        else:
-            code_list.append(thsCode)
-
-        df_list = []
-        try:
-            for a_list in code_list:
-                req_data_dic = {"thsCode": a_list, "indicatorName": indicatorName,
-                                "paramOption": paramOption
-                                }
-                req_data = json.dumps(req_data_dic)
-                json_dic = self._public_post(path, req_data)
-                if json_dic is None or len(json_dic) == 0:
-                    continue
-                df = pd.DataFrame(json_dic)
-                df_list.append(df)
-        except APIError as exp:
-            if len(df_list) == 0:
-                raise exp from exp
-            else:
-                # 对于分段查询的情况，如果中途某一段产生错误（可能是流量不够）则不抛出异常，而将已查询出来的数据返回
-                logger.exception('THS_BasicData(%s, %s, %s, %s) 失败',
-                                 thsCode, indicatorName, paramOption, max_code_num)
-        finally:
-            # 合并数据
-            if len(df_list) > 0:
-                df = pd.concat(df_list)
-            else:
-                df = None
-        return df
+        req_data_dic_list = [{"thsCode": a_list, "indicatorName": indicatorName,
+                              "paramOption": paramOption
+                              } for a_list in self._split_codes(thsCode, max_code_num)]
+        func_str = 'THS_BasicData(%s, %s, %s, %s)' % (thsCode, indicatorName, paramOption, max_code_num)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, max_workers=max_workers, compact=compact)
 
     def THS_DataPool(self, DataPoolname, paramname, FunOption) -> pd.DataFrame:
         """
@@ -352,11 +297,7 @@ class IFinDInvoker:
         req_data_dic = {"DataPoolname": DataPoolname, "paramname": paramname,
                         "FunOption": FunOption
                         }
-        req_data = json.dumps(req_data_dic)
-        json_dic = self._public_post(path, req_data)
-        # print(json_dic)
-        df = pd.DataFrame(json_dic)
-        return df
+        return self._invoke(path, req_data_dic, pd.DataFrame)
 
     def THS_EDBQuery(self, indicators, begintime, endtime) -> pd.DataFrame:
         """
@@ -371,10 +312,7 @@ class IFinDInvoker:
                         "begintime": format_2_date_str(begintime),
                         "endtime": format_2_date_str(endtime)
                         }
-        req_data = json.dumps(req_data_dic)
-        json_dic = self._public_post(path, req_data)
-        df = pd.DataFrame(json_dic)
-        return df
+        return self._invoke(path, req_data_dic, pd.DataFrame)
 
     def THS_DateQuery(self, exchange, params, begintime, endtime) -> pd.DataFrame:
         """
@@ -391,10 +329,7 @@ class IFinDInvoker:
                         "begintime": format_2_date_str(begintime),
                         "endtime": format_2_date_str(endtime)
                         }
-        req_data = json.dumps(req_data_dic)
-        json_dic = self._public_post(path, req_data)
-        df = pd.DataFrame(json_dic)
-        return df
+        return self._invoke(path, req_data_dic, pd.DataFrame)
 
 
 if __name__ == "__main__":
@@ -4,42 +4,182 @@ Created on 2016-12-22
 @author: MG
 """
 import pandas as pd
-import requests
-import json
 import logging
+import functools
 from direstinvoker import format_2_date_str, format_2_datetime_str, APIError
-from simplejson.errors import JSONDecodeError
+from direstinvoker.base import InvokerBase
+from direstinvoker.utils.fh_utils import merge_time_window_df, extract_date_list
+from direstinvoker.utils.json_utils import dict_2_df
+from direstinvoker.utils.schema import restore_categorical, build_column
 
 logger = logging.getLogger('wind')
 
 
-class WindRestInvoker:
-    def __init__(self, url_str):
-        self.url = url_str
-        self.header = {'Content-Type': 'application/json'}
+class WindRestInvoker(InvokerBase):
+    cache_path_set = {'wsd/', 'edb/'}
 
-    def _url(self, path: str) -> str:
-        return self.url + path
+    def __init__(self, url_str, max_code_num_dic=None, **kwargs):
+        """
+        :param url_str: DIRestPlus 服务地址，例如 http://localhost:5000/wind/
+        :param max_code_num_dic: 各接口默认的每次请求最大代码数量，例如 {'wss/': 1000, 'wsi/': 20}，
+        未设置的接口不分段
+        :param kwargs: 连接池、并发等参数，详见 InvokerBase
+        """
+        super().__init__(url_str, **kwargs)
+        self.max_code_num_dic = {} if max_code_num_dic is None else max_code_num_dic
 
     def public_post(self, path: str, req_data: str) -> list:
+        return self._public_post(path, req_data)
+
+    def _public_post(self, path: str, req_data: str, hook_list=()) -> list:
 
         # print('self._url(path):', self._url(path))
-        ret_data = requests.post(self._url(path), data=req_data, headers=self.header)
-        try:
-            ret_dic = ret_data.json()
-        except JSONDecodeError:
-            logger.exception('%s post %s got error\n', self._url(path), req_data)
-            ret_dic = None
-
-        if ret_data.status_code != 200:
+        ret_data = self._post(path, req_data, hook_list)
+        ret_dic = self._decode(path, req_data, ret_data.content, hook_list)
+
+        return self._check_ret(path, req_data, ret_data.status_code, ret_dic)
+
+    def _check_ret(self, path: str, req_data: str, status_code: int, ret_dic):
+        if status_code != 200:
             if ret_dic is not None and 'error_code' in ret_dic and ret_dic['error_code'] == -4001:
                 logger.error('%s post %s got error\n%s', self._url(path), req_data, ret_dic)
                 return None
             else:
-                raise APIError(ret_data.status_code, ret_dic)
+                raise APIError(status_code, ret_dic)
         else:
             return ret_dic
 
+    @staticmethod
+    def _json_2_df(json_dic) -> pd.DataFrame:
+        return dict_2_df(json_dic)
+
+    @staticmethod
+    def _json_2_chunk_df(json_dic) -> pd.DataFrame:
+        if json_dic is None or len(json_dic) == 0:
+            return None
+        return dict_2_df(json_dic)
+
+    @staticmethod
+    def _json_2_ts_chunk_df(json_dic) -> pd.DataFrame:
+        if json_dic is None or len(json_dic) == 0:
+            return None
+        return dict_2_df(json_dic, datetime_index=True)
+
+    @staticmethod
+    def _json_2_date_str(json_dic) -> str:
+        return json_dic['Date']
+
+    @staticmethod
+    def _to_code_rows(df, code, column_list=None) -> pd.DataFrame:
+        """
+        单一代码时 wsi、wst 返回结果的 index 为时间且没有 windcode 字段，转换为与多代码结果一致的格式：
+        index 转为 time 字段，增加 windcode 字段
+        :param df: 单一代码分段的结果
+        :param code: 代码
+        :param column_list: 多代码分段结果的字段顺序，None 则为 time、windcode、各指标
+        :return:
+        """
+        df = df.reset_index()
+        df.columns = ['time'] + list(df.columns[1:])
+        df.insert(1, 'windcode', build_column('windcode', [code] * df.shape[0]))
+        if column_list is not None and set(column_list) == set(df.columns):
+            df = df[column_list]
+        return df
+
+    @staticmethod
+    def _merge_chunks(ret_list, exp, func_str, axis=0, window_count=1, chunk_codes_list=None,
+                      code_rows=False) -> pd.DataFrame:
+        """
+        合并分段查询结果
+        如果中途某一段产生错误则不抛出异常，而将已查询出来的数据返回
+        :param ret_list: 各分段 DataFrame，顺序与分段顺序一致
+        :param exp: 分段查询中产生的异常
+        :param func_str: 日志中显示的函数调用信息
+        :param axis: 0 各代码分段按行合并（index 为代码），1 各代码分段按列合并（columns 为代码）
+        :param window_count: 每个代码分段对应的时间区间数量，同一代码分段的各时间区间按时间顺序合并
+        :param chunk_codes_list: 各代码分段的代码（以 ',' 分隔），用于修正单一代码分段的格式
+        :param code_rows: 各代码分段按行合并时是否为 wsi、wst 格式（每行为一个代码一个时间，包含 time、windcode 字段）
+        :return:
+        """
+        if window_count > 1:
+            ret_list = [merge_time_window_df(ret_list[num:num + window_count], time_col='time',
+                                             code_col='windcode')
+                        for num in range(0, len(ret_list), window_count)]
+        if axis == 1 and chunk_codes_list is not None and len(chunk_codes_list) > 1:
+            # 单一代码时 wind 返回结果的列名为指标名称而不是代码，按列合并前改为代码
+            for num, (df, sub_codes) in enumerate(zip(ret_list, chunk_codes_list)):
+                sub_code_list = sub_codes.split(',')
+                if df is not None and len(sub_code_list) == 1 and df.shape[1] == 1:
+                    ret_list[num] = df.rename(columns={df.columns[0]: sub_code_list[0]})
+        code_rows = code_rows and axis == 0 and chunk_codes_list is not None and len(chunk_codes_list) > 1
+        if code_rows:
+            # 单一代码分段转换为与多代码分段一致的格式后再按行合并
+            column_list = next((list(df.columns) for df in ret_list if df is not None and 'windcode' in df.columns),
+                               None)
+            for num, (df, sub_codes) in enumerate(zip(ret_list, chunk_codes_list)):
+                sub_code_list = sub_codes.split(',')
+                if df is not None and len(sub_code_list) == 1 and 'windcode' not in df.columns:
+                    ret_list[num] = WindRestInvoker._to_code_rows(df, sub_code_list[0], column_list)
+        df_list = [df for df in ret_list if df is not None]
+        if exp is not None:
+            if len(df_list) == 0 or not isinstance(exp, APIError):
+                raise exp
+            logger.error('%s 失败', func_str, exc_info=exp)
+
+        if len(df_list) == 0:
+            df = pd.DataFrame()
+        elif len(df_list) == 1:
+            df = df_list[0]
+        else:
+            # wsi、wst 各分段的 index 为分段内的行号，合并后重新编号
+            df = restore_categorical(pd.concat(df_list, axis=axis, ignore_index=code_rows), df_list) if axis == 0 \
+                else pd.concat(df_list, axis=axis)
+        return df
+
+    def _get_max_code_num(self, path, max_code_num=None):
+        return self.max_code_num_dic.get(path, None) if max_code_num is None else max_code_num
+
+    def _invoke_code_chunks(self, path, req_data_dic_list, func_str, axis=0, max_workers=None, window_count=1,
+                            datetime_index=False, compact=None, code_rows=False):
+        chunk_codes_list = [req_data_dic['codes'] for req_data_dic in req_data_dic_list[::window_count]]
+        return self._invoke_chunks(
+            path, req_data_dic_list, self._json_2_ts_chunk_df if datetime_index else self._json_2_chunk_df,
+            functools.partial(self._merge_chunks, func_str=func_str, axis=axis, window_count=window_count,
+                              chunk_codes_list=chunk_codes_list, code_rows=code_rows),
+            max_workers=max_workers, compact=compact)
+
+    def _ts_req_list(self, path, codes, fields, beginTime, endTime, options, max_code_num, window_days,
+                     trade_date_list, with_time, format_func):
+        """
+        生成按代码、时间区间分段的请求参数列表，同一代码分段的各时间区间相邻
+        :return: (req_data_dic_list, window_count)
+        """
+        if isinstance(fields, list):
+            fields = ','.join(fields)
+        time_range_list = self._split_time_range(path, beginTime, endTime, window_days, trade_date_list,
+                                                 with_time=with_time)
+        req_data_dic_list = [{"codes": sub_codes, "fields": fields,
+                              "beginTime": format_func(time_from),
+                              "endTime": format_func(time_to),
+                              "options": options}
+                             for sub_codes in self._split_codes(codes, self._get_max_code_num(path, max_code_num))
+                             for time_from, time_to in time_range_list]
+        return req_data_dic_list, len(time_range_list)
+
+    def get_trade_date_list(self, beginTime, endTime, options="") -> list:
+        """
+        获取区间内的交易日列表，可用于 wsd、wsi、wst 的 trade_date_list 参数
+        :param beginTime:开始时间
+        :param endTime:结束时间
+        :param options:可选参数
+        :return: date 列表
+        """
+        path = 'tdays/'
+        req_data_dic = {"beginTime": format_2_date_str(beginTime),
+                        "endTime": format_2_date_str(endTime),
+                        "options": options}
+        return self._invoke(path, req_data_dic, extract_date_list)
+
     def wset(self, tablename, options) -> pd.DataFrame:
         """
         获取板块、指数等成分数据
@@ -49,31 +189,41 @@ class WindRestInvoker:
         """
         path = 'wset/'
         req_data_dic = {"tablename": tablename, "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        return self._invoke(path, req_data_dic, self._json_2_df)
 
-    def wss(self, codes, fields, options="") -> pd.DataFrame:
+    def wss(self, codes, fields, options="", max_code_num=None, max_workers=None, compact=None) -> pd.DataFrame:
         """
         获历史截面数据
         :param codes:数据集名称
         :param fields:指标
         :param options:可选参数
+        :param max_code_num:每次请求最大代码数量，None 则使用 max_code_num_dic 中的设置
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'wss/'
-        if isinstance(codes, list):
-            codes = ','.join(codes)
         if isinstance(fields, list):
             fields = ','.join(fields)
-        req_data_dic = {"codes": codes, "fields": fields, "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        req_data_dic_list = [{"codes": sub_codes, "fields": fields, "options": options}
+                             for sub_codes in self._split_codes(codes, self._get_max_code_num(path, max_code_num))]
+        func_str = 'wss(%s, %s, %s)' % (codes, fields, options)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, axis=0, max_workers=max_workers,
+                                        compact=compact)
 
-    def wsd(self, codes, fields, beginTime, endTime, options="") -> pd.DataFrame:
+    def iter_wss(self, codes, fields, options="", max_code_num=None, max_workers=None):
+        """
+        wss 的分段迭代版本，按代码分段逐个返回 DataFrame，参数与 wss 一致
+        """
+        path = 'wss/'
+        if isinstance(fields, list):
+            fields = ','.join(fields)
+        req_data_dic_list = [{"codes": sub_codes, "fields": fields, "options": options}
+                             for sub_codes in self._split_codes(codes, self._get_max_code_num(path, max_code_num))]
+        return self._iter_chunks(path, req_data_dic_list, self._json_2_chunk_df, max_workers=max_workers)
+
+    def wsd(self, codes, fields, beginTime, endTime, options="", max_code_num=None, max_workers=None,
+            window_days=None, trade_date_list=None, compact=None) -> pd.DataFrame:
         """
         获取历史序列数据
         :param codes:数据集名称
@@ -81,23 +231,35 @@ class WindRestInvoker:
         :param beginTime:开始时间
         :param endTime:结束时间
         :param options:可选参数
+        :param max_code_num:每次请求最大代码数量，None 则使用 max_code_num_dic 中的设置
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param window_days:按天数（交易日数）切分查询时间区间，None 则使用 window_days_dic 中的设置
+        :param trade_date_list:交易日列表，不为空时按交易日切分时间区间
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'wsd/'
-        if isinstance(codes, list):
-            codes = ','.join(codes)
-        if isinstance(fields, list):
-            fields = ','.join(fields)
-        req_data_dic = {"codes": codes, "fields": fields,
-                        "beginTime": format_2_date_str(beginTime),
-                        "endTime": format_2_date_str(endTime),
-                        "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        req_data_dic_list, window_count = self._ts_req_list(path, codes, fields, beginTime, endTime, options,
+                                                            max_code_num, window_days, trade_date_list,
+                                                            with_time=False, format_func=format_2_date_str)
+        func_str = 'wsd(%s, %s, %s, %s, %s)' % (codes, fields, beginTime, endTime, options)
+        # 多代码情况下 wsd 返回结果 index 为日期，columns 为代码
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, axis=1, max_workers=max_workers,
+                                        window_count=window_count, datetime_index=True, compact=compact)
 
-    def wsi(self, codes, fields, beginTime, endTime, options="") -> pd.DataFrame:
+    def iter_wsd(self, codes, fields, beginTime, endTime, options="", max_code_num=None, max_workers=None,
+                 window_days=None, trade_date_list=None):
+        """
+        wsd 的分段迭代版本，按代码分段、时间区间逐个返回 DataFrame，内存占用不随查询范围增长，参数与 wsd 一致
+        """
+        path = 'wsd/'
+        req_data_dic_list, _ = self._ts_req_list(path, codes, fields, beginTime, endTime, options, max_code_num,
+                                                 window_days, trade_date_list, with_time=False,
+                                                 format_func=format_2_date_str)
+        return self._iter_chunks(path, req_data_dic_list, self._json_2_ts_chunk_df, max_workers=max_workers)
+
+    def wsi(self, codes, fields, beginTime, endTime, options="", max_code_num=None, max_workers=None,
+            window_days=None, trade_date_list=None, compact=None) -> pd.DataFrame:
         """
         获取分钟数据数据
         :param codes:数据集名称
@@ -105,23 +267,35 @@ class WindRestInvoker:
         :param beginTime:开始时间
         :param endTime:结束时间
         :param options:可选参数
+        :param max_code_num:每次请求最大代码数量，None 则使用 max_code_num_dic 中的设置
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param window_days:按天数（交易日数）切分查询时间区间，None 则使用 window_days_dic 中的设置
+        :param trade_date_list:交易日列表，不为空时按交易日切分时间区间
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'wsi/'
-        if isinstance(codes, list):
-            codes = ','.join(codes)
-        if isinstance(fields, list):
-            fields = ','.join(fields)
-        req_data_dic = {"codes": codes, "fields": fields,
-                        "beginTime": format_2_date_str(beginTime),
-                        "endTime": format_2_date_str(endTime),
-                        "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        req_data_dic_list, window_count = self._ts_req_list(path, codes, fields, beginTime, endTime, options,
+                                                            max_code_num, window_days, trade_date_list,
+                                                            with_time=True, format_func=format_2_date_str)
+        func_str = 'wsi(%s, %s, %s, %s, %s)' % (codes, fields, beginTime, endTime, options)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, axis=0, max_workers=max_workers,
+                                        window_count=window_count, datetime_index=True, compact=compact,
+                                        code_rows=True)
 
-    def wst(self, codes, fields, beginTime, endTime, options="") -> pd.DataFrame:
+    def iter_wsi(self, codes, fields, beginTime, endTime, options="", max_code_num=None, max_workers=None,
+                 window_days=None, trade_date_list=None):
+        """
+        wsi 的分段迭代版本，按代码分段、时间区间逐个返回 DataFrame，内存占用不随查询范围增长，参数与 wsi 一致
+        """
+        path = 'wsi/'
+        req_data_dic_list, _ = self._ts_req_list(path, codes, fields, beginTime, endTime, options, max_code_num,
+                                                 window_days, trade_date_list, with_time=True,
+                                                 format_func=format_2_date_str)
+        return self._iter_chunks(path, req_data_dic_list, self._json_2_ts_chunk_df, max_workers=max_workers)
+
+    def wst(self, codes, fields, beginTime, endTime, options="", max_code_num=None, max_workers=None,
+            window_days=None, trade_date_list=None, compact=None) -> pd.DataFrame:
         """
         获取日内tick级别数据
         :param codes:数据集名称
@@ -129,40 +303,52 @@ class WindRestInvoker:
         :param beginTime:开始时间
         :param endTime:结束时间
         :param options:可选参数
+        :param max_code_num:每次请求最大代码数量，None 则使用 max_code_num_dic 中的设置
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param window_days:按天数（交易日数）切分查询时间区间，None 则使用 window_days_dic 中的设置
+        :param trade_date_list:交易日列表，不为空时按交易日切分时间区间
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'wst/'
-        if isinstance(codes, list):
-            codes = ','.join(codes)
-        if isinstance(fields, list):
-            fields = ','.join(fields)
-        req_data_dic = {"codes": codes, "fields": fields,
-                        "beginTime": format_2_datetime_str(beginTime),
-                        "endTime": format_2_datetime_str(endTime),
-                        "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        req_data_dic_list, window_count = self._ts_req_list(path, codes, fields, beginTime, endTime, options,
+                                                            max_code_num, window_days, trade_date_list,
+                                                            with_time=True, format_func=format_2_datetime_str)
+        func_str = 'wst(%s, %s, %s, %s, %s)' % (codes, fields, beginTime, endTime, options)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, axis=0, max_workers=max_workers,
+                                        window_count=window_count, datetime_index=True, compact=compact,
+                                        code_rows=True)
+
+    def iter_wst(self, codes, fields, beginTime, endTime, options="", max_code_num=None, max_workers=None,
+                 window_days=None, trade_date_list=None):
+        """
+        wst 的分段迭代版本，按代码分段、时间区间逐个返回 DataFrame，内存占用不随查询范围增长，参数与 wst 一致
+        """
+        path = 'wst/'
+        req_data_dic_list, _ = self._ts_req_list(path, codes, fields, beginTime, endTime, options, max_code_num,
+                                                 window_days, trade_date_list, with_time=True,
+                                                 format_func=format_2_datetime_str)
+        return self._iter_chunks(path, req_data_dic_list, self._json_2_ts_chunk_df, max_workers=max_workers)
 
-    def wsq(self, codes, fields, options="") -> pd.DataFrame:
+    def wsq(self, codes, fields, options="", max_code_num=None, max_workers=None, compact=None) -> pd.DataFrame:
         """
         获取和订阅实时行情数据
         :param codes:数据集名称
         :param fields:指标
         :param options:可选参数
+        :param max_code_num:每次请求最大代码数量，None 则使用 max_code_num_dic 中的设置
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'wsq/'
-        if isinstance(codes, list):
-            codes = ','.join(codes)
         if isinstance(fields, list):
             fields = ','.join(fields)
-        req_data_dic = {"codes": codes, "fields": fields, "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        req_data_dic_list = [{"codes": sub_codes, "fields": fields, "options": options}
+                             for sub_codes in self._split_codes(codes, self._get_max_code_num(path, max_code_num))]
+        func_str = 'wsq(%s, %s, %s)' % (codes, fields, options)
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, axis=0, max_workers=max_workers,
+                                        compact=compact)
 
     def tdaysoffset(self, offset, beginTime, options="") -> dict:
         """
@@ -172,14 +358,15 @@ class WindRestInvoker:
         :param options:可选参数
         :return:
         """
+        if self.calendar is not None and options == "":
+            # 通过本地交易日历计算，不再请求服务器
+            ret_date = self.calendar.offset(beginTime, offset)
+            return None if ret_date is None else format_2_date_str(ret_date)
         path = 'tdaysoffset/'
         req_data_dic = {"offset": offset,
                         "beginTime": format_2_date_str(beginTime),
                         "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        date_str = json_dic['Date']
-        return date_str
+        return self._invoke(path, req_data_dic, self._json_2_date_str)
 
     def tdays(self, beginTime, endTime, options="") -> dict:
         """
@@ -193,31 +380,43 @@ class WindRestInvoker:
         req_data_dic = {"beginTime": format_2_date_str(beginTime),
                         "endTime": format_2_date_str(endTime),
                         "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        # df = pd.DataFrame(json_dic)
-        return json_dic
+        return self._invoke(path, req_data_dic)
 
-    def edb(self, codes, beginTime, endTime, options) -> pd.DataFrame:
+    def edb(self, codes, beginTime, endTime, options, max_code_num=None, max_workers=None,
+            compact=None) -> pd.DataFrame:
         """
         获取EDB序列
         :param codes:数据集名称
         :param beginTime:开始时间
         :param endTime:结束时间
         :param options:可选参数
+        :param max_code_num:每次请求最大代码数量，None 则使用 max_code_num_dic 中的设置
+        :param max_workers:分段并发请求数，None 则使用默认值
+        :param compact:是否压缩内存占用（数值类型降级、重复字符串转为 category），None 则使用 invoker 的设置
         :return:
         """
         path = 'edb/'
-        if isinstance(codes, list):
-            codes = ','.join(codes)
-        req_data_dic = {"codes": codes,
-                        "beginTime": format_2_date_str(beginTime),
-                        "endTime": format_2_date_str(endTime),
-                        "options": options}
-        req_data = json.dumps(req_data_dic)
-        json_dic = self.public_post(path, req_data)
-        df = pd.DataFrame(json_dic).T
-        return df
+        req_data_dic_list = [{"codes": sub_codes,
+                              "beginTime": format_2_date_str(beginTime),
+                              "endTime": format_2_date_str(endTime),
+                              "options": options}
+                             for sub_codes in self._split_codes(codes, self._get_max_code_num(path, max_code_num))]
+        func_str = 'edb(%s, %s, %s, %s)' % (codes, beginTime, endTime, options)
+        # index 为日期，columns 为指标代码
+        return self._invoke_code_chunks(path, req_data_dic_list, func_str, axis=1, max_workers=max_workers,
+                                        datetime_index=True, compact=compact)
+
+    def iter_edb(self, codes, beginTime, endTime, options, max_code_num=None, max_workers=None):
+        """
+        edb 的分段迭代版本，按代码分段逐个返回 DataFrame，参数与 edb 一致
+        """
+        path = 'edb/'
+        req_data_dic_list = [{"codes": sub_codes,
+                              "beginTime": format_2_date_str(beginTime),
+                              "endTime": format_2_date_str(endTime),
+                              "options": options}
+                             for sub_codes in self._split_codes(codes, self._get_max_code_num(path, max_code_num))]
+        return self._iter_chunks(path, req_data_dic_list, self._json_2_ts_chunk_df, max_workers=max_workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,282 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/12 9:40
+@File    : batch.py
+@contact : mmmaaaggg@163.com
+@desc    : 批量查询，一次提交多个不同接口的查询，并发执行后按调用方指定的 id 返回结果
+执行前先对查询进行规划：参数完全相同的查询只执行一次；wss、edb 除代码外其他参数相同的查询合并为一次查询，
+结果按各自的代码拆分，合并查询的结果缺少部分代码（某一分段请求失败）时，相关查询逐个重新执行。各查询的错误单独记录，不影响其他查询
+"""
+import json
+import asyncio
+import inspect
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from direstinvoker.base import copy_ret
+
+logger = logging.getLogger(__name__)
+# 可合并的接口：接口名称 -> 结果中代码所在的轴，0 为 index，1 为 columns
+MERGEABLE_AXIS_DIC = {
+    'wss': 0,
+    'edb': 1,
+}
+# 默认并发查询数
+DEFAULT_MAX_WORKERS = 4
+
+
+def _code_list(codes) -> list:
+    return codes.split(',') if isinstance(codes, str) else list(codes)
+
+
+class MissingCodeError(Exception):
+    """
+    查询结果中缺少部分代码（分段请求中某一段失败）
+    """
+
+    def __init__(self, code_list):
+        super().__init__('结果中缺少代码 %s' % ','.join(code_list))
+        self.code_list = code_list
+
+
+def _relabel_single_code(data_df, code_list, axis):
+    """
+    单一代码时 wind 返回的 edb 等结果列名为指标名称（例如 CLOSE）而不是代码，改为代码，与多代码结果的格式一致
+    """
+    if data_df is None or axis != 1 or len(code_list) != 1 or data_df.shape[1] != 1 \
+            or code_list[0] in data_df.columns:
+        return data_df
+    return data_df.rename(columns={data_df.columns[0]: code_list[0]})
+
+
+def _missing_codes(data_df, code_list, axis) -> list:
+    labels = set() if data_df is None else set(data_df.index if axis == 0 else data_df.columns)
+    return [code for code in code_list if code not in labels]
+
+
+def _select_codes(data_df, code_list, axis):
+    """
+    从合并查询的结果中选出对应代码的部分
+    """
+    if data_df is None:
+        return None
+    labels = data_df.index if axis == 0 else data_df.columns
+    code_list = [code for code in code_list if code in labels]
+    return data_df.loc[code_list].copy() if axis == 0 else data_df[code_list].copy()
+
+
+class BatchTask:
+    """
+    规划后的一次实际查询，对应一个或多个调用方的查询
+    """
+
+    def __init__(self, method_name, kwargs, axis=None):
+        self.method_name = method_name
+        self.kwargs = kwargs
+        # 合并查询时结果中代码所在的轴，None 为非合并查询
+        self.axis = axis
+        # [(query_id, kwargs, code_list)]
+        self.query_list = []
+
+    def __repr__(self):
+        return '%s(%s) [%s]' % (self.method_name, self.kwargs, ', '.join(str(item[0]) for item in self.query_list))
+
+
+class BatchQuery:
+    """
+    批量查询，例如：
+    batch = invoker.batch()
+    batch.add('pe', 'wss', code_list, 'pe_ttm', 'tradeDate=20180910')
+    batch.add('close', 'wsd', '600000.SH', 'close', '2018-01-01', '2018-09-10')
+    ret_dic = batch.run()
+    """
+
+    def __init__(self, invoker, max_workers=None, merge=True):
+        """
+        :param invoker: WindRestInvoker、IFinDInvoker 或其异步版本
+        :param max_workers: 并发查询数，None 则为 DEFAULT_MAX_WORKERS，各查询的分段请求另外按 invoker 的设置并发，
+        请求频率受 invoker 的 rate_limiter 限制
+        :param merge: 是否合并除代码外其他参数相同的 wss、edb 查询
+        """
+        self.invoker = invoker
+        self.max_workers = DEFAULT_MAX_WORKERS if max_workers is None else max_workers
+        self.merge = merge
+        self._query_dic = OrderedDict()
+        self.error_dic = OrderedDict()
+
+    def __len__(self):
+        return len(self._query_dic)
+
+    def add(self, query_id, method_name, *args, **kwargs):
+        """
+        添加查询
+        :param query_id: 调用方指定的 id，用于获取结果
+        :param method_name: invoker 的接口方法名称，例如 'wss'、'wsd'、'THS_DateSerial'
+        :param args: 接口方法参数
+        :param kwargs: 接口方法参数
+        :return: self，可链式调用
+        """
+        if query_id in self._query_dic:
+            raise ValueError('重复的查询 id %s' % query_id)
+        method = getattr(self.invoker, method_name, None)
+        if method_name.startswith('_') or not callable(method):
+            raise ValueError('%s 没有接口 %s' % (self.invoker.__class__.__name__, method_name))
+        # 统一转换为关键字参数，便于去重、合并
+        bound_args = inspect.signature(method).bind(*args, **kwargs)
+        bound_args.apply_defaults()
+        self._query_dic[query_id] = (method_name, dict(bound_args.arguments))
+        return self
+
+    def plan(self) -> list:
+        """
+        规划实际执行的查询：参数相同的查询去重，可合并的查询合并代码
+        :return: BatchTask 列表
+        """
+        task_dic = OrderedDict()
+        for query_id, (method_name, kwargs) in self._query_dic.items():
+            axis = MERGEABLE_AXIS_DIC.get(method_name, None) if self.merge else None
+            if axis is not None and 'codes' in kwargs:
+                other_dic = {key: val for key, val in kwargs.items() if key != 'codes'}
+                key = (method_name, json.dumps(other_dic, sort_keys=True, default=str), 'merge')
+                code_list = _code_list(kwargs['codes'])
+            else:
+                key = (method_name, json.dumps(kwargs, sort_keys=True, default=str))
+                code_list = None
+            task = task_dic.get(key, None)
+            if task is None:
+                task = task_dic[key] = BatchTask(method_name, kwargs, axis if code_list is not None else None)
+            task.query_list.append((query_id, kwargs, code_list))
+
+        task_list = list(task_dic.values())
+        for task in task_list:
+            if task.axis is None:
+                continue
+            if len(task.query_list) == 1:
+                # 只有一个查询时不需要拆分结果
+                task.axis = None
+                continue
+            merged_code_list = list(OrderedDict.fromkeys(
+                code for _, _, code_list in task.query_list for code in code_list))
+            task.kwargs = dict(task.kwargs, codes=merged_code_list)
+        return task_list
+
+    def _dispatch(self, task: BatchTask, ret_data, ret_dic: dict) -> list:
+        """
+        将实际查询的结果分配给对应的各个查询
+        :return: 合并查询的结果中缺少代码、需要逐个重新执行的查询 [(query_id, kwargs, code_list)]
+        """
+        rerun_list = []
+        if task.axis is not None:
+            ret_data = _relabel_single_code(ret_data, task.kwargs['codes'], task.axis)
+        for num, (query_id, kwargs, code_list) in enumerate(task.query_list):
+            if task.axis is not None:
+                if len(_missing_codes(ret_data, code_list, task.axis)) > 0:
+                    rerun_list.append((query_id, kwargs, code_list))
+                    continue
+                ret_dic[query_id] = _select_codes(ret_data, code_list, task.axis)
+            else:
+                # 去重后共用同一结果的查询各自获得副本
+                ret_dic[query_id] = ret_data if num == 0 else copy_ret(ret_data)
+        if len(rerun_list) > 0:
+            logger.warning('合并查询 %s 的结果缺少部分代码，逐个重新执行 %s', task, [item[0] for item in rerun_list])
+        return rerun_list
+
+    def _check_codes(self, task: BatchTask, query_id, code_list, ret_data):
+        """
+        逐个重新执行的查询仍缺少代码时记录错误，结果保留已返回的部分
+        :return: 结果，单一代码的结果列名改为代码
+        """
+        ret_data = _relabel_single_code(ret_data, code_list, task.axis)
+        missing_list = _missing_codes(ret_data, code_list, task.axis)
+        if len(missing_list) > 0:
+            logger.error('查询 %s %s 缺少代码 %s', query_id, task.method_name, missing_list)
+            self.error_dic[query_id] = MissingCodeError(missing_list)
+        return ret_data
+
+    def _run_task(self, task: BatchTask, ret_dic: dict):
+        method = getattr(self.invoker, task.method_name)
+        try:
+            ret_data = method(**task.kwargs)
+        except Exception as exp:
+            if task.axis is None:
+                self._set_error(task, exp, ret_dic)
+                return
+            # 合并查询失败时逐个执行，避免个别代码的错误影响其他查询
+            logger.warning('合并查询 %s 失败，逐个重新执行：%s', task, exp)
+            rerun_list = task.query_list
+        else:
+            rerun_list = self._dispatch(task, ret_data, ret_dic)
+        for query_id, kwargs, code_list in rerun_list:
+            try:
+                ret_dic[query_id] = method(**kwargs)
+            except Exception as sub_exp:
+                self._set_error(BatchTask(task.method_name, kwargs), sub_exp, ret_dic, query_id)
+                continue
+            ret_dic[query_id] = self._check_codes(task, query_id, code_list, ret_dic[query_id])
+
+    def _set_error(self, task: BatchTask, exp, ret_dic: dict, query_id=None):
+        query_id_list = [item[0] for item in task.query_list] if query_id is None else [query_id]
+        logger.error('查询 %s(%s) 失败：%s', task.method_name, task.kwargs, exp)
+        for query_id in query_id_list:
+            ret_dic[query_id] = None
+            self.error_dic[query_id] = exp
+
+    def _prepare(self):
+        self.error_dic = OrderedDict()
+        task_list = self.plan()
+        logger.debug('批量查询 %d 个查询，规划后实际执行 %d 个查询', len(self._query_dic), len(task_list))
+        return task_list
+
+    def _sort_ret(self, ret_dic) -> OrderedDict:
+        return OrderedDict((query_id, ret_dic.get(query_id, None)) for query_id in self._query_dic)
+
+    def run(self) -> OrderedDict:
+        """
+        并发执行全部查询
+        :return: {query_id: 结果}，按添加顺序排列，失败的查询结果为 None，异常记录在 error_dic 中；
+        结果缺少部分代码的查询保留已返回的部分，error_dic 中记录 MissingCodeError
+        """
+        task_list = self._prepare()
+        ret_dic = {}
+        if self.max_workers <= 1 or len(task_list) <= 1:
+            for task in task_list:
+                self._run_task(task, ret_dic)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(task_list))) as executor:
+                for future in [executor.submit(self._run_task, task, ret_dic) for task in task_list]:
+                    future.result()
+        return self._sort_ret(ret_dic)
+
+    async def _run_task_async(self, task: BatchTask, ret_dic: dict, semaphore: asyncio.Semaphore):
+        method = getattr(self.invoker, task.method_name)
+        async with semaphore:
+            try:
+                ret_data = await method(**task.kwargs)
+            except Exception as exp:
+                if task.axis is None:
+                    self._set_error(task, exp, ret_dic)
+                    return
+                logger.warning('合并查询 %s 失败，逐个重新执行：%s', task, exp)
+                rerun_list = task.query_list
+            else:
+                rerun_list = self._dispatch(task, ret_data, ret_dic)
+            for query_id, kwargs, code_list in rerun_list:
+                try:
+                    ret_dic[query_id] = await method(**kwargs)
+                except Exception as sub_exp:
+                    self._set_error(BatchTask(task.method_name, kwargs), sub_exp, ret_dic, query_id)
+                    continue
+                ret_dic[query_id] = self._check_codes(task, query_id, code_list, ret_dic[query_id])
+
+    async def run_async(self) -> OrderedDict:
+        """
+        异步版本的 invoker（AsyncWindRestInvoker、AsyncIFinDInvoker）通过 await batch.run_async() 执行
+        :return: 同 run
+        """
+        task_list = self._prepare()
+        ret_dic = {}
+        semaphore = asyncio.Semaphore(max(self.max_workers, 1))
+        await asyncio.gather(*[self._run_task_async(task, ret_dic, semaphore) for task in task_list])
+        return self._sort_ret(ret_dic)
@@ -0,0 +1,235 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/17 14:20
+@File    : benchmark.py
+@contact : mmmaaaggg@163.com
+@desc    : 基于本地模拟服务的性能测试，按接口、代码数量、日期跨度、并发数组合测试吞吐量、耗时分位数及内存峰值，
+结果保存为 json 文件，便于在各版本之间对比
+python -m direstinvoker.utils.benchmark --output benchmark.json
+python -m direstinvoker.utils.benchmark --methods wsd,THS_HistoryQuotes --codes 10,100 --workers 1,8 --latency 0.05
+"""
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import itertools
+import tracemalloc
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from direstinvoker.iwind import WindRestInvoker
+from direstinvoker.ifind import IFinDInvoker
+from direstinvoker.utils.mock_server import MockDIRestServer
+from direstinvoker.utils.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+# 查询截止日期固定，保证各次测试的数据量一致
+END_DATE = datetime(2018, 12, 31)
+# 接口 -> (invoker 类型, 默认日期跨度列表)，日期跨度为 None 表示截面数据
+METHOD_DIC = {
+    'wss': ('wind', [None]),
+    'wsd': ('wind', [30, 365]),
+    'wsi': ('wind', [1, 5]),
+    'edb': ('wind', [365]),
+    'THS_DateSerial': ('ifind', [30, 365]),
+    'THS_HistoryQuotes': ('ifind', [30, 365]),
+    'THS_HighFrequenceSequence': ('ifind', [1, 5]),
+}
+
+
+def _code_list(code_count) -> list:
+    return ['%06d.SH' % (600000 + num) for num in range(code_count)]
+
+
+def make_call(invoker, method, code_count, days, max_workers, max_code_num):
+    """
+    生成测试调用
+    :return: 无参数函数
+    """
+    code_list = _code_list(code_count)
+    end_dt = END_DATE
+    begin_dt = end_dt - timedelta(days=days - 1) if days is not None else None
+    if method == 'wss':
+        return lambda: invoker.wss(code_list, 'open,high,low,close,volume,trade_status', 'tradeDate=20181228',
+                                   max_code_num=max_code_num, max_workers=max_workers)
+    elif method == 'wsd':
+        fields = 'close' if code_count > 1 else 'open,high,low,close,volume'
+        return lambda: invoker.wsd(code_list, fields, begin_dt.date(), end_dt.date(),
+                                   max_code_num=max_code_num, max_workers=max_workers)
+    elif method == 'wsi':
+        return lambda: invoker.wsi(code_list, 'open,close,volume', begin_dt.replace(hour=9),
+                                   end_dt.replace(hour=15), max_code_num=max_code_num, max_workers=max_workers,
+                                   window_days=1)
+    elif method == 'edb':
+        return lambda: invoker.edb(code_list, begin_dt.date(), end_dt.date(), '',
+                                   max_code_num=max_code_num, max_workers=max_workers)
+    elif method == 'THS_DateSerial':
+        return lambda: invoker.THS_DateSerial(code_list, 'ths_close_price_stock;ths_vol_stock', ';', '',
+                                              begin_dt.date(), end_dt.date(),
+                                              max_code_num=max_code_num, max_workers=max_workers)
+    elif method == 'THS_HistoryQuotes':
+        return lambda: invoker.THS_HistoryQuotes(code_list, 'open;high;low;close;volume', '',
+                                                 begin_dt.date(), end_dt.date(),
+                                                 max_code_num=max_code_num, max_workers=max_workers)
+    elif method == 'THS_HighFrequenceSequence':
+        return lambda: invoker.THS_HighFrequenceSequence(
+            code_list, 'open;close;volume', '', begin_dt.strftime('%Y-%m-%d 09:30:00'),
+            end_dt.strftime('%Y-%m-%d 15:00:00'), max_code_num=max_code_num, max_workers=max_workers,
+            window_days=1)
+    raise ValueError('不支持的接口 %s' % method)
+
+
+def _percentile(value_list, q):
+    return float(np.percentile(value_list, q)) if len(value_list) > 0 else None
+
+
+def run_case(server: MockDIRestServer, method, code_count, days, max_workers, repeat=3, max_code_num=10) -> dict:
+    """
+    测试一种组合
+    :param server: 已启动的模拟服务
+    :param method: 接口名称
+    :param code_count: 代码数量
+    :param days: 日期跨度（自然日），截面数据为 None
+    :param max_workers: 分段并发数
+    :param repeat: 重复调用次数
+    :param max_code_num: 每次请求最大代码数量
+    :return:
+    """
+    kind = METHOD_DIC[method][0]
+    invoker_class, url_str = (WindRestInvoker, server.wind_url) if kind == 'wind' \
+        else (IFinDInvoker, server.ifind_url)
+    ret_dic = {'method': method, 'code_count': code_count, 'days': days, 'max_workers': max_workers,
+               'max_code_num': max_code_num, 'repeat': repeat}
+    with invoker_class(url_str, max_workers=max_workers, single_flight=False,
+                       retry_policy=RetryPolicy(max_retries=0)) as invoker:
+        func = make_call(invoker, method, code_count, days, max_workers, max_code_num)
+        try:
+            # 预热：建立连接
+            data_df = func()
+            request_count = server.get_stats()['request_count']
+            elapsed_list = []
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                data_df = func()
+                elapsed_list.append(time.perf_counter() - start_time)
+            request_count = (server.get_stats()['request_count'] - request_count) / repeat
+            # 单独调用一次统计内存峰值，避免 tracemalloc 影响耗时
+            del data_df
+            gc.collect()
+            tracemalloc.start()
+            data_df = func()
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        except Exception as exp:
+            logger.exception('%s 测试失败', ret_dic)
+            ret_dic['error'] = '%s: %s' % (exp.__class__.__name__, exp)
+            return ret_dic
+
+    total_time = sum(elapsed_list)
+    row_count = 0 if data_df is None else int(data_df.shape[0])
+    cell_count = 0 if data_df is None else int(data_df.size)
+    ret_dic.update({
+        'rows': row_count,
+        'cells': cell_count,
+        'requests_per_call': request_count,
+        'latency_min': min(elapsed_list),
+        'latency_mean': total_time / repeat,
+        'latency_p50': _percentile(elapsed_list, 50),
+        'latency_p90': _percentile(elapsed_list, 90),
+        'latency_p99': _percentile(elapsed_list, 99),
+        'latency_max': max(elapsed_list),
+        'calls_per_sec': repeat / total_time if total_time > 0 else None,
+        'rows_per_sec': row_count * repeat / total_time if total_time > 0 else None,
+        'cells_per_sec': cell_count * repeat / total_time if total_time > 0 else None,
+        'peak_memory_bytes': int(peak_memory),
+    })
+    return ret_dic
+
+
+def _get_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('DIRestInvoker').version
+    except Exception:
+        return None
+
+
+def run_benchmark(method_list=None, code_count_list=(1, 10, 100), days_list=None, max_workers_list=(1, 4, 16),
+                  repeat=3, max_code_num=10, server_kwargs=None) -> dict:
+    """
+    运行全部组合
+    :param method_list: 接口名称列表，None 为 METHOD_DIC 中的全部接口
+    :param code_count_list: 代码数量列表
+    :param days_list: 日期跨度列表，None 则使用 METHOD_DIC 中各接口的默认值，截面数据接口忽略该参数
+    :param max_workers_list: 并发数列表
+    :param repeat: 每种组合重复调用次数
+    :param max_code_num: 每次请求最大代码数量
+    :param server_kwargs: MockDIRestServer 参数，例如 {'latency': 0.05}
+    :return: {'meta': 测试环境信息, 'results': 各组合的测试结果}
+    """
+    method_list = list(METHOD_DIC.keys()) if method_list is None else method_list
+    server_kwargs = {} if server_kwargs is None else server_kwargs
+    result_list = []
+    with MockDIRestServer(**server_kwargs) as server:
+        for method in method_list:
+            if METHOD_DIC[method][1] == [None]:
+                method_days_list = [None]
+            else:
+                method_days_list = METHOD_DIC[method][1] if days_list is None else days_list
+            for code_count, days, max_workers in itertools.product(code_count_list, method_days_list,
+                                                                   max_workers_list):
+                ret_dic = run_case(server, method, code_count, days, max_workers, repeat=repeat,
+                                   max_code_num=max_code_num)
+                logger.info('%s', ret_dic)
+                result_list.append(ret_dic)
+    meta_dic = {
+        'version': _get_version(),
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'server': {key: val if not isinstance(val, set) else sorted(val) for key, val in server_kwargs.items()},
+    }
+    return {'meta': meta_dic, 'results': result_list}
+
+
+def _int_list(value_str) -> list:
+    return [int(item) for item in value_str.split(',') if item.strip() != '']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DIRestInvoker 性能测试')
+    parser.add_argument('--methods', default=None, help='以 "," 分隔的接口名称，默认为全部接口')
+    parser.add_argument('--codes', default='1,10,100', help='以 "," 分隔的代码数量')
+    parser.add_argument('--days', default=None, help='以 "," 分隔的日期跨度（自然日），默认使用各接口的默认值')
+    parser.add_argument('--workers', default='1,4,16', help='以 "," 分隔的并发数')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-code-num', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟服务每个请求的延迟（秒）')
+    parser.add_argument('--bandwidth', type=float, default=None, help='模拟带宽（字节/秒）')
+    parser.add_argument('--output', default=None, help='结果保存的 json 文件，默认输出到标准输出')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    ret_dic = run_benchmark(
+        method_list=None if args.methods is None else args.methods.split(','),
+        code_count_list=_int_list(args.codes),
+        days_list=None if args.days is None else _int_list(args.days),
+        max_workers_list=_int_list(args.workers),
+        repeat=args.repeat, max_code_num=args.max_code_num,
+        server_kwargs={'latency': args.latency, 'bandwidth': args.bandwidth})
+    ret_str = json.dumps(ret_dic, ensure_ascii=False, indent=2)
+    if args.output is None:
+        print(ret_str)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(ret_str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/8/27 14:20
+@File    : cache.py
+@contact : mmmaaaggg@163.com
+@desc    : 历史数据接口的本地磁盘缓存
+缓存 key 为 接口路径 + 排序后的请求 json，value 为解析后的 DataFrame，
+安装 pyarrow 时以 parquet 列式格式保存，否则以 pickle 格式保存
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import date
+import pandas as pd
+from direstinvoker.utils.fh_utils import get_folder_path, get_cache_file_path, try_2_date, PATTERN_DATE_FORMAT
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+# 请求参数中表示截止时间的字段
+END_TIME_KEY_LIST = ['endTime', 'endtime']
+# 前复权（含定点复权）数据在每次除权除息后都会改变历史价格，不能永久缓存：
+# wind options 中的 PriceAdj=F、PriceAdj=T，iFinD jsonparam 中的 CPS:2、CPS:4、CPS:6（前复权）
+PATTERN_ADJUSTED = re.compile(r'priceadj\s*=\s*[ft]\b|\bcps\s*:\s*[246]\b', re.IGNORECASE)
+
+
+class ResponseCache:
+    """
+    线程安全的本地磁盘缓存
+    截止日期早于当天且不复权（或后复权）的请求结果视为不可变数据，永久保存；
+    截止日期为当天或之后（或无截止日期）以及前复权的请求结果 ttl 秒后过期
+    缓存文件总大小超过 max_size 时，按最近访问时间淘汰
+    """
+
+    def __init__(self, cache_folder_name='cache', ttl=3600, max_size=1024 * 1024 * 1024):
+        """
+        :param cache_folder_name: 缓存目录名称，通过 fh_utils.get_cache_file_path 查找或创建
+        :param ttl: 非永久数据的有效时间（秒）
+        :param max_size: 缓存文件总大小上限（字节），None 为不限制
+        """
+        self.cache_folder_name = cache_folder_name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._total_size = None
+        self._stat_dic = {'hit': 0, 'miss': 0, 'expired': 0, 'put': 0, 'evicted': 0}
+
+    @staticmethod
+    def make_key(path: str, req_data_dic: dict) -> str:
+        req_data = json.dumps(req_data_dic, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1((path + req_data).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_adjusted(req_data_dic: dict) -> bool:
+        """
+        是否为前复权数据请求，历史数据会随除权除息改变
+        :param req_data_dic:
+        :return:
+        """
+        return any(isinstance(value, str) and PATTERN_ADJUSTED.search(value) is not None
+                   for value in req_data_dic.values())
+
+    @classmethod
+    def is_immutable(cls, req_data_dic: dict) -> bool:
+        """
+        截止日期早于当天且非前复权的请求视为不可变数据
+        :param req_data_dic:
+        :return:
+        """
+        if cls.is_adjusted(req_data_dic):
+            return False
+        for key in END_TIME_KEY_LIST:
+            if key in req_data_dic and req_data_dic[key] is not None:
+                end_time = req_data_dic[key]
+                if isinstance(end_time, int):
+                    end_time = str(end_time)
+                # ''、'-5D'、'ED-1M'、'today' 等相对日期表达式无法确定截止日期，视为可变数据
+                if isinstance(end_time, str) and PATTERN_DATE_FORMAT.match(end_time.strip()) is None:
+                    return False
+                try:
+                    end_date = try_2_date(end_time)
+                except (ValueError, TypeError):
+                    return False
+                return isinstance(end_date, date) and end_date < date.today()
+        return False
+
+    def _file_path_list(self, key):
+        return [get_cache_file_path(self.cache_folder_name, key + ext) for ext in ('.parquet', '.pkl')]
+
+    def _iter_files(self):
+        folder_path = get_folder_path(self.cache_folder_name)
+        for file_name in os.listdir(folder_path):
+            if file_name.endswith(('.parquet', '.pkl')):
+                yield os.path.join(folder_path, file_name)
+
+    def _ensure_total_size(self):
+        if self._total_size is None:
+            self._total_size = sum(os.path.getsize(file_path) for file_path in self._iter_files())
+
+    def get(self, path: str, req_data_dic: dict) -> pd.DataFrame:
+        """
+        查询缓存
+        :param path:
+        :param req_data_dic:
+        :return: 缓存的 DataFrame，未命中或已过期返回 None
+        """
+        key = self.make_key(path, req_data_dic)
+        for file_path in self._file_path_list(key):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            # 文件名后缀中不记录是否永久保存，通过请求参数判断，当天的数据日后自然转为永久数据
+            if not self.is_immutable(req_data_dic) and time.time() - stat.st_mtime > self.ttl:
+                self._remove(file_path)
+                with self._lock:
+                    self._stat_dic['expired'] += 1
+                    self._stat_dic['miss'] += 1
+                return None
+            try:
+                if file_path.endswith('.parquet'):
+                    data_df = pd.read_parquet(file_path)
+                else:
+                    data_df = pd.read_pickle(file_path)
+            except Exception:
+                logger.exception('读取缓存文件 %s 失败', file_path)
+                self._remove(file_path)
+                break
+            # 更新访问时间，用于按最近访问时间淘汰，保留修改时间用于 ttl 判断
+            os.utime(file_path, (time.time(), stat.st_mtime))
+            with self._lock:
+                self._stat_dic['hit'] += 1
+            return data_df
+
+        with self._lock:
+            self._stat_dic['miss'] += 1
+        return None
+
+    def put(self, path: str, req_data_dic: dict, data_df: pd.DataFrame):
+        """
+        保存缓存
+        :param path:
+        :param req_data_dic:
+        :param data_df:
+        :return:
+        """
+        if not isinstance(data_df, pd.DataFrame):
+            return
+        key = self.make_key(path, req_data_dic)
+        parquet_path, pickle_path = self._file_path_list(key)
+        file_path = None
+        if pyarrow is not None:
+            tmp_path = parquet_path + '.%d.tmp' % threading.get_ident()
+            try:
+                data_df.to_parquet(tmp_path)
+                file_path = parquet_path
+            except Exception:
+                # 混合类型的 object 列等情况无法保存为 parquet
+                logger.debug('%s 无法保存为 parquet 格式，改用 pickle 格式', path)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        if file_path is None:
+            tmp_path = pickle_path + '.%d.tmp' % threading.get_ident()
+            data_df.to_pickle(tmp_path)
+            file_path = pickle_path
+        os.replace(tmp_path, file_path)
+        file_size = os.path.getsize(file_path)
+        with self._lock:
+            self._stat_dic['put'] += 1
+            self._ensure_total_size()
+            self._total_size += file_size
+            if self.max_size is not None and self._total_size > self.max_size:
+                self._evict()
+
+    def _remove(self, file_path):
+        try:
+            file_size = os.path.getsize(file_path)
+            os.remove(file_path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size -= file_size
+
+    def _evict(self):
+        """
+        按最近访问时间淘汰，直到总大小不超过 max_size 的 90%，调用前需已获得锁
+        :return:
+        """
+        file_stat_list = []
+        for file_path in self._iter_files():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            file_stat_list.append((max(stat.st_atime, stat.st_mtime), stat.st_size, file_path))
+        file_stat_list.sort()
+        self._total_size = sum(file_size for _, file_size, _ in file_stat_list)
+        target_size = self.max_size * 0.9
+        for _, file_size, file_path in file_stat_list:
+            if self._total_size <= target_size:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            self._total_size -= file_size
+            self._stat_dic['evicted'] += 1
+
+    def clear(self):
+        with self._lock:
+            for file_path in self._iter_files():
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            self._total_size = 0
+
+    def get_stats(self) -> dict:
+        """
+        返回缓存统计信息
+        :return: hit 命中次数，miss 未命中次数，hit_ratio 命中率，expired 过期次数，put 保存次数，evicted 淘汰文件数，
+        total_size 缓存文件总大小
+        """
+        with self._lock:
+            self._ensure_total_size()
+            stat_dic = self._stat_dic.copy()
+            stat_dic['total_size'] = self._total_size
+        query_count = stat_dic['hit'] + stat_dic['miss']
+        stat_dic['hit_ratio'] = stat_dic['hit'] / query_count if query_count > 0 else None
+        return stat_dic
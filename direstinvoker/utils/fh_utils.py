@@ -18,6 +18,7 @@ import logging
 import warnings
 from functools import reduce
 import xlrd
+from direstinvoker.utils.schema import restore_categorical
 
 STR_FORMAT_DATE = '%Y-%m-%d'
 STR_FORMAT_DATETIME = '%Y-%m-%d %H:%M:%S'
@@ -31,6 +32,130 @@ def split_chunk(l: list, n: int):
         yield l[i:i + n]
 
 
+def split_time_range(time_from, time_to, window_days: int, trade_date_list=None, with_time=False) -> list:
+    """
+    将 [time_from, time_to] 时间区间按 window_days 天切分为多个区间
+    trade_date_list 不为空时，按交易日切分，每个区间包含 window_days 个交易日
+    :param time_from: 起始时间
+    :param time_to: 截止时间
+    :param window_days: 每个区间的天数（交易日数）
+    :param trade_date_list: 交易日列表，可以为空
+    :param with_time: True 返回 'YYYY-MM-DD HH:MM:SS' 格式时间，区间首尾相接：每个区间的截止时间即下一区间的起始时间
+    （下一区间首日 00:00:00），非交易日的夜盘等数据不会遗漏，边界时间的重复数据由 merge_time_window_df 去除，
+    首个区间起始时间、末个区间截止时间保留原始时间；
+    False 返回 'YYYY-MM-DD' 格式日期，各区间互不重叠
+    :return: [(time_from_str, time_to_str), ...]
+    """
+    dt_from, dt_to = pd.to_datetime(time_from), pd.to_datetime(time_to)
+    date_from, date_to = dt_from.date(), dt_to.date()
+    if trade_date_list is not None:
+        day_list = sorted({try_2_date(day) for day in trade_date_list})
+        day_list = [day for day in day_list if date_from <= day <= date_to]
+    else:
+        day_list = [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+
+    range_list = [[sub_list[0], sub_list[-1]] for sub_list in split_chunk(day_list, window_days)]
+    if len(range_list) == 0:
+        range_list = [[date_from, date_to]]
+    # 首尾区间覆盖原始时间范围（起止日期可能为非交易日）
+    range_list[0][0], range_list[-1][1] = date_from, date_to
+    if with_time:
+        begin_list = [datetime_2_str(date2datetime(day_from)) for day_from, _ in range_list]
+        begin_list[0] = datetime_2_str(dt_from.to_pydatetime())
+        time_range_list = list(zip(begin_list, begin_list[1:] + [datetime_2_str(dt_to.to_pydatetime())]))
+    else:
+        time_range_list = [(date_2_str(day_from), date_2_str(day_to)) for day_from, day_to in range_list]
+    return time_range_list
+
+
+def _window_key(df, time_col, code_col) -> pd.Index:
+    """
+    时间区间分段合并时用于判断重复数据的 key：时间（time_col 不存在时为 index），存在 code_col 时加上代码
+    """
+    time_values = df[time_col].values if time_col is not None and time_col in df.columns else df.index.values
+    if code_col is not None and code_col in df.columns:
+        return pd.MultiIndex.from_arrays([time_values, df[code_col].values])
+    return pd.Index(time_values)
+
+
+def merge_time_window_df(df_list, time_col=None, code_col=None) -> pd.DataFrame:
+    """
+    合并按时间区间分段查询的结果，去除区间边界处的重复数据，并按时间排序
+    仅比较相邻两个区间的边界数据：后一区间中时间不晚于前一区间最后时间、且 (时间, 代码) 已在前一区间出现的行视为重复，
+    区间内部相同的数据（例如同一时间的多笔成交）全部保留
+    :param df_list: 各时间区间对应的 DataFrame，可以包含 None
+    :param time_col: 时间字段名称，None 或该字段不存在时使用 index
+    :param code_col: 代码字段名称，None 或该字段不存在时仅按时间判断重复
+    :return:
+    """
+    df_list = [df for df in df_list if df is not None]
+    if len(df_list) == 0:
+        return None
+    if len(df_list) == 1:
+        return df_list[0]
+    merged_list = [df_list[0]]
+    for prev_df, data_df in zip(df_list[:-1], df_list[1:]):
+        if prev_df.shape[0] > 0 and data_df.shape[0] > 0:
+            prev_key, cur_key = _window_key(prev_df, time_col, code_col), _window_key(data_df, time_col, code_col)
+            prev_time, cur_time = prev_key.get_level_values(0), cur_key.get_level_values(0)
+            prev_edge_key = prev_key[prev_time >= cur_time.min()]
+            is_dup = (cur_time <= prev_time.max()) & cur_key.isin(prev_edge_key)
+            if is_dup.any():
+                data_df = data_df[~is_dup]
+        merged_list.append(data_df)
+    data_df = restore_categorical(pd.concat(merged_list), merged_list)
+    has_time_col = time_col is not None and time_col in data_df.columns
+    if code_col is not None and code_col in data_df.columns:
+        # 与不分段查询的结果一致：按代码首次出现的顺序，同一代码按时间排序
+        code_values = data_df[code_col].values
+        order_df = pd.DataFrame({
+            'code': pd.Index(pd.unique(code_values)).get_indexer(code_values),
+            'time': data_df[time_col].values if has_time_col else data_df.index.values})
+        data_df = data_df.iloc[order_df.sort_values(['code', 'time'], kind='mergesort').index.values]
+    elif has_time_col:
+        data_df = data_df.sort_values(time_col, kind='mergesort')
+    else:
+        data_df = data_df.sort_index(kind='mergesort')
+    if all(isinstance(df.index, pd.RangeIndex) for df in merged_list):
+        # 各区间的 index 均为默认序号时重新编号
+        data_df = data_df.reset_index(drop=True)
+    return data_df
+
+
+def extract_date_list(data) -> list:
+    """
+    从 tdays、THS_DateQuery 等接口返回的数据中提取日期列表
+    :param data: dict、list、DataFrame 或以 ',' ';' 分隔的日期字符串
+    :return: 排序后的 date 列表
+    """
+    date_set = set()
+
+    def _extract(item):
+        if isinstance(item, pd.DataFrame):
+            for value in item.values.flatten():
+                _extract(value)
+        elif isinstance(item, dict):
+            for value in item.values():
+                _extract(value)
+        elif isinstance(item, (list, tuple)):
+            for value in item:
+                _extract(value)
+        elif isinstance(item, str):
+            for date_str in re.split(r'[,;]', item):
+                date_str = date_str.strip()
+                if PATTERN_DATE_FORMAT.match(date_str) is None:
+                    continue
+                try:
+                    date_set.add(try_2_date(date_str[:10] if len(date_str) > 10 else date_str))
+                except ValueError:
+                    pass
+        elif isinstance(item, (date, datetime)):
+            date_set.add(try_2_date(item))
+
+    _extract(data)
+    return sorted(date_set)
+
+
 def zip_split(*args, sep=','):
     """
     将多个字符串，按照 sep 分割对齐，形成元祖数组
@@ -532,22 +657,22 @@ def return_risk_analysis_old(nav_df: pd.DataFrame, date_frm=None, date_to=None,
     return stat_df
 
 
-def calc_performance(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='weekly', rf=0.02, suffix_name=None):
+def _to_date_index(index) -> pd.DatetimeIndex:
     """
-    按列统计 rr_df 收益率绩效
-    :param nav_df: 收益率DataFrame，index为日期，每一列为一个产品的净值走势
-    :param date_frm: 统计日期区间，可以为空
-    :param date_to: 统计日期区间，可以为空
-    :param freq: None 自动识别, 'daily' 'weekly' 'monthly'
-    :param rf: 无风险收益率，默认 0.02
-    :return:
+    将 index 转换为日期（去掉时间部分），与逐个调用 try_2_date 的结果一致
     """
-    nav_sorted_df = nav_df.copy()
-    nav_sorted_df.index = [try_2_date(idx) for idx in nav_sorted_df.index]
-    nav_sorted_df.sort_index(inplace=True)
-    # 计算数据实际频率是日频、周频、月頻
-    data_count = nav_sorted_df.shape[0]
-    day_per_data = (nav_sorted_df.index[data_count - 1] - nav_sorted_df.index[0]).days / data_count
+    if isinstance(index, pd.DatetimeIndex):
+        return index.normalize()
+    return pd.DatetimeIndex(pd.to_datetime([try_2_date(idx) for idx in index]))
+
+
+def _get_freq_info(date_index, freq):
+    """
+    计算数据实际频率是日频、周频、月頻，并与 freq 核对
+    :return: (freq, 每年数据数量, 频率名称)
+    """
+    data_count = date_index.shape[0]
+    day_per_data = (date_index[data_count - 1] - date_index[0]).days / data_count
     if day_per_data <= 0.008:
         freq_real = 'minute'
     elif day_per_data <= 0.2:
@@ -566,7 +691,6 @@ def calc_performance(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='we
         # logging.warning(warnings_msg)
         raise ValueError(warnings_msg)
 
-    freq_str = ''
     if freq == 'weekly':
         data_count_per_year = 50
         freq_str = '周'
@@ -584,278 +708,372 @@ def calc_performance(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='we
         freq_str = '分'
     else:
         raise ValueError('freq=%s 只接受 daily weekly monthly 三种之一', freq)
+    return freq, data_count_per_year, freq_str
+
+
+def _last_valid_row(valid_arr: np.ndarray) -> np.ndarray:
+    """
+    每个单元格所在列中，截至该行（含）的最后一个有效行号，没有时为 -1
+    """
+    row_arr = np.arange(valid_arr.shape[0]).reshape(-1, 1)
+    return np.maximum.accumulate(np.where(valid_arr, row_arr, -1), axis=0)
+
+
+def _shift_rows(arr: np.ndarray, fill_value) -> np.ndarray:
+    """
+    整体下移一行，首行填充 fill_value
+    """
+    shifted = np.empty_like(arr)
+    shifted[0] = fill_value
+    shifted[1:] = arr[:-1]
+    return shifted
+
+
+def _pct_change_valid(value_arr: np.ndarray, valid_arr: np.ndarray, last_valid_arr: np.ndarray,
+                      first_idx: np.ndarray) -> np.ndarray:
+    """
+    各列有效数据的收益率，与各列 dropna 后 pct_change().fillna(0) 一致：与前一个有效值比较，无效位置为 NaN
+    """
+    cols = np.arange(value_arr.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret_arr = value_arr / _shift_rows(value_arr[np.maximum(last_valid_arr, 0), cols], np.nan) - 1
+    ret_arr[np.isnan(ret_arr)] = 0
+    ret_arr[first_idx, cols] = 0
+    ret_arr[~valid_arr] = np.nan
+    return ret_arr
+
+
+def _max_new_high_gap(mdd_arr: np.ndarray, nav_arr: np.ndarray, last_idx: np.ndarray, position_arr: np.ndarray):
+    """
+    各列创新高（mdd == 0）的位置之间的最大间隔，最后一次创新高之后未再创新高时计入截至最后位置的间隔
+    :param position_arr: 各行的位置（int64 时间或序号），N x 1 或 N x K
+    :return: (最大间隔，只创新高一次时为 -1, 创新高次数)
+    """
+    cols = np.arange(mdd_arr.shape[1])
+    position_arr = np.broadcast_to(position_arr, mdd_arr.shape)
+    drop_arr = mdd_arr == 0
+    int_min = np.iinfo(np.int64).min
+    last_drop_pos_arr = _shift_rows(np.maximum.accumulate(np.where(drop_arr, position_arr, int_min), axis=0), int_min)
+    max_gap = np.where(drop_arr & (last_drop_pos_arr != int_min), position_arr - last_drop_pos_arr, -1).max(axis=0)
+    last_drop_idx = _last_valid_row(drop_arr)[-1]
+    final_gap = np.where(nav_arr[last_drop_idx, cols] > nav_arr[last_idx, cols],
+                         position_arr[last_idx, cols] - position_arr[last_drop_idx, cols], -1)
+    return np.maximum(max_gap, final_gap), drop_arr.sum(axis=0)
+
+
+def _month_ret_range(nav_arr: np.ndarray, valid_arr: np.ndarray, first_idx: np.ndarray, last_idx: np.ndarray,
+                     month_arr: np.ndarray):
+    """
+    自然月收益：首个日期、每月最后一个有效日期、最后日期的净值依次计算收益率
+    :return: (最大月收益, 最大月亏损)
+    """
+    row_count, cols = nav_arr.shape[0], np.arange(nav_arr.shape[1])
+    row_arr = np.arange(row_count).reshape(-1, 1)
+    next_valid_arr = np.minimum.accumulate(np.where(valid_arr, row_arr, row_count)[::-1], axis=0)[::-1]
+    next_valid_arr = np.vstack([next_valid_arr[1:], np.full((1, cols.shape[0]), row_count)])
+    month_end_arr = valid_arr & (next_valid_arr < row_count) & (
+        month_arr[np.minimum(next_valid_arr, row_count - 1)] != month_arr.reshape(-1, 1))
+    month_end_arr[first_idx, cols] = True
+    month_end_arr[last_idx, cols] = True
+    prev_end_idx = _shift_rows(_last_valid_row(month_end_arr), -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        month_ret_arr = np.where(month_end_arr & (prev_end_idx >= 0),
+                                 nav_arr / nav_arr[np.maximum(prev_end_idx, 0), cols] - 1, 0)
+    month_ret_arr[np.isnan(month_ret_arr)] = 0
+    return month_ret_arr.max(axis=0), month_ret_arr.min(axis=0)
+
+
+def _resample_month_last(data_df: pd.DataFrame) -> pd.DataFrame:
+    try:
+        return data_df.resample('ME', convention='end').last()
+    except ValueError:
+        # pandas 2.2 之前月末频率为 'M'
+        return data_df.resample('M', convention='end').last()
+
+
+def calc_performance(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='weekly', rf=0.02, suffix_name=None):
+    """
+    按列统计 rr_df 收益率绩效
+    全部列一次性按二维数组向量化计算，各列的有效数据区间（非 NaN 部分）分别统计，
+    近一周、一月、一年的起始位置通过 searchsorted 查找
+    :param nav_df: 收益率DataFrame，index为日期，每一列为一个产品的净值走势
+    :param date_frm: 统计日期区间，可以为空
+    :param date_to: 统计日期区间，可以为空
+    :param freq: None 自动识别, 'daily' 'weekly' 'monthly'
+    :param rf: 无风险收益率，默认 0.02
+    :return:
+    """
+    nav_sorted_df = nav_df.copy()
+    nav_sorted_df.index = _to_date_index(nav_sorted_df.index)
+    nav_sorted_df.sort_index(inplace=True)
+    freq, data_count_per_year, freq_str = _get_freq_info(nav_sorted_df.index, freq)
     stat_dic_dic = OrderedDict()
     if type(date_frm) is str:
         date_frm = datetime.strptime(date_frm, '%Y-%m-%d').date()
     if type(date_to) is str:
         date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
 
-    col_name_list = list(nav_sorted_df.columns)
-    # date_col_name = col_name_list[0]
-    # col_name_list = col_name_list[1:]
-    for col_name in col_name_list:
-        data_sub_df = nav_sorted_df[[col_name]].dropna()
-        if data_sub_df.shape[0] == 0:
-            continue
-        # rr_df = (1 + data_sub_df.pct_change().fillna(0)).cumprod()
-        # rr_df.index = [try_2_date(d) for d in rr_df.index]
-        # data_df = rr_df.reset_index()
-        # data_df.columns = ['Date', 'Value']
-        # 2018-07-01 不再重置索引，index为日期字段
-        data_df = _get_df_between_date_by_index(data_sub_df, date_frm, date_to)
-        data_df.columns = ['Value']
-        rr_df = data_df.Value.pct_change().fillna(0)
-        data_df.Value = (1 + rr_df).cumprod()
-        data_df['ret'] = rr_df
-        date_list = list(data_df.index)
-        date_latest = date_list[-1]
-        nav_latest = data_df.Value.loc[date_latest]
+    data_df = _get_df_between_date_by_index(
+        nav_sorted_df, None if date_frm is None else pd.Timestamp(date_frm),
+        None if date_to is None else pd.Timestamp(date_to))
+    value_arr = data_df.values.astype('float64')
+    valid_arr = ~np.isnan(value_arr)
+    # 没有数据的列不统计
+    col_idx_arr = np.nonzero(valid_arr.any(axis=0))[0]
+    if col_idx_arr.shape[0] == 0:
+        return stat_dic_dic
+    value_arr, valid_arr = value_arr[:, col_idx_arr], valid_arr[:, col_idx_arr]
+    cols = np.arange(col_idx_arr.shape[0])
+    time_arr = data_df.index.values.astype('datetime64[ns]').astype('int64')
+    day_ns = 24 * 3600 * 10 ** 9
+    last_valid_arr = _last_valid_row(valid_arr)
+    first_idx = valid_arr.argmax(axis=0)
+    last_idx = last_valid_arr[-1]
+    valid_count = valid_arr.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret_arr = _pct_change_valid(value_arr, valid_arr, last_valid_arr, first_idx)
+        # 无效行乘以 1，各列净值与仅对有效数据 cumprod 的结果相同
+        nav_arr = np.cumprod(np.where(valid_arr, 1 + ret_arr, 1.0), axis=0)
+        nav_latest = nav_arr[last_idx, cols]
+
         # 计算 近7天，近30天，近365天收益率
-        date_week_ago = date_latest - timedelta(days=7)
-        date_month_ago = date_latest - timedelta(days=30)
-        date_year_ago = date_latest - timedelta(days=365)
-        date_week_ago = get_last(date_list, lambda x: x <= date_week_ago)
-        date_month_ago = get_last(date_list, lambda x: x <= date_month_ago)
-        date_year_ago = get_last(date_list, lambda x: x <= date_year_ago)
-        rr_week = (nav_latest / data_df.Value.loc[date_week_ago] - 1) if date_week_ago is not None else None
-        rr_month = (nav_latest / data_df.Value.loc[date_month_ago] - 1) if date_month_ago is not None else None
-        rr_year = (nav_latest / data_df.Value.loc[date_year_ago] - 1) if date_year_ago is not None else None
+        def calc_rr_ago(days):
+            pos_arr = np.searchsorted(time_arr, time_arr[last_idx] - days * day_ns, side='right') - 1
+            ago_idx = np.where(pos_arr >= 0, last_valid_arr[np.maximum(pos_arr, 0), cols], -1)
+            return np.where(ago_idx >= 0, nav_latest / nav_arr[np.maximum(ago_idx, 0), cols] - 1, np.nan), ago_idx
+
+        rr_week, week_idx = calc_rr_ago(7)
+        rr_month, month_idx = calc_rr_ago(30)
+        rr_year, year_idx = calc_rr_ago(365)
 
         # 计算时间跨度
-        date_span = date_list[-1] - date_list[0]
-        date_span_fraction = 365 / date_span.days if date_span.days > 0 else 1
+        date_span_days = (time_arr[last_idx] - time_arr[first_idx]) // day_ns
+        date_span_fraction = np.where(date_span_days > 0, 365 / np.maximum(date_span_days, 1), 1)
         # basic indicators
-        CAGR = data_df.Value[date_latest] ** date_span_fraction - 1
-        # 相当于余额宝倍数
-        times_yeb = (CAGR - 1) / 0.03
-        rr_tot = data_df.Value[date_latest] - 1
-        ann_vol = np.std(data_df.ret, ddof=1) * np.sqrt(data_count_per_year)
-        down_side_vol = np.std(data_df.ret[data_df.ret < 0], ddof=1) * np.sqrt(data_count_per_year)
-        # WeeksNum = data.shape[0]
-        profit_loss_ratio = -np.mean(data_df.ret[data_df.ret > 0]) / np.mean(data_df.ret[data_df.ret < 0])
-        win_ratio = len(data_df.ret[data_df.ret >= 0]) / len(data_df.ret)
-        min_value = min(data_df.Value)
-        final_value = data_df.Value[data_df.index[-1]]
-        max_ret = max(data_df.ret)
-        min_ret = min(data_df.ret)
+        CAGR = nav_latest ** date_span_fraction - 1
+        rr_tot = nav_latest - 1
+        ret_df = pd.DataFrame(ret_arr)
+        ann_vol = ret_df.std(ddof=1).values * np.sqrt(data_count_per_year)
+        down_side_vol = ret_df[ret_df < 0].std(ddof=1).values * np.sqrt(data_count_per_year)
+        profit_loss_ratio = -ret_df[ret_df > 0].mean().values / ret_df[ret_df < 0].mean().values
+        win_ratio = (ret_arr >= 0).sum(axis=0) / valid_count
+        nav_valid_arr = np.where(valid_arr, nav_arr, np.nan)
+        min_value = np.nanmin(nav_valid_arr, axis=0)
+        max_ret = np.nanmax(ret_arr, axis=0)
+        min_ret = np.nanmin(ret_arr, axis=0)
         # End of basic indicators
         # max dropdown related
-        data_df['mdd'] = data_df.Value / data_df.Value.cummax() - 1
-        mdd_size = min(data_df.mdd)
-        droparray = pd.Series(data_df.index[data_df.mdd == 0])
-        if len(droparray) == 1:
-            mdd_max_period = len(data_df.mdd)
-        else:
-            if float(data_df.Value[droparray.tail(1)]) > float(data_df.Value.tail(1)):
-                droparray = droparray.append(pd.Series(data_df.index[-1]))  # , ignore_index=True
-            mdd_max_period = max(droparray.diff().dropna()).days - 1
+        mdd_arr = nav_valid_arr / np.maximum.accumulate(nav_arr, axis=0) - 1
+        mdd_size = np.nanmin(mdd_arr, axis=0)
+        # 创新高的日期之间的最大间隔（天）
+        max_gap, drop_count = _max_new_high_gap(mdd_arr, nav_arr, last_idx, time_arr.reshape(-1, 1))
+        mdd_max_period = np.where(drop_count == 1, valid_count, max_gap // day_ns - 1)
         # End of max dropdown related
         # High level indicators
         sharpe_ratio = (CAGR - rf) / ann_vol
         sortino_ratio = (CAGR - rf) / down_side_vol
         calmar_ratio = CAGR / (-mdd_size)
         #  Natural month return
-        j = 1
-        for i, (date_4_df_idx, item) in enumerate(data_df.T.items()):
-            if i == 0:
-                month_ret = pd.DataFrame([[date_4_df_idx, item.Value]], columns=('Date', 'Value'))
-            else:
-                date_last_4_last = data_df.index[i - 1]
-                if date_4_df_idx.month != date_last_4_last.month:
-                    month_ret.loc[j] = [date_last_4_last, data_df.Value[date_last_4_last]]
-                    j += 1
-
-        month_ret.loc[j] = [date_latest, nav_latest]
-        month_ret['ret'] = month_ret.Value.pct_change().fillna(0)
-        max_rr_month = max(month_ret.ret)
-        min_rr_month = min(month_ret.ret)
+        max_rr_month, min_rr_month = _month_ret_range(nav_arr, valid_arr, first_idx, last_idx,
+                                                      data_df.index.month.values)
         # End of Natural month return
-        date_begin = date_list[0]  # .date()
-        date_end = date_list[-1]
+
+    for num, col_idx in enumerate(col_idx_arr):
+        col_name = data_df.columns[col_idx]
+        date_begin = data_df.index[first_idx[num]].date()
+        date_end = data_df.index[last_idx[num]].date()
         stat_dic = OrderedDict([('date_begen', date_begin),
                                 ('date_end', date_end),
-                                ('rr_tot', rr_tot),
-                                ('rr_week', rr_week),
-                                ('rr_month', rr_month),
-                                ('rr_year', rr_year),
-                                ('final_value', final_value),
-                                ('min_value', min_value),
-                                ('CAGR', CAGR),
-                                ('ann_vol', ann_vol),
-                                ('down_side_vol', down_side_vol),
-                                ('mdd', mdd_size),
-                                ('sharpe_ratio', sharpe_ratio),
-                                ('sortino_ratio', sortino_ratio),
-                                ('calmar_ratio', calmar_ratio),
-                                ('profit_loss_ratio', profit_loss_ratio),  # 盈亏比
-                                ('win_ratio', '%.2f' % win_ratio),  # 胜率
-                                ('mdd_max_period', mdd_max_period),  # 最长不创新高周期数
+                                ('rr_tot', rr_tot[num]),
+                                ('rr_week', rr_week[num] if week_idx[num] >= 0 else None),
+                                ('rr_month', rr_month[num] if month_idx[num] >= 0 else None),
+                                ('rr_year', rr_year[num] if year_idx[num] >= 0 else None),
+                                ('final_value', nav_latest[num]),
+                                ('min_value', min_value[num]),
+                                ('CAGR', CAGR[num]),
+                                ('ann_vol', ann_vol[num]),
+                                ('down_side_vol', down_side_vol[num]),
+                                ('mdd', mdd_size[num]),
+                                ('sharpe_ratio', sharpe_ratio[num]),
+                                ('sortino_ratio', sortino_ratio[num]),
+                                ('calmar_ratio', calmar_ratio[num]),
+                                ('profit_loss_ratio', profit_loss_ratio[num]),  # 盈亏比
+                                ('win_ratio', '%.2f' % win_ratio[num]),  # 胜率
+                                ('mdd_max_period', int(mdd_max_period[num])),  # 最长不创新高周期数
                                 ('freq', freq_str),  # 周期类型
-                                ('max_ret', max_ret),  # 统计周期最大收益
-                                ('min_ret', min_ret),  # 统计周期最大亏损
-                                ('max_rr_month', max_rr_month),  # 最大月收益
-                                ('min_rr_month', min_rr_month),  # 最大月亏损
+                                ('max_ret', max_ret[num]),  # 统计周期最大收益
+                                ('min_ret', min_ret[num]),  # 统计周期最大亏损
+                                ('max_rr_month', max_rr_month[num]),  # 最大月收益
+                                ('min_rr_month', min_rr_month[num]),  # 最大月亏损
                                 ])
         stat_dic_dic[col_name if suffix_name is None else col_name + "_" + suffix_name] = stat_dic
 
     return stat_dic_dic
 
 
-def return_risk_analysis(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='weekly', rf=0.02, suffix_name=None):
+# return_risk_analysis 统计项：(数值结果的列名, 格式化结果的名称, 格式, 倍数)，格式为 None 时不格式化
+RETURN_RISK_FORMAT_LIST = [
+    ('date_begin', '起始日期', None, 1),
+    ('date_end', '截止日期', None, 1),
+    ('rr_tot', '区间收益率', '%.2f%%', 100),
+    ('final_value', '最终净值', '%.4f', 1),
+    ('min_value', '最低净值', '%.4f', 1),
+    ('CAGR', '年化收益率', '%.2f%%', 100),
+    ('ann_vol', '年化波动率', '%.2f%%', 100),
+    ('down_side_vol', '年化下行波动率', '%.2f%%', 100),
+    ('mdd', '最大回撤', '%.2f%%', 100),
+    ('sharpe_ratio', '夏普率', '%.2f', 1),
+    ('sortino_ratio', '索提诺比率', '%.2f', 1),
+    ('calmar_ratio', '卡马比率', '%.2f', 1),
+    ('profit_loss_ratio', '盈亏比', '%.2f', 1),
+    ('win_ratio', '胜率', '%.2f', 1),
+    ('mdd_max_period', '最长不创新高（%s）', None, 1),
+    ('max_ret', '统计周期最大收益', '%.2f%%', 100),
+    ('min_ret', '统计周期最大亏损', '%.2f%%', 100),
+    ('max_rr_month', '最大月收益', '%.2f%%', 100),
+    ('min_rr_month', '最大月亏损', '%.2f%%', 100),
+]
+
+
+def format_return_risk_stat(stat_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    将 return_risk_analysis(..., formatted=False) 的数值结果格式化为文本报表
+    :param stat_df: 数值结果，index 为产品，columns 为统计项
+    :return: index 为统计项名称，columns 为产品
+    """
+    freq_str = stat_df['freq'].iloc[0] if stat_df.shape[0] > 0 else ''
+    stat_dic = OrderedDict()
+    for key, name, fmt, scale in RETURN_RISK_FORMAT_LIST:
+        if key == 'mdd_max_period':
+            name = name % freq_str
+        if fmt is None:
+            stat_dic[name] = list(stat_df[key])
+        else:
+            stat_dic[name] = [fmt % (value * scale) for value in stat_df[key]]
+    return pd.DataFrame(stat_dic, index=stat_df.index).T
+
+
+def return_risk_analysis(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='weekly', rf=0.02, suffix_name=None,
+                         formatted=True):
     """
     按列统计 rr_df 收益率绩效
+    全部列一次性按二维数组向量化计算，各列的有效数据区间（非 NaN 部分）分别统计
     :param nav_df: 收益率DataFrame，index为日期，每一列为一个产品的净值走势
     :param date_frm: 统计日期区间，可以为空
     :param date_to: 统计日期区间，可以为空
     :param freq: None 自动识别, 'daily' 'weekly' 'monthly'
     :param rf: 无风险收益率，默认 0.02
-    :return:
+    :param suffix_name: 产品名称后缀
+    :param formatted: True 返回格式化的文本报表及各产品的月度收益 dict；
+    False 返回数值结果（index 为产品，columns 为统计项，详见 RETURN_RISK_FORMAT_LIST），
+    及全部产品的月度收益 DataFrame（index 为月末日期，columns 为产品），可通过 format_return_risk_stat 格式化
+    :return: (stat_df, 月度收益)
     """
     nav_sorted_df = nav_df.copy()
-    nav_sorted_df.index = pd.to_datetime([try_2_date(idx) for idx in nav_sorted_df.index])
+    nav_sorted_df.index = _to_date_index(nav_sorted_df.index)
     nav_sorted_df.sort_index(inplace=True)
-    # 计算数据实际频率是日频、周频、月頻
-    data_count = nav_sorted_df.shape[0]
-    day_per_data = (nav_sorted_df.index[data_count - 1] - nav_sorted_df.index[0]).days / data_count
-    if day_per_data <= 0.008:
-        freq_real = 'minute'
-    elif day_per_data <= 0.2:
-            freq_real = 'hour'
-    elif day_per_data <= 2:
-        freq_real = 'daily'
-    elif day_per_data <= 10:
-        freq_real = 'weekly'
-    else:
-        freq_real = 'monthly'
-    if freq is None:
-        freq = freq_real
-    elif freq != freq_real:
-        warnings_msg = "data freq wrong, expect %s, but %s was detected" % (freq, freq_real)
-        # warnings.warn(warnings_msg)
-        # logging.warning(warnings_msg)
-        raise ValueError(warnings_msg)
-
-    freq_str = ''
-    if freq == 'weekly':
-        data_count_per_year = 50
-        freq_str = '周'
-    elif freq == 'monthly':
-        data_count_per_year = 12
-        freq_str = '月'
-    elif freq == 'daily':
-        data_count_per_year = 250
-        freq_str = '日'
-    elif freq == 'hour':
-        data_count_per_year = 1250
-        freq_str = '时'
-    elif freq == 'minute':
-        data_count_per_year = 75000
-        freq_str = '分'
-    else:
-        raise ValueError('freq=%s 只接受 daily weekly monthly 三种之一', freq)
-    stat_dic_dic = OrderedDict()
-    mon_rr_dic = {}
+    freq, data_count_per_year, freq_str = _get_freq_info(nav_sorted_df.index, freq)
     if type(date_frm) is str:
         date_frm = datetime.strptime(date_frm, '%Y-%m-%d').date()
     if type(date_to) is str:
         date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
 
-    col_name_list = list(nav_sorted_df.columns)
-    # date_col_name = col_name_list[0]
-    # col_name_list = col_name_list[1:]
-    for col_name in col_name_list:
-        data_sub_df = nav_sorted_df[[col_name]].dropna()
-        if data_sub_df.shape[0] == 0:
-            continue
-        rr_df = (1 + data_sub_df.pct_change().fillna(0)).cumprod()
-        # rr_df.index = [try_2_date(d) for d in rr_df.index]
-        data_df = rr_df.reset_index()
-        data_df.columns = ['Date', 'Value']
-        data_df = get_df_between_date(data_df, date_frm, date_to)
-        data_df.Value = data_df.Value / data_df.Value[0]
-        data_df['ret'] = data_df.Value.pct_change().fillna(0)
-        date_span = data_df.Date[data_df.index[-1]] - data_df.Date[data_df.index[0]]
-        date_span_fraction = 365 / date_span.days if date_span.days > 0 else 1
+    value_arr = nav_sorted_df.values.astype('float64')
+    valid_arr = ~np.isnan(value_arr)
+    # 先按全部数据计算净值，再按日期区间截取，并以区间内首个净值为 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret_arr = _pct_change_valid(value_arr, valid_arr, _last_valid_row(valid_arr), valid_arr.argmax(axis=0))
+        nav_arr = np.cumprod(np.where(valid_arr, 1 + ret_arr, 1.0), axis=0)
+    date_index = nav_sorted_df.index
+    row_mask = np.ones(date_index.shape[0], dtype=bool)
+    if date_frm is not None:
+        row_mask &= date_index >= pd.Timestamp(date_frm)
+    if date_to is not None:
+        row_mask &= date_index <= pd.Timestamp(date_to)
+    nav_arr, valid_arr, date_index = nav_arr[row_mask], valid_arr[row_mask], date_index[row_mask]
+    # 没有数据的列不统计
+    col_idx_arr = np.nonzero(valid_arr.any(axis=0))[0]
+    col_name_list = [col_name if suffix_name is None else col_name + "_" + suffix_name
+                     for col_name in nav_sorted_df.columns[col_idx_arr]]
+    if col_idx_arr.shape[0] == 0:
+        if formatted:
+            return None, {}
+        return pd.DataFrame(columns=[key for key, _, _, _ in RETURN_RISK_FORMAT_LIST] + ['freq']), pd.DataFrame()
+    nav_arr, valid_arr = nav_arr[:, col_idx_arr], valid_arr[:, col_idx_arr]
+    cols = np.arange(col_idx_arr.shape[0])
+    last_valid_arr = _last_valid_row(valid_arr)
+    first_idx = valid_arr.argmax(axis=0)
+    last_idx = last_valid_arr[-1]
+    valid_count = valid_arr.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nav_arr = nav_arr / nav_arr[first_idx, cols]
+        ret_arr = _pct_change_valid(nav_arr, valid_arr, last_valid_arr, first_idx)
+        nav_latest = nav_arr[last_idx, cols]
+        time_arr = date_index.values.astype('datetime64[ns]').astype('int64')
+        date_span_days = (time_arr[last_idx] - time_arr[first_idx]) // (24 * 3600 * 10 ** 9)
+        date_span_fraction = np.where(date_span_days > 0, 365 / np.maximum(date_span_days, 1), 1)
         # basic indicators
-        CAGR = data_df.Value[data_df.index[-1]] ** date_span_fraction - 1
-        period_rr = data_df.Value[data_df.index[-1]] - 1
-        ann_vol = np.std(data_df.ret, ddof=1) * np.sqrt(data_count_per_year)
-        down_side_vol = np.std(data_df.ret[data_df.ret < 0], ddof=1) * np.sqrt(data_count_per_year)
-        # WeeksNum = data.shape[0]
-        profit_loss_ratio = -np.mean(data_df.ret[data_df.ret > 0]) / np.mean(data_df.ret[data_df.ret < 0])
-        win_ratio = len(data_df.ret[data_df.ret >= 0]) / len(data_df.ret)
-        min_value = min(data_df.Value)
-        final_value = data_df.Value[data_df.index[-1]]
-        max_ret = max(data_df.ret)
-        min_ret = min(data_df.ret)
-        # End of basic indicators
+        CAGR = nav_latest ** date_span_fraction - 1
+        ret_df = pd.DataFrame(ret_arr)
+        ann_vol = ret_df.std(ddof=1).values * np.sqrt(data_count_per_year)
+        down_side_vol = ret_df[ret_df < 0].std(ddof=1).values * np.sqrt(data_count_per_year)
+        profit_loss_ratio = -ret_df[ret_df > 0].mean().values / ret_df[ret_df < 0].mean().values
+        nav_valid_arr = np.where(valid_arr, nav_arr, np.nan)
         # max dropdown related
-        data_df['mdd'] = data_df.Value / data_df.Value.cummax() - 1
-        mdd_size = min(data_df.mdd)
-        droparray = pd.Series(data_df.index[data_df.mdd == 0])
-        if len(droparray) == 1:
-            mdd_max_period = len(data_df.mdd)
-        else:
-            if float(data_df.Value[droparray.tail(1)]) > float(data_df.Value.tail(1)):
-                droparray = droparray.append(pd.Series(data_df.index[-1]))  # , ignore_index=True
-            mdd_max_period = max(droparray.diff().dropna()) - 1
-        # End of max dropdown related
-        # High level indicators
-        sharpe_ratio = (CAGR - rf) / ann_vol
-        sortino_ratio = (CAGR - rf) / down_side_vol
-        calmar_ratio = CAGR / (-mdd_size)
-        #  Natural month return
-        j = 1
-        for i in data_df.index:
-            if i == 0:
-                month_ret = pd.DataFrame([[data_df.Date[i], data_df.Value[i]]], columns=('Date', 'Value'))
-            else:
-                if data_df.Date[i].month != data_df.Date[i - 1].month:
-                    month_ret.loc[j] = [data_df.Date[i - 1], data_df.Value[i - 1]]
-                    j += 1
-        month_ret.loc[j] = [data_df.Date[data_df.index[-1]], data_df.Value[data_df.index[-1]]]
-        month_ret['ret'] = month_ret.Value.pct_change().fillna(0)
-        max_rr_month = max(month_ret.ret)
-        min_rr_month = min(month_ret.ret)
-        # End of Natural month return
-        data_len = data_df.shape[0]
-        date_begin = data_df.Date[0]  # .date()
-        date_end = data_df.Date[data_len-1]
-        stat_dic = OrderedDict([('起始日期', date_begin),
-                                ('截止日期', date_end),
-                                ('区间收益率', '%.2f%%' % (period_rr * 100)),
-                                ('最终净值', '%.4f' % final_value),
-                                ('最低净值', '%.4f' % min_value),
-                                ('年化收益率', '%.2f%%' % (CAGR * 100)),
-                                ('年化波动率', '%.2f%%' % (ann_vol * 100)),
-                                ('年化下行波动率', '%.2f%%' % (down_side_vol * 100)),
-                                ('最大回撤', '%.2f%%' % (mdd_size * 100)),
-                                ('夏普率', '%.2f' % sharpe_ratio),
-                                ('索提诺比率', '%.2f' % sortino_ratio),
-                                ('卡马比率', '%.2f' % calmar_ratio),
-                                ('盈亏比', '%.2f' % profit_loss_ratio),
-                                ('胜率', '%.2f' % win_ratio),
-                                ('最长不创新高（%s）' % freq_str, mdd_max_period),
-                                ('统计周期最大收益', '%.2f%%' % (max_ret * 100)),
-                                ('统计周期最大亏损', '%.2f%%' % (min_ret * 100)),
-                                ('最大月收益', '%.2f%%' % (max_rr_month * 100)),
-                                ('最大月亏损', '%.2f%%' % (min_rr_month * 100))])
-        stat_dic_dic[col_name if suffix_name is None else col_name + "_" + suffix_name] = stat_dic
-
-        # 按时间周期进行相关统计
-        data_df = data_df.set_index('Date')[['Value']]
-        # data_df_g = data_df.groupby(pd.Grouper(freq='M'))
-        # TODO: 首月收益未被计算进去，以后再修复
-        monthly_rr_df = data_df.resample('M', convention='end').last().pct_change().fillna(0)
-        mon_rr_dic[col_name if suffix_name is None else col_name + "_" + suffix_name] = monthly_rr_df
+        mdd_arr = nav_valid_arr / np.maximum.accumulate(np.where(valid_arr, nav_arr, 0), axis=0) - 1
+        mdd_size = np.nanmin(mdd_arr, axis=0)
+        # 创新高之间的最大间隔（数据个数）
+        max_gap, drop_count = _max_new_high_gap(mdd_arr, nav_arr, last_idx, np.cumsum(valid_arr, axis=0) - 1)
+        mdd_max_period = np.where(drop_count == 1, valid_count, max_gap - 1)
+        max_rr_month, min_rr_month = _month_ret_range(nav_arr, valid_arr, first_idx, last_idx,
+                                                      date_index.month.values)
+        stat_df = pd.DataFrame(OrderedDict([
+            ('date_begin', date_index[first_idx]),
+            ('date_end', date_index[last_idx]),
+            ('rr_tot', nav_latest - 1),
+            ('final_value', nav_latest),
+            ('min_value', np.nanmin(nav_valid_arr, axis=0)),
+            ('CAGR', CAGR),
+            ('ann_vol', ann_vol),
+            ('down_side_vol', down_side_vol),
+            ('mdd', mdd_size),
+            ('sharpe_ratio', (CAGR - rf) / ann_vol),
+            ('sortino_ratio', (CAGR - rf) / down_side_vol),
+            ('calmar_ratio', CAGR / (-mdd_size)),
+            ('profit_loss_ratio', profit_loss_ratio),
+            ('win_ratio', (ret_arr >= 0).sum(axis=0) / valid_count),
+            ('mdd_max_period', mdd_max_period),
+            ('max_ret', np.nanmax(ret_arr, axis=0)),
+            ('min_ret', np.nanmin(ret_arr, axis=0)),
+            ('max_rr_month', max_rr_month),
+            ('min_rr_month', min_rr_month),
+            ('freq', freq_str),
+        ]), index=col_name_list)
+
+        # 按月统计收益率，各产品仅保留有数据的月份区间
+        month_nav_df = _resample_month_last(pd.DataFrame(nav_valid_arr, index=date_index, columns=col_name_list))
+        month_nav_arr = month_nav_df.values
+        month_valid_arr = ~np.isnan(month_nav_arr)
+        month_last_valid_arr = _last_valid_row(month_valid_arr)
+        month_first_idx = month_valid_arr.argmax(axis=0)
+        # 没有数据的月份收益率为 0
+        month_rr_arr = _pct_change_valid(month_nav_arr, month_last_valid_arr >= 0, month_last_valid_arr,
+                                         month_first_idx)
+    month_row_arr = np.arange(month_nav_arr.shape[0]).reshape(-1, 1)
+    month_rr_arr[(month_row_arr < month_first_idx) | (month_row_arr > month_last_valid_arr[-1])] = np.nan
+    month_rr_df = pd.DataFrame(month_rr_arr, index=month_nav_df.index, columns=col_name_list)
+    month_rr_df.index.name = 'Date'
+    if not formatted:
+        return stat_df, month_rr_df
 
-    if len(stat_dic_dic) > 0:
-        stat_df = pd.DataFrame(stat_dic_dic)
-        stat_df = stat_df.loc[list(stat_dic.keys())]
-    else:
-        stat_df = None
-
-    return stat_df, mon_rr_dic
+    mon_rr_dic = {}
+    for num, col_name in enumerate(col_name_list):
+        monthly_rr_df = month_rr_df.iloc[month_first_idx[num]:month_last_valid_arr[-1, num] + 1, [num]]
+        monthly_rr_df.columns = ['Value']
+        mon_rr_dic[col_name] = monthly_rr_df
+    return format_return_risk_stat(stat_df), mon_rr_dic
 
 
 class DataFrame(pd.DataFrame):
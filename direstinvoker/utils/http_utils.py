@@ -0,0 +1,250 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/8/20 10:12
+@File    : http_utils.py
+@contact : mmmaaaggg@163.com
+@desc    : 基于 requests.Session 的 keep-alive 连接池，供 WindRestInvoker、IFinDInvoker 复用
+"""
+import gzip
+import time
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+ACCEPT_ENCODING = 'gzip, deflate'
+# 记录当前线程在一次请求中新建连接的数量及耗时（requests 为同步调用，connect 动作发生在调用线程中）
+_conn_local = threading.local()
+
+
+def _reset_conn_local():
+    _conn_local.new_conn_count = 0
+    _conn_local.connect_time = 0.0
+
+
+def get_last_post_bytes() -> tuple:
+    """
+    当前线程最近一次 SessionPool.post 实际发送、接收的字节数
+    :return: (request_bytes, response_bytes)
+    """
+    return getattr(_conn_local, 'request_bytes', 0), getattr(_conn_local, 'response_bytes', 0)
+
+
+def _record_connect(connect_time):
+    _conn_local.new_conn_count = getattr(_conn_local, 'new_conn_count', 0) + 1
+    _conn_local.connect_time = getattr(_conn_local, 'connect_time', 0.0) + connect_time
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start_time = time.time()
+        super().connect()
+        _record_connect(time.time() - start_time)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start_time = time.time()
+        super().connect()
+        _record_connect(time.time() - start_time)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """
+    统计新建连接次数及耗时的 HTTPAdapter
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+def compress_request(data, headers, compress_min_size=None):
+    """
+    请求数据不小于 compress_min_size 字节时以 gzip 压缩
+    :param data: str 或 bytes
+    :param headers:
+    :param compress_min_size: None 为不压缩
+    :return: (data, headers, 压缩前字节数)
+    """
+    if data is None:
+        return data, headers, 0
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    raw_size = len(data)
+    if compress_min_size is not None and raw_size >= compress_min_size:
+        data = gzip.compress(data)
+        headers = {} if headers is None else headers.copy()
+        headers['Content-Encoding'] = 'gzip'
+    return data, headers, raw_size
+
+
+def fill_avg_stats(stat_dic: dict) -> dict:
+    """
+    根据累计值计算连接复用比例、平均耗时等统计信息
+    :param stat_dic:
+    :return:
+    """
+    request_count = stat_dic['request_count']
+    response_raw_bytes = stat_dic.get('response_raw_bytes', 0)
+    stat_dic['response_compression_ratio'] = stat_dic['response_bytes'] / response_raw_bytes \
+        if response_raw_bytes > 0 else None
+    request_raw_bytes = stat_dic.get('request_raw_bytes', 0)
+    stat_dic['request_compression_ratio'] = stat_dic['request_bytes'] / request_raw_bytes \
+        if request_raw_bytes > 0 else None
+    if request_count > 0:
+        stat_dic['conn_reuse_ratio'] = 1 - stat_dic['new_conn_count'] / request_count
+        stat_dic['avg_connect_time'] = stat_dic['connect_time'] / request_count
+        stat_dic['avg_elapsed_time'] = stat_dic['elapsed_time'] / request_count
+    else:
+        stat_dic['conn_reuse_ratio'] = None
+        stat_dic['avg_connect_time'] = None
+        stat_dic['avg_elapsed_time'] = None
+    return stat_dic
+
+
+class SessionPool:
+    """
+    线程安全的 HTTP keep-alive 连接池
+    所有 endpoint 方法共用同一个 session，urllib3 连接池本身线程安全，
+    session 的重建（达到 max_requests_per_conn 限制时）通过锁保护
+    """
+
+    def __init__(self, pool_size=10, keep_alive=True, max_requests_per_conn=None,
+                 connect_timeout=None, read_timeout=None, compress=True, compress_min_size=None):
+        """
+        :param pool_size: 连接池最大连接数，并发请求时应不小于并发线程数
+        :param keep_alive: 是否保持长连接，False 时每次请求均发送 'Connection: close'
+        :param max_requests_per_conn: 连接平均最大复用次数，session 累计请求数达到 pool_size * max_requests_per_conn 时重建连接池，
+        None 为不限制
+        :param connect_timeout: 建立连接超时时间（秒），None 为不限制
+        :param read_timeout: 读取数据超时时间（秒），None 为不限制
+        :param compress: 是否接受压缩（gzip、deflate）的返回数据
+        :param compress_min_size: 请求数据不小于该字节数时以 gzip 压缩发送（需服务器支持 Content-Encoding: gzip），
+        None 为不压缩
+        """
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_requests_per_conn = max_requests_per_conn
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_request_count = 0
+        # 统计信息
+        self._stat_dic = {
+            'request_count': 0,
+            'new_conn_count': 0,
+            'connect_time': 0.0,
+            'elapsed_time': 0.0,
+            'session_count': 0,
+            'request_bytes': 0,
+            'request_raw_bytes': 0,
+            'response_bytes': 0,
+            'response_raw_bytes': 0,
+        }
+
+    @property
+    def timeout(self):
+        if self.connect_timeout is None and self.read_timeout is None:
+            return None
+        return self.connect_timeout, self.read_timeout
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING if self.compress else 'identity'
+        self._stat_dic['session_count'] += 1
+        return session
+
+    def _get_session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = self._new_session()
+                self._session_request_count = 0
+            elif self.max_requests_per_conn is not None \
+                    and self._session_request_count >= self.max_requests_per_conn * self.pool_size:
+                # 正在使用旧 session 的请求完成后，连接归还到已关闭的连接池时会自动关闭
+                self._session.close()
+                self._session = self._new_session()
+                self._session_request_count = 0
+            self._session_request_count += 1
+            return self._session
+
+    def post(self, url, data=None, headers=None, timeout=None, **kwargs) -> requests.Response:
+        """
+        通过连接池发送 POST 请求
+        :param url:
+        :param data:
+        :param headers:
+        :param timeout: 本次调用的超时时间，None 则使用连接池默认的 (connect_timeout, read_timeout)
+        :return:
+        """
+        session = self._get_session()
+        data, headers, request_raw_bytes = compress_request(data, headers, self.compress_min_size)
+        _reset_conn_local()
+        start_time = time.time()
+        response_bytes, response_raw_bytes = 0, 0
+        try:
+            ret_data = session.post(url, data=data, headers=headers,
+                                    timeout=self.timeout if timeout is None else timeout, **kwargs)
+            response_raw_bytes = len(ret_data.content)
+            # urllib3 的 tell() 为实际传输（解压前）的字节数
+            response_bytes = ret_data.raw.tell() if ret_data.raw is not None else response_raw_bytes
+        finally:
+            elapsed_time = time.time() - start_time
+            new_conn_count, connect_time = _conn_local.new_conn_count, _conn_local.connect_time
+            _conn_local.request_bytes = 0 if data is None else len(data)
+            _conn_local.response_bytes = response_bytes
+            with self._lock:
+                self._stat_dic['request_count'] += 1
+                self._stat_dic['new_conn_count'] += new_conn_count
+                self._stat_dic['connect_time'] += connect_time
+                self._stat_dic['elapsed_time'] += elapsed_time
+                self._stat_dic['request_bytes'] += 0 if data is None else len(data)
+                self._stat_dic['request_raw_bytes'] += request_raw_bytes
+                self._stat_dic['response_bytes'] += response_bytes
+                self._stat_dic['response_raw_bytes'] += response_raw_bytes
+            logger.debug('POST %s 耗时 %.3fs，其中新建连接 %d 个，耗时 %.3fs，发送 %d/%d 字节，接收 %d/%d 字节（压缩后/压缩前）',
+                         url, elapsed_time, new_conn_count, connect_time, 0 if data is None else len(data),
+                         request_raw_bytes, response_bytes, response_raw_bytes)
+        return ret_data
+
+    def get_stats(self) -> dict:
+        """
+        返回连接池统计信息
+        :return: request_count 请求次数，new_conn_count 新建连接次数，conn_reuse_ratio 连接复用比例，
+        connect_time 建立连接总耗时，avg_connect_time 平均每次调用建立连接耗时，elapsed_time 请求总耗时，
+        avg_elapsed_time 平均每次调用耗时，session_count 创建 session 次数，
+        request_bytes、request_raw_bytes 发送的字节数（压缩后、压缩前），request_compression_ratio 压缩比例，
+        response_bytes、response_raw_bytes 接收的字节数（解压前、解压后），response_compression_ratio 压缩比例
+        """
+        with self._lock:
+            stat_dic = self._stat_dic.copy()
+        return fill_avg_stats(stat_dic)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,382 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/8/29 10:05
+@File    : incremental.py
+@contact : mmmaaaggg@163.com
+@desc    : wsd、THS_DateSerial 增量更新
+在本地记录每个 (代码, 指标) 已覆盖的日期区间，仅请求缺失的日期区间，缺失区间相同的代码合并为一次请求，
+请求结果合并到本地保存的时间序列中
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import date, timedelta
+from collections import OrderedDict, defaultdict
+import pandas as pd
+from direstinvoker import APIError, format_2_date_str
+from direstinvoker.utils.fh_utils import get_cache_file_path, try_2_date, date_2_str
+from direstinvoker.utils.retry import ERROR_CODE_CATEGORY_DIC, NO_DATA
+
+logger = logging.getLogger(__name__)
+
+
+def merge_ranges(range_list) -> list:
+    """
+    合并重叠或相邻的日期区间
+    :param range_list: [(date_from, date_to), ...]
+    :return: 排序后的区间列表
+    """
+    merged_list = []
+    for date_from, date_to in sorted(range_list):
+        if len(merged_list) > 0 and date_from <= merged_list[-1][1] + timedelta(days=1):
+            if date_to > merged_list[-1][1]:
+                merged_list[-1][1] = date_to
+        else:
+            merged_list.append([date_from, date_to])
+    return [tuple(item) for item in merged_list]
+
+
+def subtract_ranges(date_from, date_to, covered_list) -> list:
+    """
+    计算 [date_from, date_to] 中未被 covered_list 覆盖的区间
+    :param date_from:
+    :param date_to:
+    :param covered_list: 已合并、排序的区间列表
+    :return: [(gap_from, gap_to), ...]
+    """
+    gap_list = []
+    cursor = date_from
+    for covered_from, covered_to in covered_list:
+        if covered_to < cursor:
+            continue
+        if covered_from > date_to:
+            break
+        if covered_from > cursor:
+            gap_list.append((cursor, covered_from - timedelta(days=1)))
+        cursor = covered_to + timedelta(days=1)
+        if cursor > date_to:
+            break
+    if cursor <= date_to:
+        gap_list.append((cursor, date_to))
+    return gap_list
+
+
+class CoverageStore:
+    """
+    本地时间序列及覆盖区间索引
+    每个代码的数据保存为一个文件（index 为日期，columns 为指标），覆盖区间索引保存为 json 文件
+    update 仅更新内存中的数据及覆盖区间，save 时每个代码的数据文件只读写一次
+    """
+
+    def __init__(self, store_folder_name, namespace):
+        """
+        :param store_folder_name: 保存目录名称，通过 fh_utils.get_cache_file_path 查找或创建
+        :param namespace: 命名空间，不同接口、不同参数的数据分开保存
+        """
+        self.store_folder_name = store_folder_name
+        self.namespace = namespace
+        self._lock = threading.RLock()
+        self._index_file_path = get_cache_file_path(store_folder_name, '%s_coverage.json' % namespace)
+        # {code: {field: [(date_from, date_to), ...]}}
+        self._coverage_dic = defaultdict(dict)
+        # 尚未写入文件的数据 {code: DataFrame}
+        self._pending_dic = {}
+        if os.path.exists(self._index_file_path):
+            with open(self._index_file_path, 'r', encoding='utf-8') as f:
+                for code, field_dic in json.load(f).items():
+                    for field, range_list in field_dic.items():
+                        self._coverage_dic[code][field] = [
+                            (try_2_date(date_from), try_2_date(date_to)) for date_from, date_to in range_list]
+
+    def _data_file_path(self, code):
+        return get_cache_file_path(self.store_folder_name, '%s_%s.pkl' % (self.namespace, code))
+
+    def get_gaps(self, code, field, date_from, date_to) -> list:
+        with self._lock:
+            covered_list = self._coverage_dic.get(code, {}).get(field, [])
+        return subtract_ranges(date_from, date_to, covered_list)
+
+    def load(self, code) -> pd.DataFrame:
+        file_path = self._data_file_path(code)
+        if os.path.exists(file_path):
+            return pd.read_pickle(file_path)
+        return None
+
+    def update(self, code, data_df: pd.DataFrame, field_range_dic: dict):
+        """
+        合并新数据并更新覆盖区间，数据暂存在内存中，调用 save 后写入文件
+        :param code:
+        :param data_df: index 为日期，columns 为指标，可以为 None
+        :param field_range_dic: {field: [(date_from, date_to), ...]} 本次请求已覆盖的区间
+        :return:
+        """
+        with self._lock:
+            if data_df is not None and data_df.shape[0] > 0:
+                pending_df = self._pending_dic.get(code, None)
+                self._pending_dic[code] = data_df if pending_df is None else data_df.combine_first(pending_df)
+            for field, range_list in field_range_dic.items():
+                self._coverage_dic[code][field] = merge_ranges(self._coverage_dic[code].get(field, []) + range_list)
+
+    def save(self):
+        """
+        将暂存的数据合并到各代码的数据文件，并保存覆盖区间索引
+        """
+        with self._lock:
+            for code, data_df in self._pending_dic.items():
+                stored_df = self.load(code)
+                if stored_df is not None:
+                    data_df = data_df.combine_first(stored_df)
+                data_df = data_df.sort_index()
+                file_path = self._data_file_path(code)
+                tmp_path = file_path + '.tmp'
+                data_df.to_pickle(tmp_path)
+                os.replace(tmp_path, file_path)
+            self._pending_dic.clear()
+            index_dic = {code: {field: [(date_2_str(date_from), date_2_str(date_to))
+                                        for date_from, date_to in range_list]
+                                for field, range_list in field_dic.items()}
+                         for code, field_dic in self._coverage_dic.items()}
+            tmp_path = self._index_file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index_dic, f)
+            os.replace(tmp_path, self._index_file_path)
+
+
+class IncrementalFetcher:
+    """
+    wsd、THS_DateSerial 增量更新
+    用法：
+    fetcher = IncrementalFetcher(invoker)
+    data_df = fetcher.wsd(codes, 'close,volume', '2010-01-01', date.today())
+    每日更新时仅请求新增交易日的数据
+    """
+
+    def __init__(self, invoker, store_folder_name='incremental'):
+        """
+        :param invoker: WindRestInvoker 或 IFinDInvoker（同步版本）
+        :param store_folder_name: 本地数据保存目录名称
+        """
+        self.invoker = invoker
+        self.store_folder_name = store_folder_name
+        self._store_dic = {}
+        self._lock = threading.Lock()
+        self.request_count = 0
+
+    def _get_store(self, path, *params) -> CoverageStore:
+        namespace = path.strip('/') + '_' + hashlib.sha1(json.dumps(params).encode('utf-8')).hexdigest()[:8]
+        with self._lock:
+            if namespace not in self._store_dic:
+                self._store_dic[namespace] = CoverageStore(self.store_folder_name, namespace)
+            return self._store_dic[namespace]
+
+    @staticmethod
+    def _covered_to(date_to):
+        """
+        当天及之后的数据可能尚未完整，覆盖区间截止到前一天
+        """
+        return min(date_to, date.today() - timedelta(days=1))
+
+    @staticmethod
+    def _group_gaps(store, code_list, field_list, date_from, date_to) -> OrderedDict:
+        """
+        计算各 (代码, 指标) 缺失的区间，缺失区间、指标相同的代码合并为一组
+        :return: {(gap_from, gap_to, field): [code, ...]}
+        """
+        group_dic = OrderedDict()
+        for code in code_list:
+            for field in field_list:
+                for gap_from, gap_to in store.get_gaps(code, field, date_from, date_to):
+                    group_dic.setdefault((gap_from, gap_to, field), []).append(code)
+        return group_dic
+
+    def _fetch_and_merge(self, store, group_dic, fetch_func) -> None:
+        """
+        逐组请求缺失数据，并合并到本地，全部请求完成（或出错）后统一写入文件
+        :param store:
+        :param group_dic: _group_gaps 返回结果
+        :param fetch_func: fetch_func(code_list, field, gap_from, gap_to) -> self._post_chunks 返回结果
+        :return:
+        """
+        try:
+            for (gap_from, gap_to, field), code_list in group_dic.items():
+                chunk_list = fetch_func(code_list, field, gap_from, gap_to)
+                self.request_count += 1
+                for sub_code_list, date_from, date_to, series_dic in chunk_list:
+                    covered_to = self._covered_to(date_to)
+                    field_range_dic = {field: [(date_from, covered_to)]} if covered_to >= date_from else {}
+                    for code in sub_code_list:
+                        data_s = series_dic.get(code, None)
+                        store.update(code, None if data_s is None else data_s.to_frame(field), field_range_dic)
+        finally:
+            store.save()
+
+    def _post_chunks(self, path, req_data_dic_list, parse_func, series_func, code_key, begin_key, end_key) -> list:
+        """
+        发送分段请求，返回已完成分段的数据及覆盖区间
+        请求成功的分段，其全部代码（包括没有返回数据的代码）均记录为已覆盖；
+        分段请求部分失败时，没有返回数据的分段无法区分失败、取消或没有数据，不记录覆盖区间，下次仍会重新请求
+        :param path:
+        :param req_data_dic_list: 分段请求参数列表
+        :param parse_func: 对每一段返回的 json 数据进行转换
+        :param series_func: series_func(data_df, code_list) -> {code: pd.Series}
+        :param code_key: 请求参数中代码的 key
+        :param begin_key: 请求参数中起始日期的 key
+        :param end_key: 请求参数中截止日期的 key
+        :return: [(code_list, date_from, date_to, {code: pd.Series}), ...]
+        """
+        ret_list, exp = self.invoker._post_chunks(path, req_data_dic_list, parse_func)
+        if exp is not None:
+            if not isinstance(exp, APIError):
+                raise exp
+            if self._is_no_data(exp) and len(req_data_dic_list) == 1:
+                # 服务端明确返回没有数据
+                exp = None
+            elif self._is_no_data(exp):
+                logger.warning('%s 部分分段没有数据，未完成的分段不记录覆盖区间：%s', path, exp)
+            elif all(ret_data is None for ret_data in ret_list):
+                raise exp
+            else:
+                logger.error('%s 部分分段请求失败，未完成的分段不记录覆盖区间', path, exc_info=exp)
+        chunk_list = []
+        for num, (req_data_dic, ret_data) in enumerate(zip(req_data_dic_list, ret_list)):
+            if ret_data is None and exp is not None:
+                continue
+            code_list = req_data_dic[code_key].split(',')
+            date_from, date_to = try_2_date(req_data_dic[begin_key]), try_2_date(req_data_dic[end_key])
+            if num + 1 < len(req_data_dic_list) and req_data_dic_list[num + 1][code_key] == req_data_dic[code_key]:
+                # 按交易日切分时间区间时，区间之间的非交易日一并记录为已覆盖
+                date_to = try_2_date(req_data_dic_list[num + 1][begin_key]) - timedelta(days=1)
+            series_dic = {} if ret_data is None or ret_data.shape[0] == 0 else series_func(ret_data, code_list)
+            chunk_list.append((code_list, date_from, date_to, series_dic))
+        return chunk_list
+
+    def _is_no_data(self, exp) -> bool:
+        """
+        是否为服务端明确返回的没有数据错误
+        """
+        retry_policy = getattr(self.invoker, 'retry_policy', None)
+        if retry_policy is not None:
+            return retry_policy.classify(exp) == NO_DATA
+        return ERROR_CODE_CATEGORY_DIC.get(exp.error_code, None) == NO_DATA
+
+    @staticmethod
+    def _load_result(store, code_list, field_list, date_from, date_to) -> pd.DataFrame:
+        """
+        从本地读取结果
+        :return: index 为 (code, date) 的 DataFrame，columns 为指标
+        """
+        df_dic = OrderedDict()
+        for code in code_list:
+            data_df = store.load(code)
+            if data_df is None:
+                continue
+            data_df = data_df.reindex(columns=field_list)
+            data_df = data_df[(data_df.index >= pd.Timestamp(date_from)) & (data_df.index <= pd.Timestamp(date_to))]
+            df_dic[code] = data_df
+        if len(df_dic) == 0:
+            return pd.DataFrame(columns=field_list)
+        return pd.concat(df_dic, names=['code', 'date'])
+
+    @staticmethod
+    def _to_series(data_s: pd.Series) -> pd.Series:
+        data_s = data_s.copy()
+        data_s.index = pd.to_datetime([try_2_date(idx) for idx in data_s.index])
+        return data_s
+
+    @staticmethod
+    def _find_column(data_df, name):
+        for col_name in data_df.columns:
+            if str(col_name).lower() == name.lower():
+                return col_name
+        return None
+
+    def wsd(self, codes, fields, beginTime, endTime, options="") -> pd.DataFrame:
+        """
+        增量获取历史序列数据
+        :param codes:代码列表或以 ',' 分隔的字符串
+        :param fields:指标列表或以 ',' 分隔的字符串
+        :param beginTime:开始时间
+        :param endTime:结束时间
+        :param options:可选参数
+        :return: index 为 (code, date) 的 DataFrame，columns 为指标
+        """
+        code_list = codes.split(',') if isinstance(codes, str) else list(codes)
+        field_list = fields.split(',') if isinstance(fields, str) else list(fields)
+        date_from, date_to = try_2_date(beginTime), try_2_date(endTime)
+        store = self._get_store('wsd/', options)
+
+        def series_func(data_df, chunk_code_list, field):
+            series_dic = {}
+            if len(chunk_code_list) == 1:
+                # 单一代码时 columns 为指标
+                col_name = self._find_column(data_df, field)
+                if col_name is not None:
+                    series_dic[chunk_code_list[0]] = self._to_series(data_df[col_name])
+            else:
+                # 多代码单一指标时 columns 为代码
+                for code in chunk_code_list:
+                    col_name = self._find_column(data_df, code)
+                    if col_name is not None:
+                        series_dic[code] = self._to_series(data_df[col_name])
+            return series_dic
+
+        def fetch_func(sub_code_list, field, gap_from, gap_to):
+            # 按 invoker 的设置分段，逐段判断是否完成
+            req_data_dic_list, _ = self.invoker._ts_req_list(
+                'wsd/', sub_code_list, field, gap_from, gap_to, options, None, None, None, with_time=False,
+                format_func=format_2_date_str)
+            return self._post_chunks('wsd/', req_data_dic_list, self.invoker._json_2_ts_chunk_df,
+                                     lambda data_df, chunk_code_list: series_func(data_df, chunk_code_list, field),
+                                     'codes', 'beginTime', 'endTime')
+
+        group_dic = self._group_gaps(store, code_list, field_list, date_from, date_to)
+        logger.debug('wsd 增量更新 %d 个代码 %d 个指标，需请求 %d 个缺失区间',
+                     len(code_list), len(field_list), len(group_dic))
+        self._fetch_and_merge(store, group_dic, fetch_func)
+        return self._load_result(store, code_list, field_list, date_from, date_to)
+
+    def THS_DateSerial(self, thscode, jsonIndicator, jsonparam, globalparam, begintime, endtime) -> pd.DataFrame:
+        """
+        增量获取日期序列
+        :param thscode:代码列表或以 ',' 分隔的字符串
+        :param jsonIndicator:指标，指标之间用 ';' 隔开
+        :param jsonparam:参数，与指标一一对应，用 ';' 隔开
+        :param globalparam:全局参数
+        :param begintime:开始时间
+        :param endtime:截止时间
+        :return: index 为 (code, date) 的 DataFrame，columns 为指标
+        """
+        code_list = thscode.split(',') if isinstance(thscode, str) else list(thscode)
+        field_list = jsonIndicator.split(';')
+        param_list = jsonparam.split(';')
+        param_dic = dict(zip(field_list, param_list)) if len(param_list) == len(field_list) else {}
+        date_from, date_to = try_2_date(begintime), try_2_date(endtime)
+        store = self._get_store('THS_DateSerial/', jsonparam, globalparam)
+
+        def series_func(data_df, field):
+            series_dic = {}
+            code_col, time_col = self._find_column(data_df, 'thscode'), self._find_column(data_df, 'time')
+            col_name = self._find_column(data_df, field)
+            if code_col is None or time_col is None or col_name is None:
+                logger.warning('THS_DateSerial 返回数据缺少 thscode、time 或 %s 字段：%s', field, list(data_df.columns))
+                return series_dic
+            for code, sub_df in data_df.groupby(code_col):
+                series_dic[code] = self._to_series(sub_df.set_index(time_col)[col_name])
+            return series_dic
+
+        def fetch_func(sub_code_list, field, gap_from, gap_to):
+            req_data_dic_list = self.invoker._date_serial_req_list(
+                sub_code_list, field, param_dic.get(field, jsonparam), globalparam, gap_from, gap_to, None)
+            return self._post_chunks('THS_DateSerial/', req_data_dic_list, self.invoker._json_2_df,
+                                     lambda data_df, chunk_code_list: series_func(data_df, field),
+                                     'thscode', 'begintime', 'endtime')
+
+        group_dic = self._group_gaps(store, code_list, field_list, date_from, date_to)
+        logger.debug('THS_DateSerial 增量更新 %d 个代码 %d 个指标，需请求 %d 个缺失区间',
+                     len(code_list), len(field_list), len(group_dic))
+        self._fetch_and_merge(store, group_dic, fetch_func)
+        return self._load_result(store, code_list, field_list, date_from, date_to)
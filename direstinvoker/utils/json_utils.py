@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/7 10:05
+@File    : json_utils.py
+@contact : mmmaaaggg@163.com
+@desc    : 可替换的 json 解码器，以及将 wind 接口返回的 {行: {字段: 值}} 数据直接按列构建 DataFrame
+安装 orjson 或 ujson 时自动使用，否则使用标准库 json
+"""
+import json
+import logging
+import pandas as pd
+from direstinvoker.utils.schema import build_column, to_datetime_index
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+logger = logging.getLogger(__name__)
+# 自动选择时的优先顺序
+JSON_BACKEND_LIST = ['orjson', 'ujson', 'json']
+
+
+def _json_loads(content):
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    return json.loads(content)
+
+
+def get_json_loads(backend=None):
+    """
+    获取 json 解码函数，解码函数接受 bytes 或 str，解码失败时抛出 ValueError
+    :param backend: 'orjson'、'ujson'、'json'，None 则按 JSON_BACKEND_LIST 顺序选择已安装的库
+    :return:
+    """
+    if backend is None:
+        for backend in JSON_BACKEND_LIST:
+            if backend == 'json' or globals()[backend] is not None:
+                break
+    if backend == 'orjson':
+        if orjson is None:
+            raise ImportError('需要安装 orjson：pip install orjson')
+        return orjson.loads
+    elif backend == 'ujson':
+        if ujson is None:
+            raise ImportError('需要安装 ujson：pip install ujson')
+        return ujson.loads
+    elif backend == 'json':
+        return _json_loads
+    else:
+        raise ValueError('不支持的 json 解码器 %s' % backend)
+
+
+def dict_2_columns(json_dic: dict):
+    """
+    将 {行: {字段: 值}} 结构的数据转换为列数组
+    :param json_dic:
+    :return: (index_list, {字段: 值列表})，缺失的值为 None
+    """
+    index_list = list(json_dic.keys())
+    row_list = list(json_dic.values())
+    field_list = []
+    field_set = set()
+    for row_dic in row_list:
+        # 各行字段通常一致，仅在出现新字段时逐个检查
+        if field_set.issuperset(row_dic):
+            continue
+        for field in row_dic:
+            if field not in field_set:
+                field_set.add(field)
+                field_list.append(field)
+    column_dic = {field: [row_dic.get(field, None) for row_dic in row_list] for field in field_list}
+    return index_list, column_dic
+
+
+def dict_2_df(json_dic: dict, datetime_index=False) -> pd.DataFrame:
+    """
+    将 {行: {字段: 值}} 结构的数据按列构建 DataFrame，结果与 pd.DataFrame(json_dic).T 一致，
+    但不需要转置，各列按 schema 中的字段类型注册表转换或推断一次数据类型，而不是全部为 object 类型
+    :param json_dic:
+    :param datetime_index: 是否将 index 转换为 DatetimeIndex，用于时间序列接口
+    :return:
+    """
+    if json_dic is None or len(json_dic) == 0:
+        return pd.DataFrame()
+    if not all(isinstance(row_dic, dict) for row_dic in json_dic.values()):
+        # 非 {行: {字段: 值}} 结构的数据
+        return pd.DataFrame(json_dic).T
+    index_list, column_dic = dict_2_columns(json_dic)
+    index = to_datetime_index(index_list) if datetime_index else pd.Index(index_list)
+    column_dic = {field: build_column(field, value_list) for field, value_list in column_dic.items()}
+    return pd.DataFrame(column_dic, index=index, columns=list(column_dic.keys()))
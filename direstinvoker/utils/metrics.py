@@ -0,0 +1,260 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/13 10:20
+@File    : metrics.py
+@contact : mmmaaaggg@163.com
+@desc    : 按接口统计请求次数、耗时分布、传输字节数、返回行数及错误次数，支持导出为 Prometheus 文本格式
+invoker 的 metrics 参数为 None 时不做任何统计
+"""
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from direstinvoker import APIError
+
+logger = logging.getLogger(__name__)
+# 耗时分布的默认分桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 耗时分布的统计阶段：request 为网络请求，decode 为 json 解码，frame 为构建 DataFrame
+PHASE_LIST = ['request', 'decode', 'frame']
+# 累计值字段
+COUNTER_LIST = ['request_count', 'request_bytes', 'response_bytes', 'row_count', 'cell_count', 'error_count']
+
+
+class Histogram:
+    """
+    按分桶上界统计数值分布，非线程安全，由 Metrics 加锁调用
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # 最后一个为超出全部上界的数量
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list:
+        """
+        :return: [(上界, 不大于上界的累计数量)]，最后一个上界为 float('inf')
+        """
+        cumulative_list, total = [], 0
+        for upper_bound, count in zip(self.buckets + (float('inf'),), self.bucket_counts):
+            total += count
+            cumulative_list.append((upper_bound, total))
+        return cumulative_list
+
+    def quantile(self, q):
+        """
+        按分桶估算分位数，返回分位数所在分桶的上界
+        :param q: 0~1
+        :return: 没有数据时返回 None
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for upper_bound, total in self.cumulative_counts():
+            if total >= rank:
+                return upper_bound
+        return float('inf')
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'avg': self.sum / self.count if self.count > 0 else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': self.cumulative_counts(),
+        }
+
+
+class EndpointMetrics:
+    """
+    单个接口的统计数据
+    """
+
+    def __init__(self, buckets):
+        self.counter_dic = OrderedDict((name, 0) for name in COUNTER_LIST)
+        self.histogram_dic = OrderedDict((phase, Histogram(buckets)) for phase in PHASE_LIST)
+        self.error_code_dic = {}
+
+    def snapshot(self) -> dict:
+        snapshot_dic = self.counter_dic.copy()
+        for phase, histogram in self.histogram_dic.items():
+            snapshot_dic['%s_time' % phase] = histogram.snapshot()
+        snapshot_dic['error_codes'] = self.error_code_dic.copy()
+        return snapshot_dic
+
+
+def get_error_code(exp):
+    """
+    错误分类标签：APIError 为 DIRestPlus 错误码（没有错误码时为 HTTP 状态码），其他异常为异常类名称
+    """
+    if isinstance(exp, APIError):
+        return str(exp.error_code if exp.error_code is not None else exp.status)
+    return exp.__class__.__name__
+
+
+class Metrics:
+    """
+    按接口统计的请求指标，线程安全，可在多个 invoker 之间共用
+    """
+
+    def __init__(self, buckets=None):
+        """
+        :param buckets: 耗时分布的分桶上界（秒），None 则使用 DEFAULT_BUCKETS
+        """
+        self.buckets = DEFAULT_BUCKETS if buckets is None else tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._endpoint_dic = OrderedDict()
+
+    @staticmethod
+    def endpoint_name(path: str) -> str:
+        return path.strip('/')
+
+    def _get_endpoint(self, path) -> EndpointMetrics:
+        endpoint = self.endpoint_name(path)
+        endpoint_metrics = self._endpoint_dic.get(endpoint, None)
+        if endpoint_metrics is None:
+            endpoint_metrics = self._endpoint_dic[endpoint] = EndpointMetrics(self.buckets)
+        return endpoint_metrics
+
+    def observe_request(self, path, elapsed_time, request_bytes, response_bytes):
+        """
+        记录一次成功返回的网络请求（包括 HTTP 状态码非 200 的情况）
+        :param path:
+        :param elapsed_time: 耗时（秒）
+        :param request_bytes: 发送的字节数
+        :param response_bytes: 接收的字节数
+        :return:
+        """
+        with self._lock:
+            endpoint_metrics = self._get_endpoint(path)
+            endpoint_metrics.counter_dic['request_count'] += 1
+            endpoint_metrics.counter_dic['request_bytes'] += request_bytes
+            endpoint_metrics.counter_dic['response_bytes'] += response_bytes
+            endpoint_metrics.histogram_dic['request'].observe(elapsed_time)
+
+    def observe_decode(self, path, elapsed_time):
+        with self._lock:
+            self._get_endpoint(path).histogram_dic['decode'].observe(elapsed_time)
+
+    def observe_frame(self, path, elapsed_time, row_count, cell_count):
+        """
+        记录一次返回数据的转换
+        :param path:
+        :param elapsed_time: 耗时（秒）
+        :param row_count: 行数
+        :param cell_count: 单元格数
+        :return:
+        """
+        with self._lock:
+            endpoint_metrics = self._get_endpoint(path)
+            endpoint_metrics.counter_dic['row_count'] += row_count
+            endpoint_metrics.counter_dic['cell_count'] += cell_count
+            endpoint_metrics.histogram_dic['frame'].observe(elapsed_time)
+
+    def observe_error(self, path, exp):
+        """
+        记录一次失败的请求（每次重试分别记录）
+        :param path:
+        :param exp:
+        :return:
+        """
+        error_code = get_error_code(exp)
+        with self._lock:
+            endpoint_metrics = self._get_endpoint(path)
+            endpoint_metrics.counter_dic['error_count'] += 1
+            endpoint_metrics.error_code_dic[error_code] = endpoint_metrics.error_code_dic.get(error_code, 0) + 1
+
+    def snapshot(self) -> dict:
+        """
+        :return: {接口名称: {request_count 请求次数，request_bytes、response_bytes 发送、接收的字节数，
+        row_count、cell_count 返回数据的行数、单元格数，error_count 错误次数，
+        request_time、decode_time、frame_time 网络请求、json 解码、构建 DataFrame 的耗时分布，
+        error_codes {错误码: 次数}}}
+        """
+        with self._lock:
+            return OrderedDict((endpoint, endpoint_metrics.snapshot())
+                               for endpoint, endpoint_metrics in self._endpoint_dic.items())
+
+    def reset(self):
+        with self._lock:
+            self._endpoint_dic.clear()
+
+    def to_prometheus(self, prefix='direstinvoker') -> str:
+        """
+        导出为 Prometheus 文本格式
+        :param prefix: 指标名称前缀
+        :return:
+        """
+        snapshot_dic = self.snapshot()
+        line_list = []
+
+        def add_counter(name, help_str, key):
+            line_list.append('# HELP %s_%s %s' % (prefix, name, help_str))
+            line_list.append('# TYPE %s_%s counter' % (prefix, name))
+            for endpoint, endpoint_dic in snapshot_dic.items():
+                line_list.append('%s_%s{endpoint="%s"} %d' % (prefix, name, endpoint, endpoint_dic[key]))
+
+        add_counter('requests_total', 'Number of requests', 'request_count')
+        add_counter('request_bytes_total', 'Bytes sent', 'request_bytes')
+        add_counter('response_bytes_total', 'Bytes received', 'response_bytes')
+        add_counter('rows_total', 'Rows returned', 'row_count')
+        add_counter('cells_total', 'Cells returned', 'cell_count')
+
+        name = '%s_errors_total' % prefix
+        line_list.append('# HELP %s Number of failed requests by error code' % name)
+        line_list.append('# TYPE %s counter' % name)
+        for endpoint, endpoint_dic in snapshot_dic.items():
+            for error_code, count in endpoint_dic['error_codes'].items():
+                line_list.append('%s{endpoint="%s",code="%s"} %d' % (name, endpoint, error_code, count))
+
+        for phase in PHASE_LIST:
+            name = '%s_%s_seconds' % (prefix, phase)
+            line_list.append('# HELP %s Time spent in %s phase' % (name, phase))
+            line_list.append('# TYPE %s histogram' % name)
+            for endpoint, endpoint_dic in snapshot_dic.items():
+                histogram_dic = endpoint_dic['%s_time' % phase]
+                for upper_bound, total in histogram_dic['buckets']:
+                    line_list.append('%s_bucket{endpoint="%s",le="%s"} %d' % (
+                        name, endpoint, '+Inf' if upper_bound == float('inf') else repr(upper_bound), total))
+                line_list.append('%s_sum{endpoint="%s"} %r' % (name, endpoint, histogram_dic['sum']))
+                line_list.append('%s_count{endpoint="%s"} %d' % (name, endpoint, histogram_dic['count']))
+        return '\n'.join(line_list) + '\n'
+
+    def start_http_server(self, port, addr='0.0.0.0', prefix='direstinvoker') -> HTTPServer:
+        """
+        在后台线程启动 HTTP 服务，供 Prometheus 抓取
+        :param port:
+        :param addr:
+        :param prefix: 指标名称前缀
+        :return: 服务对象，调用 shutdown() 停止
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                data = metrics.to_prometheus(prefix).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        server = HTTPServer((addr, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics_server', daemon=True).start()
+        return server
@@ -0,0 +1,458 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/17 9:30
+@File    : mock_server.py
+@contact : mmmaaaggg@163.com
+@desc    : 本地 DIRestPlus 模拟服务，实现 WindRestInvoker、IFinDInvoker 调用的 wind/、iFind/ 接口，
+按请求参数生成确定的模拟数据（相同请求返回相同数据），可设置延迟、带宽及错误注入，用于压力测试、性能测试
+python -m direstinvoker.utils.mock_server --port 5000 --latency 0.02
+"""
+import gzip
+import json
+import time
+import zlib
+import random
+import logging
+import argparse
+import threading
+import socketserver
+from datetime import datetime, timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+# 交易时段内的分钟（09:31~11:30，13:01~15:00）
+TRADE_MINUTE_LIST = ['%02d:%02d:00' % divmod(minute, 60)
+                     for minute in list(range(9 * 60 + 31, 11 * 60 + 31)) + list(range(13 * 60 + 1, 15 * 60 + 1))]
+
+
+def _hash_value(*args) -> float:
+    """
+    根据参数生成确定的 0~1 之间的数值
+    """
+    return zlib.crc32('|'.join(args).encode('utf-8')) / 0xFFFFFFFF
+
+
+def _split(value, sep=',') -> list:
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in str(value).split(sep) if item.strip() != '']
+
+
+def _parse_datetime(dt_str, default=None) -> datetime:
+    if dt_str is None or dt_str == '':
+        return default
+    dt_str = str(dt_str).strip()
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y%m%d'):
+        try:
+            return datetime.strptime(dt_str[:19], fmt)
+        except ValueError:
+            pass
+    return default
+
+
+def _trade_date_list(begin_dt: datetime, end_dt: datetime) -> list:
+    """
+    模拟交易日：周一至周五
+    """
+    date_list, dt = [], begin_dt.replace(hour=0, minute=0, second=0)
+    while dt <= end_dt:
+        if dt.weekday() < 5:
+            date_list.append(dt.strftime('%Y-%m-%d'))
+        dt += timedelta(days=1)
+    return date_list
+
+
+class MockError(Exception):
+
+    def __init__(self, error_code, message, status=500):
+        super().__init__(message)
+        self.error_code = error_code
+        self.message = message
+        self.status = status
+
+
+class MockDataGenerator:
+    """
+    按请求参数生成模拟数据，wind 接口返回 {行: {字段: 值}}，iFinD 接口返回记录列表
+    """
+
+    def __init__(self, minutes_per_day=240, ticks_per_day=1200):
+        """
+        :param minutes_per_day: wsi、THS_HighFrequenceSequence 每个交易日的分钟数（不超过 240）
+        :param ticks_per_day: wst、THS_Snapshot 每个交易日的 tick 数量
+        """
+        self.minutes_per_day = min(minutes_per_day, len(TRADE_MINUTE_LIST))
+        self.ticks_per_day = ticks_per_day
+
+    @staticmethod
+    def value(code, field, key):
+        """
+        确定的模拟数值：价格类字段在每个代码的基准价附近波动，其他字段为整数
+        """
+        base = 5 + _hash_value(code) * 95
+        field_lower = field.lower()
+        if 'vol' in field_lower or 'amt' in field_lower or 'amount' in field_lower:
+            return int(_hash_value(code, field, key) * 1e6)
+        if 'status' in field_lower:
+            return '交易' if _hash_value(code, key) < 0.97 else '停牌'
+        if 'name' in field_lower:
+            return '证券%s' % code.split('.')[0]
+        return round(base * (0.9 + 0.2 * _hash_value(code, field, key)), 2)
+
+    def minute_list(self, begin_dt, end_dt) -> list:
+        time_list = []
+        for date_str in _trade_date_list(begin_dt, end_dt):
+            for minute_str in TRADE_MINUTE_LIST[:self.minutes_per_day]:
+                time_str = '%s %s' % (date_str, minute_str)
+                if begin_dt.strftime('%Y-%m-%d %H:%M:%S') <= time_str <= end_dt.strftime('%Y-%m-%d %H:%M:%S') \
+                        or (begin_dt.hour == 0 and end_dt.hour == 0):
+                    time_list.append(time_str)
+        return time_list
+
+    def tick_list(self, begin_dt, end_dt) -> list:
+        time_list = []
+        interval = 4 * 3600 / max(self.ticks_per_day, 1)
+        for date_str in _trade_date_list(begin_dt, end_dt):
+            day_dt = datetime.strptime(date_str, '%Y-%m-%d')
+            for num in range(self.ticks_per_day):
+                seconds = num * interval
+                # 上午 2 小时，下午 2 小时
+                dt = day_dt + timedelta(hours=9, minutes=30, seconds=seconds) if seconds < 7200 \
+                    else day_dt + timedelta(hours=13, seconds=seconds - 7200)
+                if begin_dt <= dt <= end_dt or (begin_dt.hour == 0 and end_dt.hour == 0):
+                    time_list.append(dt.strftime('%Y-%m-%d %H:%M:%S'))
+        return time_list
+
+    # wind 接口
+
+    def wss(self, req_dic):
+        field_list = [field.upper() for field in _split(req_dic.get('fields', ''))]
+        return {code: {field: self.value(code, field, req_dic.get('options', '')) for field in field_list}
+                for code in _split(req_dic['codes'])}
+
+    def wsq(self, req_dic):
+        # 实时行情按当前时间（秒）变化
+        time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        field_list = [field.upper() for field in _split(req_dic.get('fields', ''))]
+        return {code: {field: self.value(code, field, time_str) for field in field_list}
+                for code in _split(req_dic['codes'])}
+
+    def wsd(self, req_dic):
+        code_list = _split(req_dic['codes'])
+        field_list = [field.upper() for field in _split(req_dic.get('fields', ''))]
+        if len(code_list) > 1 and len(field_list) > 1:
+            raise MockError(-40522001, '多代码情况下只能查询一个指标', 400)
+        date_list = _trade_date_list(_parse_datetime(req_dic['beginTime']), _parse_datetime(req_dic['endTime']))
+        if len(code_list) == 1:
+            code = code_list[0]
+            return {date_str: {field: self.value(code, field, date_str) for field in field_list}
+                    for date_str in date_list}
+        field = field_list[0]
+        return {date_str: {code: self.value(code, field, date_str) for code in code_list} for date_str in date_list}
+
+    def _intraday(self, req_dic, time_list):
+        code_list = _split(req_dic['codes'])
+        field_list = [field.upper() for field in _split(req_dic.get('fields', ''))]
+        if len(code_list) == 1:
+            code = code_list[0]
+            return {time_str: {field: self.value(code, field, time_str) for field in field_list}
+                    for time_str in time_list}
+        ret_dic = {}
+        for code in code_list:
+            for time_str in time_list:
+                row_dic = {'time': time_str, 'windcode': code}
+                row_dic.update((field, self.value(code, field, time_str)) for field in field_list)
+                ret_dic[str(len(ret_dic))] = row_dic
+        return ret_dic
+
+    def wsi(self, req_dic):
+        return self._intraday(req_dic, self.minute_list(
+            _parse_datetime(req_dic['beginTime']), _parse_datetime(req_dic['endTime'])))
+
+    def wst(self, req_dic):
+        return self._intraday(req_dic, self.tick_list(
+            _parse_datetime(req_dic['beginTime']), _parse_datetime(req_dic['endTime'])))
+
+    def edb(self, req_dic):
+        code_list = _split(req_dic['codes'])
+        date_list = _trade_date_list(_parse_datetime(req_dic['beginTime']), _parse_datetime(req_dic['endTime']))
+        if len(code_list) == 1:
+            # 与 wind 一致，单一代码时列名为指标名称
+            code = code_list[0]
+            return {date_str: {'CLOSE': self.value(code, 'edb', date_str)} for date_str in date_list}
+        return {date_str: {code: self.value(code, 'edb', date_str) for code in code_list} for date_str in date_list}
+
+    def wset(self, req_dic):
+        return {str(num): {'date': datetime.now().strftime('%Y-%m-%d'),
+                           'wind_code': '%06d.SH' % (600000 + num),
+                           'sec_name': '证券%06d' % (600000 + num)}
+                for num in range(300)}
+
+    def tdays(self, req_dic):
+        return {'Date': _trade_date_list(_parse_datetime(req_dic['beginTime']),
+                                         _parse_datetime(req_dic['endTime'], datetime.now()))}
+
+    def tdaysoffset(self, req_dic):
+        offset = int(req_dic['offset'])
+        dt = _parse_datetime(req_dic['beginTime'])
+        step = 1 if offset >= 0 else -1
+        # 与 wind 一致：偏移 0 为不晚于基准日的最近交易日
+        while dt.weekday() >= 5:
+            dt -= timedelta(days=1) if step > 0 else timedelta(days=-1)
+        count = abs(offset)
+        while count > 0:
+            dt += timedelta(days=step)
+            if dt.weekday() < 5:
+                count -= 1
+        return {'Date': dt.strftime('%Y-%m-%d')}
+
+    # iFinD 接口
+
+    def _ifind_records(self, req_dic, time_list, code_key='thscode', indicator_key='jsonIndicator'):
+        indicator_list = _split(req_dic.get(indicator_key, ''), ';')
+        record_list = []
+        for code in _split(req_dic[code_key]):
+            for time_str in time_list:
+                record_dic = {'thscode': code, 'time': time_str}
+                record_dic.update((indicator, self.value(code, indicator, time_str)) for indicator in indicator_list)
+                record_list.append(record_dic)
+        return record_list
+
+    def THS_DateSerial(self, req_dic):
+        return self._ifind_records(req_dic, _trade_date_list(
+            _parse_datetime(req_dic['begintime']), _parse_datetime(req_dic['endtime'])))
+
+    THS_HistoryQuotes = THS_DateSerial
+
+    def THS_HighFrequenceSequence(self, req_dic):
+        return self._ifind_records(req_dic, self.minute_list(
+            _parse_datetime(req_dic['begintime']), _parse_datetime(req_dic['endtime'])))
+
+    def THS_Snapshot(self, req_dic):
+        return self._ifind_records(req_dic, self.tick_list(
+            _parse_datetime(req_dic['begintime']), _parse_datetime(req_dic['endtime'])))
+
+    def THS_RealtimeQuotes(self, req_dic):
+        return self._ifind_records(req_dic, [datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+
+    def THS_BasicData(self, req_dic):
+        indicator_list = _split(req_dic.get('indicatorName', ''), ';')
+        return [dict([('thscode', code)] + [(indicator, self.value(code, indicator, req_dic.get('paramOption', '')))
+                                            for indicator in indicator_list])
+                for code in _split(req_dic['thsCode'])]
+
+    def THS_DataPool(self, req_dic):
+        return [{'thscode': '%06d.SH' % (600000 + num), 'security_name': '证券%06d' % (600000 + num)}
+                for num in range(300)]
+
+    def THS_EDBQuery(self, req_dic):
+        date_list = _trade_date_list(_parse_datetime(req_dic['begintime']), _parse_datetime(req_dic['endtime']))
+        return [{'id': code, 'time': date_str, 'value': self.value(code, 'edb', date_str)}
+                for code in _split(req_dic['indicators']) for date_str in date_list]
+
+    def THS_DateQuery(self, req_dic):
+        return {'time': _trade_date_list(_parse_datetime(req_dic['begintime']),
+                                         _parse_datetime(req_dic['endtime'], datetime.now()))}
+
+
+# 各接口请求参数中的代码字段，用于错误注入
+CODE_KEY_LIST = ['codes', 'thscode', 'thsCode', 'indicators']
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockDIRestServer:
+    """
+    本地 DIRestPlus 模拟服务，例如：
+    with MockDIRestServer(latency=0.02) as server:
+        invoker = WindRestInvoker(server.wind_url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, latency_jitter=0.0, bandwidth=None,
+                 error_rate=0.0, error_code=-40520008, fail_code_set=None, compress=True, seed=0,
+                 minutes_per_day=240, ticks_per_day=1200):
+        """
+        :param host:
+        :param port: 0 为自动选择空闲端口
+        :param latency: 每个请求的固定延迟（秒）
+        :param latency_jitter: 在 latency 基础上增加 [0, latency_jitter) 的随机延迟
+        :param bandwidth: 模拟带宽（字节/秒），按返回数据大小增加延迟，None 为不限制
+        :param error_rate: 随机返回错误的比例
+        :param error_code: 随机返回的错误码，默认为 -40520008 超时错误（可重试）
+        :param fail_code_set: 请求中包含这些代码时总是返回 -40522001 参数错误（不可重试）
+        :param compress: 客户端接受时是否以 gzip 压缩返回数据
+        :param seed: 随机延迟、随机错误的种子
+        :param minutes_per_day: 分钟数据每个交易日的分钟数
+        :param ticks_per_day: tick 数据每个交易日的 tick 数量
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.fail_code_set = set() if fail_code_set is None else set(fail_code_set)
+        self.compress = compress
+        self.generator = MockDataGenerator(minutes_per_day=minutes_per_day, ticks_per_day=ticks_per_day)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._stat_dic = {'request_count': 0, 'error_count': 0, 'response_bytes': 0, 'path_count_dic': {}}
+
+    @property
+    def wind_url(self) -> str:
+        return 'http://%s:%d/wind/' % (self.host, self.port)
+
+    @property
+    def ifind_url(self) -> str:
+        return 'http://%s:%d/iFind/' % (self.host, self.port)
+
+    def handle(self, path: str, req_dic: dict):
+        """
+        处理请求
+        :param path: 例如 /wind/wsd/
+        :param req_dic: 请求参数
+        :return: (status, ret_dic)
+        """
+        path_list = [item for item in path.split('/') if item != '']
+        if len(path_list) != 2 or path_list[0] not in ('wind', 'iFind'):
+            return 404, {'error_code': -1, 'message': '不支持的接口 %s' % path}
+        kind, func_name = path_list
+        is_wind = kind == 'wind'
+        with self._lock:
+            self._stat_dic['request_count'] += 1
+            self._stat_dic['path_count_dic'][path] = self._stat_dic['path_count_dic'].get(path, 0) + 1
+            delay = self.latency + (self._random.random() * self.latency_jitter if self.latency_jitter > 0 else 0)
+            random_error = self.error_rate > 0 and self._random.random() < self.error_rate
+        func = getattr(self.generator, func_name, None) if not func_name.startswith('_') else None
+        try:
+            if func is None or (is_wind and func_name.startswith('THS_')) \
+                    or (not is_wind and not func_name.startswith('THS_')):
+                raise MockError(-40521009 if is_wind else -1, '不支持的接口 %s' % func_name, 404)
+            if len(self.fail_code_set) > 0:
+                for key in CODE_KEY_LIST:
+                    if key in req_dic and len(self.fail_code_set.intersection(_split(req_dic[key]))) > 0:
+                        raise MockError(-40522001, '代码错误', 400)
+            if random_error:
+                raise MockError(self.error_code, '模拟错误')
+            ret_dic = func(req_dic)
+            status = 200
+        except MockError as exp:
+            with self._lock:
+                self._stat_dic['error_count'] += 1
+            status = exp.status
+            ret_dic = {'error_code' if is_wind else 'errcode': exp.error_code, 'message': exp.message}
+        except (KeyError, ValueError, TypeError, AttributeError) as exp:
+            with self._lock:
+                self._stat_dic['error_count'] += 1
+            status = 400
+            ret_dic = {'error_code' if is_wind else 'errcode': -40522001, 'message': '参数错误：%s' % exp}
+        if delay > 0:
+            time.sleep(delay)
+        return status, ret_dic
+
+    def _make_handler(self):
+        server = self
+
+        class MockHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # header 与 body 分开发送，避免 Nagle 算法与 delayed ACK 叠加产生 40ms 延迟
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Content-Encoding', '') == 'gzip':
+                    data = gzip.decompress(data)
+                try:
+                    req_dic = json.loads(data.decode('utf-8')) if len(data) > 0 else {}
+                except ValueError:
+                    req_dic = None
+                if not isinstance(req_dic, dict):
+                    status, ret_dic = 400, {'error_code': -40521009, 'message': '数据解码失败'}
+                else:
+                    status, ret_dic = server.handle(self.path, req_dic)
+                data = json.dumps(ret_dic, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if server.compress and len(data) >= 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    data = gzip.compress(data, compresslevel=1)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if server.bandwidth is not None:
+                    time.sleep(len(data) / server.bandwidth)
+                self.wfile.write(data)
+                with server._lock:
+                    server._stat_dic['response_bytes'] += len(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return MockHandler
+
+    def start(self):
+        """
+        在后台线程启动服务
+        :return: self
+        """
+        self._server = _ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock_server', daemon=True)
+        self._thread.start()
+        logger.info('DIRestPlus 模拟服务已启动 %s %s', self.wind_url, self.ifind_url)
+        return self
+
+    def serve_forever(self):
+        self._server = _ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self._server.server_address[1]
+        logger.info('DIRestPlus 模拟服务已启动 %s %s', self.wind_url, self.ifind_url)
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stat_dic = self._stat_dic.copy()
+            stat_dic['path_count_dic'] = stat_dic['path_count_dic'].copy()
+        return stat_dic
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 DIRestPlus 模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='随机延迟上限（秒）')
+    parser.add_argument('--bandwidth', type=float, default=None, help='模拟带宽（字节/秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回错误的比例')
+    parser.add_argument('--error-code', type=int, default=-40520008, help='随机返回的错误码')
+    parser.add_argument('--fail-codes', default='', help='总是返回参数错误的代码，以 "," 分隔')
+    parser.add_argument('--minutes-per-day', type=int, default=240)
+    parser.add_argument('--ticks-per-day', type=int, default=1200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    MockDIRestServer(host=args.host, port=args.port, latency=args.latency, latency_jitter=args.latency_jitter,
+                     bandwidth=args.bandwidth, error_rate=args.error_rate, error_code=args.error_code,
+                     fail_code_set=_split(args.fail_codes), seed=args.seed,
+                     minutes_per_day=args.minutes_per_day, ticks_per_day=args.ticks_per_day).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
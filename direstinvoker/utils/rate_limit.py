@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/5 10:20
+@File    : rate_limit.py
+@contact : mmmaaaggg@163.com
+@desc    : 按接口路径的令牌桶限流
+同时限制每秒请求次数及每秒数据点数，多线程、多协程共用，服务器返回限流或超额错误时自动降低速率
+"""
+import time
+import asyncio
+import logging
+import threading
+from direstinvoker import APIError
+
+logger = logging.getLogger(__name__)
+# 服务器返回的限流、数据量超额错误码，例如 -40522017 数据提取量超限
+THROTTLE_ERROR_CODE_SET = {-40522017}
+# 限流对应的 HTTP 状态码
+THROTTLE_STATUS_SET = {429, 503}
+
+
+class TokenBucket:
+    """
+    令牌桶，允许预支令牌（余额为负），之后的请求等待余额恢复
+    调用方负责加锁
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: 每秒补充令牌数量
+        :param capacity: 令牌桶容量，即允许的突发数量，默认为 rate（不小于 1）
+        """
+        self.rate = rate
+        self.capacity = max(rate, 1) if capacity is None else capacity
+        self.tokens = self.capacity
+        self.update_time = time.time()
+
+    def reserve(self, count, rate, now) -> float:
+        """
+        预支 count 个令牌
+        :param count:
+        :param rate: 当前实际补充速率（自适应降速后）
+        :param now:
+        :return: 需要等待的秒数
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.update_time) * rate)
+        self.update_time = now
+        self.tokens -= count
+        if self.tokens >= 0:
+            return 0.0
+        # count 为 0 时仅等待之前的预支恢复
+        return -self.tokens / rate
+
+
+class RateLimiter:
+    """
+    线程安全且可用于 asyncio 的限流器，等待时间在锁内计算，在锁外 sleep
+    每次请求前按请求次数预支令牌，请求完成后按实际返回的数据点数扣除数据点令牌
+    服务器返回限流错误时，速率减半并暂停该接口一段时间，之后每次成功请求逐步恢复速率
+    """
+
+    def __init__(self, rate_dic=None, points_rate_dic=None, default_rate=None, default_points_rate=None,
+                 min_rate_ratio=0.05, recover_step=0.05, cooldown=1.0, max_cooldown=60.0,
+                 throttle_error_code_set=None):
+        """
+        :param rate_dic: 各接口每秒请求次数上限，例如 {'wsd/': 5, 'wsi/': 2}
+        :param points_rate_dic: 各接口每秒数据点数上限，例如 {'wsd/': 100000}
+        :param default_rate: 未在 rate_dic 中设置的接口的每秒请求次数上限，None 为不限制
+        :param default_points_rate: 未在 points_rate_dic 中设置的接口的每秒数据点数上限，None 为不限制
+        :param min_rate_ratio: 自适应降速的最低比例
+        :param recover_step: 每次成功请求后速率比例的恢复步长
+        :param cooldown: 收到限流错误后该接口暂停的秒数，连续限流时加倍
+        :param max_cooldown: 暂停秒数上限
+        :param throttle_error_code_set: 视为限流的错误码，默认为 THROTTLE_ERROR_CODE_SET
+        """
+        self.rate_dic = {} if rate_dic is None else rate_dic
+        self.points_rate_dic = {} if points_rate_dic is None else points_rate_dic
+        self.default_rate = default_rate
+        self.default_points_rate = default_points_rate
+        self.min_rate_ratio = min_rate_ratio
+        self.recover_step = recover_step
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.throttle_error_code_set = THROTTLE_ERROR_CODE_SET if throttle_error_code_set is None \
+            else throttle_error_code_set
+        self._lock = threading.Lock()
+        # path -> [req_bucket, points_bucket, rate_ratio, pause_until, throttle_count]
+        self._state_dic = {}
+        self._stat_dic = {'wait_count': 0, 'wait_time': 0.0, 'throttled_count': 0}
+
+    def _get_state(self, path) -> list:
+        state = self._state_dic.get(path, None)
+        if state is None:
+            rate = self.rate_dic.get(path, self.default_rate)
+            points_rate = self.points_rate_dic.get(path, self.default_points_rate)
+            state = [None if rate is None else TokenBucket(rate),
+                     None if points_rate is None else TokenBucket(points_rate),
+                     1.0, 0.0, 0]
+            self._state_dic[path] = state
+        return state
+
+    def _reserve(self, path, count=1) -> float:
+        """
+        预支一次请求，返回需要等待的秒数
+        """
+        now = time.time()
+        with self._lock:
+            req_bucket, points_bucket, rate_ratio, pause_until, _ = self._get_state(path)
+            delay = max(0.0, pause_until - now)
+            if req_bucket is not None:
+                delay = max(delay, req_bucket.reserve(count, req_bucket.rate * rate_ratio, now))
+            if points_bucket is not None:
+                delay = max(delay, points_bucket.reserve(0, points_bucket.rate * rate_ratio, now))
+            if delay > 0:
+                self._stat_dic['wait_count'] += 1
+                self._stat_dic['wait_time'] += delay
+        return delay
+
+    def acquire(self, path):
+        """
+        请求前调用，必要时阻塞等待
+        :param path:
+        :return:
+        """
+        delay = self._reserve(path)
+        if delay > 0:
+            logger.debug('%s 限流等待 %.3fs', path, delay)
+            time.sleep(delay)
+
+    async def acquire_async(self, path):
+        """
+        acquire 的协程版本
+        :param path:
+        :return:
+        """
+        delay = self._reserve(path)
+        if delay > 0:
+            logger.debug('%s 限流等待 %.3fs', path, delay)
+            await asyncio.sleep(delay)
+
+    def consume_points(self, path, points):
+        """
+        请求完成后按实际返回的数据点数扣除令牌
+        :param path:
+        :param points:
+        :return:
+        """
+        if points <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            state = self._get_state(path)
+            points_bucket = state[1]
+            if points_bucket is not None:
+                points_bucket.reserve(points, points_bucket.rate * state[2], now)
+
+    def is_throttle_error(self, exp) -> bool:
+        return isinstance(exp, APIError) and (
+            exp.status in THROTTLE_STATUS_SET or exp.error_code in self.throttle_error_code_set)
+
+    def on_success(self, path):
+        with self._lock:
+            state = self._get_state(path)
+            state[2] = min(1.0, state[2] + self.recover_step)
+            state[4] = 0
+
+    def on_throttled(self, path):
+        """
+        收到限流错误，降低速率并暂停该接口
+        :param path:
+        :return:
+        """
+        with self._lock:
+            state = self._get_state(path)
+            rate_ratio = state[2] = max(self.min_rate_ratio, state[2] / 2)
+            cooldown = min(self.max_cooldown, self.cooldown * 2 ** state[4])
+            state[3] = max(state[3], time.time() + cooldown)
+            state[4] += 1
+            self._stat_dic['throttled_count'] += 1
+        logger.warning('%s 触发服务器限流，速率降低至 %.0f%%，暂停 %.1fs', path, rate_ratio * 100, cooldown)
+
+    def get_stats(self) -> dict:
+        """
+        :return: wait_count 等待次数，wait_time 累计等待时间，throttled_count 服务器限流次数，rate_ratio 各接口当前速率比例
+        """
+        with self._lock:
+            stat_dic = self._stat_dic.copy()
+            stat_dic['rate_ratio'] = {path: state[2] for path, state in self._state_dic.items()}
+        return stat_dic
@@ -0,0 +1,273 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/18 10:05
+@File    : replay.py
+@contact : mmmaaaggg@163.com
+@desc    : 请求录制、回放，用于无法访问 DIRestPlus 的回测、CI 环境
+录制模式下将每个 (path, 请求数据) 及返回的状态码、数据追加保存到数据文件（zlib 压缩），关闭时生成按 key 排序的索引文件；
+回放模式下通过 mmap 在索引文件中二分查找，仅读取命中的记录，不需要将整个文件载入内存
+数据文件 <file_path>.dat：[记录头 (key, status, key 长度, 数据长度)][path\n请求数据][压缩后的返回数据] ...
+索引文件 <file_path>.idx：[文件头][(key, 数据偏移, 数据长度, status)] ...，按 key 排序
+"""
+import os
+import mmap
+import json
+import zlib
+import atexit
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from direstinvoker import APIError
+
+logger = logging.getLogger(__name__)
+RECORD = 'record'
+REPLAY = 'replay'
+INDEX_MAGIC = b'DIRI'
+INDEX_VERSION = 1
+# 文件头：magic、版本、记录数
+INDEX_HEADER = struct.Struct('>4sII')
+# 索引项：sha1 key、数据偏移、数据长度、HTTP 状态码
+INDEX_ENTRY = struct.Struct('>20sQII')
+# 数据文件记录头：sha1 key、HTTP 状态码、path 及请求数据长度、压缩后的返回数据长度
+RECORD_HEADER = struct.Struct('>20sIII')
+
+
+class ReplayMissError(APIError):
+    """
+    回放模式下请求不在录制文件中
+    """
+
+    def __init__(self, path, req_data):
+        super().__init__(404, {'message': '录制文件中没有该请求 %s %s' % (path, req_data)})
+        self.path = path
+        self.req_data = req_data
+
+
+class ReplayResponse:
+    """
+    回放的返回数据，与 requests.Response 的 status_code、content 属性一致
+    """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+def make_key(path: str, req_data) -> tuple:
+    """
+    :return: (sha1 key, 'path\\n排序后的请求 json')
+    """
+    if isinstance(req_data, bytes):
+        req_data = req_data.decode('utf-8')
+    try:
+        req_data = json.dumps(json.loads(req_data), sort_keys=True, ensure_ascii=False)
+    except (ValueError, TypeError):
+        pass
+    key_str = '%s\n%s' % (path, req_data)
+    return hashlib.sha1(key_str.encode('utf-8')).digest(), key_str
+
+
+class ReplayArchive:
+    """
+    请求录制、回放文件，例如：
+    录制：invoker = WindRestInvoker(url_str, archive=ReplayArchive('wind_archive', RECORD))
+    回放：invoker = WindRestInvoker(url_str, archive=ReplayArchive('wind_archive', REPLAY))
+    """
+
+    def __init__(self, file_path, mode=REPLAY):
+        """
+        :param file_path: 录制文件路径（不含扩展名），数据文件为 file_path.dat，索引文件为 file_path.idx
+        :param mode: RECORD 录制（追加到已有的录制文件），REPLAY 回放
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError('mode 必须为 %s 或 %s' % (RECORD, REPLAY))
+        self.file_path = file_path
+        self.mode = mode
+        self.data_file_path = file_path + '.dat'
+        self.index_file_path = file_path + '.idx'
+        self._lock = threading.Lock()
+        self._miss_dic = OrderedDict()
+        self._stat_dic = {'record_count': 0, 'hit_count': 0, 'miss_count': 0}
+        self._data_file = None
+        self._data_mmap = None
+        self._index_mmap = None
+        self._entry_count = 0
+        # 录制模式下的索引 key -> (偏移, 长度, status)，同一请求多次录制时保留最后一次
+        self._index_dic = None
+        if mode == RECORD:
+            self._open_record()
+        else:
+            self._open_replay()
+
+    def _open_record(self):
+        folder_path = os.path.dirname(os.path.abspath(self.data_file_path))
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+        self._index_dic = self._scan_data_file() if os.path.exists(self.data_file_path) else {}
+        self._data_file = open(self.data_file_path, 'ab')
+        atexit.register(self.close)
+
+    def _scan_data_file(self) -> dict:
+        """
+        扫描数据文件重建索引（追加录制，或索引文件丢失时）
+        """
+        index_dic = {}
+        with open(self.data_file_path, 'rb') as file:
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                key, status, key_len, data_len = RECORD_HEADER.unpack(header)
+                offset = file.tell() + key_len
+                file.seek(key_len + data_len, os.SEEK_CUR)
+                if file.tell() > os.fstat(file.fileno()).st_size:
+                    # 最后一条记录未写完整
+                    logger.warning('%s 最后一条记录不完整，已忽略', self.data_file_path)
+                    break
+                index_dic[key] = (offset, data_len, status)
+        return index_dic
+
+    def _open_replay(self):
+        if not os.path.exists(self.data_file_path):
+            raise FileNotFoundError('录制文件 %s 不存在' % self.data_file_path)
+        if not os.path.exists(self.index_file_path) \
+                or os.path.getmtime(self.index_file_path) < os.path.getmtime(self.data_file_path):
+            # 索引文件不存在或早于数据文件（录制时未正常关闭）时重建
+            logger.warning('%s 索引文件不存在或已过期，重新生成', self.index_file_path)
+            self._write_index(self._scan_data_file())
+        with open(self.data_file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size > 0:
+                self._data_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.index_file_path, 'rb') as file:
+            self._index_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._entry_count = INDEX_HEADER.unpack_from(self._index_mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError('%s 不是有效的索引文件' % self.index_file_path)
+
+    def _write_index(self, index_dic: dict):
+        tmp_file_path = self.index_file_path + '.tmp'
+        with open(tmp_file_path, 'wb') as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(index_dic)))
+            for key in sorted(index_dic.keys()):
+                offset, data_len, status = index_dic[key]
+                file.write(INDEX_ENTRY.pack(key, offset, data_len, status))
+        os.replace(tmp_file_path, self.index_file_path)
+
+    def record(self, path: str, req_data, status_code: int, content: bytes):
+        """
+        录制一次请求
+        :param path:
+        :param req_data: 请求数据
+        :param status_code: HTTP 状态码
+        :param content: 返回的数据（解压后）
+        :return:
+        """
+        key, key_str = make_key(path, req_data)
+        key_bytes = key_str.encode('utf-8')
+        data = zlib.compress(content)
+        with self._lock:
+            if self._data_file is None:
+                raise ValueError('录制文件已关闭')
+            offset = self._data_file.tell() + RECORD_HEADER.size + len(key_bytes)
+            self._data_file.write(RECORD_HEADER.pack(key, status_code, len(key_bytes), len(data)))
+            self._data_file.write(key_bytes)
+            self._data_file.write(data)
+            self._data_file.flush()
+            self._index_dic[key] = (offset, len(data), status_code)
+            self._stat_dic['record_count'] += 1
+
+    def _find(self, key: bytes):
+        """
+        在索引文件中二分查找
+        :return: (偏移, 长度, status)，没有找到时返回 None
+        """
+        low, high = 0, self._entry_count
+        header_size, entry_size = INDEX_HEADER.size, INDEX_ENTRY.size
+        while low < high:
+            mid = (low + high) // 2
+            entry_offset = header_size + mid * entry_size
+            mid_key = self._index_mmap[entry_offset:entry_offset + 20]
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                _, offset, data_len, status = INDEX_ENTRY.unpack_from(self._index_mmap, entry_offset)
+                return offset, data_len, status
+        return None
+
+    def replay(self, path: str, req_data) -> ReplayResponse:
+        """
+        回放一次请求
+        :param path:
+        :param req_data:
+        :return: ReplayResponse，没有录制该请求时抛出 ReplayMissError
+        """
+        key, key_str = make_key(path, req_data)
+        found = self._find(key) if self._entry_count > 0 else None
+        if found is None:
+            with self._lock:
+                self._stat_dic['miss_count'] += 1
+                self._miss_dic[key_str] = self._miss_dic.get(key_str, 0) + 1
+            logger.warning('录制文件中没有该请求 %s %s', path, req_data)
+            raise ReplayMissError(path, req_data)
+        offset, data_len, status = found
+        content = zlib.decompress(self._data_mmap[offset:offset + data_len])
+        with self._lock:
+            self._stat_dic['hit_count'] += 1
+        return ReplayResponse(status, content)
+
+    def get_misses(self) -> list:
+        """
+        回放模式下没有命中的请求
+        :return: [(path, 请求数据, 次数)]
+        """
+        with self._lock:
+            return [tuple(key_str.split('\n', 1)) + (count,) for key_str, count in self._miss_dic.items()]
+
+    def get_stats(self) -> dict:
+        """
+        :return: record_count 录制次数，hit_count 回放命中次数，miss_count 回放未命中次数，entry_count 录制的请求数量
+        """
+        with self._lock:
+            stat_dic = self._stat_dic.copy()
+            stat_dic['entry_count'] = len(self._index_dic) if self.mode == RECORD else self._entry_count
+        return stat_dic
+
+    def flush(self):
+        """
+        录制模式下生成索引文件
+        """
+        if self.mode != RECORD:
+            return
+        with self._lock:
+            if self._data_file is not None:
+                self._data_file.flush()
+                self._write_index(self._index_dic)
+
+    def close(self):
+        if self.mode == RECORD:
+            self.flush()
+            with self._lock:
+                if self._data_file is not None:
+                    self._data_file.close()
+                    self._data_file = None
+            atexit.unregister(self.close)
+        else:
+            if self._miss_dic:
+                logger.warning('回放未命中 %d 个请求：\n%s', len(self._miss_dic), '\n'.join(
+                    '%s %s (%d 次)' % item for item in self.get_misses()))
+            for mmap_obj in (self._data_mmap, self._index_mmap):
+                if mmap_obj is not None:
+                    mmap_obj.close()
+            self._data_mmap, self._index_mmap, self._entry_count = None, None, 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/6 9:30
+@File    : retry.py
+@contact : mmmaaaggg@163.com
+@desc    : 按 DIRestPlus 错误码分类的重试策略
+错误分为 可重试、无数据、不可重试 三类，可重试错误按指数退避（带随机抖动）重试，
+每次接口调用（包括其全部分段请求）共用一个重试预算；无数据错误默认仍抛出 APIError，no_data_as_empty=True 时视为空数据返回
+"""
+import random
+import asyncio
+import logging
+import threading
+import requests
+from direstinvoker import APIError
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+# 错误分类
+RETRYABLE = 'retryable'
+NO_DATA = 'no_data'
+FATAL = 'fatal'
+# DIRestPlus 错误码分类表
+ERROR_CODE_CATEGORY_DIC = {
+    -4001: NO_DATA,  # DIRestPlus 未返回数据
+    -40520001: RETRYABLE,  # 未知错误
+    -40520002: RETRYABLE,  # 内部错误
+    -40520003: RETRYABLE,  # 系统错误
+    -40520005: FATAL,  # 无权限
+    -40520007: NO_DATA,  # 没有可用数据
+    -40520008: RETRYABLE,  # 超时错误
+    -40521009: FATAL,  # 数据解码失败，请检查输入参数
+    -40521010: RETRYABLE,  # 网络超时
+    -40522001: FATAL,  # 函数参数错误
+    # 数据提取量超限，配额在较长时间后才会恢复，短时间内重试没有意义，由 rate_limiter 暂停该接口
+    -40522017: FATAL,
+}
+# 网络连接、超时类异常视为可重试
+RETRYABLE_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        ConnectionError, TimeoutError, asyncio.TimeoutError)
+if aiohttp is not None:
+    RETRYABLE_EXCEPTIONS += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+
+class RetryBudget:
+    """
+    一次接口调用的重试预算，各分段请求共用，线程安全
+    """
+
+    def __init__(self, budget):
+        self.remaining = budget
+        self._lock = threading.Lock()
+
+    def try_consume(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    重试策略，可在多个 invoker 之间共用
+    """
+
+    def __init__(self, max_retries=3, budget=10, base_delay=0.5, max_delay=30.0, error_code_category_dic=None,
+                 no_data_as_empty=False):
+        """
+        :param max_retries: 单个请求（分段）最大重试次数
+        :param budget: 每次接口调用（包括其全部分段请求）的重试总次数上限，None 为不限制
+        :param base_delay: 第一次重试前的等待秒数，之后每次加倍
+        :param max_delay: 重试前等待秒数上限
+        :param error_code_category_dic: 补充或覆盖 ERROR_CODE_CATEGORY_DIC 中的错误码分类
+        :param no_data_as_empty: 无数据错误（-4001、-40520007 等）是否视为空数据返回，默认 False 仍抛出 APIError
+        """
+        self.max_retries = max_retries
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.no_data_as_empty = no_data_as_empty
+        self.error_code_category_dic = ERROR_CODE_CATEGORY_DIC.copy()
+        if error_code_category_dic is not None:
+            self.error_code_category_dic.update(error_code_category_dic)
+        self._lock = threading.Lock()
+        self._stat_dic = {'retry_count': 0, 'no_data_count': 0, 'give_up_count': 0}
+
+    def new_budget(self) -> RetryBudget:
+        return None if self.budget is None else RetryBudget(self.budget)
+
+    def classify(self, exp) -> str:
+        """
+        错误分类
+        :param exp:
+        :return: RETRYABLE、NO_DATA、FATAL
+        """
+        if isinstance(exp, APIError):
+            error_code = exp.error_code
+            if error_code in self.error_code_category_dic:
+                return self.error_code_category_dic[error_code]
+            # 未知错误码按 HTTP 状态码判断，5xx 且未返回错误码视为服务端临时错误
+            if error_code is None and isinstance(exp.status, int) and exp.status >= 500:
+                return RETRYABLE
+            return FATAL
+        if isinstance(exp, RETRYABLE_EXCEPTIONS):
+            return RETRYABLE
+        return FATAL
+
+    def get_delay(self, retry_count) -> float:
+        """
+        指数退避，并在 [50%, 100%] 范围内随机抖动，避免多个请求同时重试
+        :param retry_count: 已重试次数
+        :return:
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** retry_count)
+        return delay * random.uniform(0.5, 1.0)
+
+    def check(self, exp, retry_count, retry_budget: RetryBudget = None):
+        """
+        根据错误类型、已重试次数及重试预算决定如何处理
+        :param exp:
+        :param retry_count: 当前请求已重试次数
+        :param retry_budget: 本次接口调用的重试预算
+        :return: (category, delay) category 为 NO_DATA 时应视为空数据返回，为 RETRYABLE 时 delay 秒后重试，
+        为 FATAL 时应抛出异常；no_data_as_empty 为 False 时无数据错误返回 FATAL
+        """
+        category = self.classify(exp)
+        if category == NO_DATA:
+            with self._lock:
+                self._stat_dic['no_data_count'] += 1
+            return (NO_DATA if self.no_data_as_empty else FATAL), None
+        if category == RETRYABLE:
+            if retry_count < self.max_retries and (retry_budget is None or retry_budget.try_consume()):
+                with self._lock:
+                    self._stat_dic['retry_count'] += 1
+                return RETRYABLE, self.get_delay(retry_count)
+            with self._lock:
+                self._stat_dic['give_up_count'] += 1
+        return FATAL, None
+
+    def get_stats(self) -> dict:
+        """
+        :return: retry_count 重试次数，no_data_count 无数据次数，give_up_count 超过重试次数或预算后放弃的次数
+        """
+        with self._lock:
+            return self._stat_dic.copy()
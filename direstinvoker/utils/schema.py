@@ -0,0 +1,236 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/10 9:50
+@File    : schema.py
+@contact : mmmaaaggg@163.com
+@desc    : 字段类型注册表，按列构建 DataFrame 时每个字段只确定一次数据类型
+已注册的字段按注册的类型转换，未注册的字段根据第一个非空值推断：数值为 float64/int64，日期时间字符串为 datetime64，
+其他字符串保持 object 类型（INFER_CATEGORY 为 True 时重复值较多的字符串推断为 category）
+"""
+import re
+import logging
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+logger = logging.getLogger(__name__)
+# 字段类型注册表，字段名称不区分大小写
+FIELD_DTYPE_DIC = {
+    'OPEN': 'float64',
+    'HIGH': 'float64',
+    'LOW': 'float64',
+    'CLOSE': 'float64',
+    'PRE_CLOSE': 'float64',
+    'SETTLE': 'float64',
+    'VOLUME': 'float64',
+    'AMT': 'float64',
+    'OI': 'float64',
+    'VWAP': 'float64',
+    'CHG': 'float64',
+    'PCT_CHG': 'float64',
+    'LAST': 'float64',
+    'RT_LAST': 'float64',
+    'TRADE_STATUS': 'category',
+    'WINDCODE': 'category',
+    'TRADE_DT': 'datetime64[ns]',
+}
+# compact 时按小数位数比较可转换为 float32 的价格、成交量类字段，字段名称不区分大小写
+# 其他 float 列（比率、复权因子、EDB 指标等）仅在转换为 float32 后数值完全不变时转换
+FLOAT32_FIELD_SET = {
+    'OPEN', 'HIGH', 'LOW', 'CLOSE', 'PRE_CLOSE', 'PRECLOSE', 'SETTLE', 'PRE_SETTLE', 'VWAP', 'AVGPRICE',
+    'LAST', 'RT_LAST', 'LATEST', 'ASK1', 'BID1', 'VOLUME', 'AMT', 'AMOUNT', 'OI',
+}
+# 字符串中不重复值的比例不超过该值时转换为 category
+CATEGORY_UNIQUE_RATIO = 0.5
+# 构建 DataFrame 时是否将未注册的、重复值较多的字符串字段推断为 category，默认 False 保持 object 类型
+INFER_CATEGORY = False
+PATTERN_DATETIME_STR = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+
+def register_field_dtype(field_dtype_dic: dict):
+    """
+    注册字段类型，例如 register_field_dtype({'MKT_CAP_ARD': 'float64', 'INDUSTRY_GICS': 'category'})
+    :param field_dtype_dic: 字段名称 -> 'float64'、'int64'、'datetime64[ns]'、'category'、'str'、'bool'
+    :return:
+    """
+    for field, dtype in field_dtype_dic.items():
+        FIELD_DTYPE_DIC[field.upper()] = dtype
+
+
+def get_field_dtype(field) -> str:
+    return FIELD_DTYPE_DIC.get(field.upper(), None) if isinstance(field, str) else None
+
+
+def _convert(value_list: list, dtype: str, errors='coerce'):
+    if dtype == 'datetime64[ns]':
+        return pd.to_datetime(value_list, errors=errors)
+    elif dtype == 'category':
+        return pd.Categorical(value_list)
+    elif dtype == 'str':
+        return np.array(value_list, dtype=object)
+    elif dtype == 'int64' and None in value_list:
+        # 有缺失值时无法保存为 int64
+        dtype = 'float64'
+    try:
+        return np.array(value_list, dtype=dtype)
+    except (ValueError, TypeError):
+        if errors != 'coerce' or dtype not in ('float64', 'int64'):
+            raise
+        return pd.to_numeric(pd.Series(value_list), errors='coerce').values.astype('float64')
+
+
+def infer_dtype(value_list: list, infer_category=None) -> str:
+    """
+    根据第一个非空值推断字段类型
+    :param value_list:
+    :param infer_category: 是否将重复值较多的字符串推断为 category，None 则使用 INFER_CATEGORY
+    :return: 无法推断时返回 None
+    """
+    sample = next((value for value in value_list if value is not None), None)
+    if sample is None:
+        return 'float64'
+    if isinstance(sample, bool):
+        return 'bool' if None not in value_list else None
+    if isinstance(sample, int):
+        # 混有浮点数或缺失值时为 float64
+        return 'int64' if all(type(value) is int for value in value_list) else 'float64'
+    if isinstance(sample, float):
+        return 'float64'
+    if isinstance(sample, str):
+        if PATTERN_DATETIME_STR.match(sample) is not None:
+            return 'datetime64[ns]'
+        if infer_category is None:
+            infer_category = INFER_CATEGORY
+        if infer_category and len(set(value_list)) <= len(value_list) * CATEGORY_UNIQUE_RATIO:
+            return 'category'
+        return 'str'
+    return None
+
+
+def build_column(field, value_list: list):
+    """
+    将某一字段的值列表转换为对应类型的数组
+    :param field: 字段名称
+    :param value_list: 值列表，缺失值为 None
+    :return:
+    """
+    dtype = get_field_dtype(field)
+    # 注册的类型无法转换的值置为空值，推断的类型无法转换时由 pandas 推断
+    errors = 'coerce'
+    if dtype is None:
+        dtype = infer_dtype(value_list)
+        errors = 'raise'
+    if dtype is not None:
+        try:
+            return _convert(value_list, dtype, errors)
+        except (ValueError, TypeError):
+            # 类型不一致（例如数值字段中混有字符串）时由 pandas 推断
+            pass
+    return pd.Series(value_list).infer_objects().values
+
+
+def to_datetime_index(index_list: list) -> pd.Index:
+    """
+    时间序列接口的 index 转换为 DatetimeIndex，无法转换时保持原样
+    :param index_list:
+    :return:
+    """
+    # 仅转换日期时间字符串，避免将整数等 index 误转换为时间戳
+    if len(index_list) == 0 or not isinstance(index_list[0], str) or PATTERN_DATETIME_STR.match(index_list[0]) is None:
+        return pd.Index(index_list)
+    try:
+        return pd.DatetimeIndex(pd.to_datetime(index_list))
+    except (ValueError, TypeError):
+        return pd.Index(index_list)
+
+
+def restore_categorical(df: pd.DataFrame, df_list: list) -> pd.DataFrame:
+    """
+    各分段中 categories 不同的 category 列合并后会变为 object 类型，重新转换为 category
+    :param df: 合并后的 DataFrame
+    :param df_list: 合并前的 DataFrame 列表
+    :return:
+    """
+    for col_name in df.columns:
+        if isinstance(df[col_name].dtype, CategoricalDtype):
+            continue
+        if any(col_name in sub_df.columns and isinstance(sub_df[col_name].dtype, CategoricalDtype)
+               for sub_df in df_list):
+            df[col_name] = df[col_name].astype('category')
+    return df
+
+
+def _memory_usage(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compact_df(df: pd.DataFrame, float_decimals=4) -> pd.DataFrame:
+    """
+    在不损失精度的前提下压缩 DataFrame 的内存占用：
+    int 列及未注册字段中没有空值的整数值 float 列转换为能容纳全部数值的最小整数类型，
+    FLOAT32_FIELD_SET 中或注册为 float 类型的字段即使数值均为整数（例如 CLOSE=10.0）仍保持 float 类型；
+    FLOAT32_FIELD_SET 中的价格、成交量列按 float_decimals 位小数比较与 float64 一致时转换为 float32，
+    其他 float 列仅在转换为 float32 后数值完全不变时转换；
+    不重复值比例不超过 CATEGORY_UNIQUE_RATIO 的字符串列转换为 category
+    :param df:
+    :param float_decimals: 价格、成交量列转换为 float32 时需保持一致的小数位数
+    :return: 新的 DataFrame
+    """
+    if not isinstance(df, pd.DataFrame) or df.shape[0] == 0:
+        return df
+    memory_before = _memory_usage(df) if logger.isEnabledFor(logging.DEBUG) else None
+    column_dic = {}
+    # object 类型的数值列先转换为数值类型
+    for num, (col_name, col_s) in enumerate(df.infer_objects().items()):
+        kind = col_s.dtype.kind
+        if kind == 'f':
+            values = col_s.values
+            has_nan = np.isnan(values).any()
+            decimals = float_decimals if isinstance(col_name, str) and col_name.upper() in FLOAT32_FIELD_SET \
+                else None
+            is_float_field = decimals is not None or get_field_dtype(col_name) in ('float64', 'float32')
+            if not is_float_field and not has_nan and np.array_equal(values, np.floor(values)):
+                col_s = pd.to_numeric(col_s, downcast='integer')
+                # 超出 int64 范围等情况下 downcast 保持 float64
+                if col_s.dtype.kind == 'f':
+                    col_s = _downcast_float(col_s, decimals)
+            else:
+                col_s = _downcast_float(col_s, decimals)
+        elif kind in ('i', 'u'):
+            col_s = pd.to_numeric(col_s, downcast='integer' if kind == 'i' else 'unsigned')
+        elif kind in ('O', 'U', 'T') or pd.api.types.is_string_dtype(col_s.dtype):
+            try:
+                if not isinstance(col_s.dtype, CategoricalDtype) \
+                        and col_s.nunique(dropna=True) <= col_s.shape[0] * CATEGORY_UNIQUE_RATIO:
+                    col_s = col_s.astype('category')
+            except TypeError:
+                # 含有 list、dict 等不可 hash 的值
+                pass
+        column_dic[num] = col_s
+    compacted_df = pd.DataFrame(column_dic, index=df.index)
+    compacted_df.columns = df.columns
+    if memory_before is not None:
+        logger.debug('compact 内存占用 %d -> %d 字节', memory_before, _memory_usage(compacted_df))
+    return compacted_df
+
+
+def _downcast_float(col_s: pd.Series, float_decimals=None) -> pd.Series:
+    """
+    :param col_s: float64 列
+    :param float_decimals: 按该小数位数比较转换前后的数值，None 则要求转换前后数值完全一致
+    :return:
+    """
+    values = col_s.values
+    values_32 = values.astype('float32')
+    values_back = values_32.astype('float64')
+    if float_decimals is None:
+        if ((values_back == values) | (np.isnan(values_back) & np.isnan(values))).all():
+            return pd.Series(values_32, index=col_s.index, name=col_s.name)
+        return col_s
+    finite = np.isfinite(values)
+    if np.array_equal(np.isfinite(values_back), finite) \
+            and np.array_equal(np.round(values_back[finite], float_decimals), np.round(values[finite], float_decimals)):
+        return pd.Series(values_32, index=col_s.index, name=col_s.name)
+    return col_s
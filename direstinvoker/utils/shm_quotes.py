@@ -0,0 +1,351 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/20 10:15
+@File    : shm_quotes.py
+@contact : mmmaaaggg@163.com
+@desc    : 实时行情共享内存分发，一个发布进程轮询 wsq / THS_RealtimeQuotes 并将最新行情写入共享内存，
+本机多个策略进程通过 QuoteReader 直接读取，上游请求量与读取进程数量无关
+共享内存为 /dev/shm（不存在时为临时目录）下的文件，通过 mmap 映射，布局固定：
+[文件头 64 字节][指标名称 field_count x 32 字节][代码 capacity x 32 字节][行情 capacity x field_count float64]
+写入时通过 seqlock 保证读取的一致性：写入前后 seq 各加 1，seq 为奇数时表示正在写入，读取前后 seq 不一致时重新读取
+"""
+import os
+import mmap
+import time
+import struct
+import logging
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from direstinvoker.utils.subscription import QuoteSubscription
+
+logger = logging.getLogger(__name__)
+SHM_MAGIC = b'DIRQ'
+SHM_VERSION = 1
+# 文件头：magic、版本、容量、指标数量，之后依次为 seq、代码数量、代码版本、更新时间
+SHM_HEADER = struct.Struct('>4sIII')
+SEQ_OFFSET = 16
+CODE_COUNT_OFFSET = 24
+CODE_VERSION_OFFSET = 32
+UPDATE_TIME_OFFSET = 40
+HEADER_SIZE = 64
+# 代码、指标名称的最大字节数
+NAME_SIZE = 32
+NAME_DTYPE = 'S%d' % NAME_SIZE
+# 读取时等待写入完成的最长时间（秒）
+READ_TIMEOUT = 1
+
+
+def get_shm_path(name) -> str:
+    """
+    共享内存文件路径
+    :param name: 共享内存名称，发布及读取进程使用相同的名称
+    :return:
+    """
+    folder_path = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(folder_path, 'direstinvoker_%s' % name)
+
+
+class _QuoteTable:
+    """
+    共享内存中的行情表，按固定布局建立 numpy 视图，不复制数据
+    """
+
+    def __init__(self, mm: mmap.mmap):
+        self.mm = mm
+        magic, version, self.capacity, self.field_count = SHM_HEADER.unpack_from(mm, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION:
+            raise ValueError('不是有效的行情共享内存')
+        self.seq = np.ndarray((1,), dtype=np.uint64, buffer=mm, offset=SEQ_OFFSET)
+        self.code_count = np.ndarray((1,), dtype=np.uint64, buffer=mm, offset=CODE_COUNT_OFFSET)
+        self.code_version = np.ndarray((1,), dtype=np.uint64, buffer=mm, offset=CODE_VERSION_OFFSET)
+        self.update_time = np.ndarray((1,), dtype=np.float64, buffer=mm, offset=UPDATE_TIME_OFFSET)
+        offset = HEADER_SIZE
+        self.field_arr = np.ndarray((self.field_count,), dtype=NAME_DTYPE, buffer=mm, offset=offset)
+        offset += self.field_count * NAME_SIZE
+        self.code_arr = np.ndarray((self.capacity,), dtype=NAME_DTYPE, buffer=mm, offset=offset)
+        offset += self.capacity * NAME_SIZE
+        self.value_arr = np.ndarray((self.capacity, self.field_count), dtype=np.float64, buffer=mm, offset=offset)
+
+    @staticmethod
+    def get_size(capacity, field_count) -> int:
+        return HEADER_SIZE + (field_count + capacity) * NAME_SIZE + capacity * field_count * 8
+
+    def close(self):
+        # 释放 numpy 视图后才能关闭 mmap
+        self.seq = self.code_count = self.code_version = self.update_time = None
+        self.field_arr = self.code_arr = self.value_arr = None
+        try:
+            self.mm.close()
+        except BufferError:
+            # 调用方仍持有 values 视图时无法关闭，由垃圾回收释放
+            logger.warning('共享内存仍有数组视图在使用，暂不关闭')
+
+
+def _encode_name(name: str) -> bytes:
+    name_bytes = name.encode('utf-8')
+    if len(name_bytes) > NAME_SIZE:
+        raise ValueError('%s 超过 %d 字节' % (name, NAME_SIZE))
+    return name_bytes
+
+
+class QuotePublisher:
+    """
+    行情发布，在一个进程中轮询实时行情并写入共享内存，例如：
+    publisher = QuotePublisher(invoker, code_list, 'rt_last,rt_vol', name='a_share', capacity=5000)
+    publisher.start()
+    ...
+    publisher.close()
+    """
+
+    def __init__(self, invoker, codes, fields, name, options="", capacity=1024, **kwargs):
+        """
+        :param invoker: WindRestInvoker 或 IFinDInvoker
+        :param codes: 代码列表，或以 "," 分隔的代码字符串
+        :param fields: 指标列表，wind 以 "," 分隔，iFinD 以 ";" 分隔
+        :param name: 共享内存名称
+        :param options: 可选参数，wind 为 options，iFinD 为 jsonparam
+        :param capacity: 最多发布的代码数量，共享内存大小按该数量分配
+        :param kwargs: interval、idle_interval、session_list、max_code_num、max_workers 等参数，详见 QuoteSubscription
+        """
+        self.name = name
+        self.file_path = get_shm_path(name)
+        self.subscription = QuoteSubscription(invoker, [], fields, options, callback=self._on_change, **kwargs)
+        field_list = self.subscription.field_list
+        self._lock = threading.Lock()
+        self._code_list = []
+        # 在临时文件中初始化后再替换到目标路径，发布进程重启时不截断仍被 QuoteReader 映射的旧文件，
+        # 已打开的 QuoteReader 继续读取旧文件中最后的行情，重新打开后读取新文件
+        tmp_file_path = '%s.%d.tmp' % (self.file_path, os.getpid())
+        try:
+            with open(tmp_file_path, 'w+b') as file:
+                file.truncate(_QuoteTable.get_size(capacity, len(field_list)))
+                mm = mmap.mmap(file.fileno(), 0)
+                self._file_id = self._get_file_id(os.fstat(file.fileno()))
+            SHM_HEADER.pack_into(mm, 0, SHM_MAGIC, SHM_VERSION, capacity, len(field_list))
+            self._table = _QuoteTable(mm)
+            self._table.field_arr[:] = [_encode_name(field) for field in field_list]
+            self._table.value_arr[:] = np.nan
+            os.replace(tmp_file_path, self.file_path)
+        finally:
+            if os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
+        self.add_codes(codes)
+
+    @staticmethod
+    def _get_file_id(stat) -> tuple:
+        return stat.st_dev, stat.st_ino
+
+    def _write(self):
+        """
+        将订阅的最新行情写入共享内存
+        """
+        table = self._table
+        with self._lock:
+            snapshot_df = self.subscription.get_snapshot()
+            code_list = list(snapshot_df.index)
+            count = len(code_list)
+            table.seq[0] += 1
+            try:
+                if code_list != self._code_list:
+                    table.code_arr[:count] = [_encode_name(code) for code in code_list]
+                    table.value_arr[count:len(self._code_list)] = np.nan
+                    table.code_count[0] = count
+                    table.code_version[0] += 1
+                    self._code_list = code_list
+                table.value_arr[:count] = snapshot_df.values
+                table.update_time[0] = time.time()
+            finally:
+                table.seq[0] += 1
+
+    def _on_change(self, delta_df):
+        self._write()
+
+    def add_codes(self, codes):
+        code_list = codes.split(',') if isinstance(codes, str) else list(codes)
+        for code in code_list:
+            _encode_name(code)
+        if len(set(self.subscription.get_codes() + code_list)) > self._table.capacity:
+            raise ValueError('代码数量超过共享内存容量 %d' % self._table.capacity)
+        self.subscription.add_codes(code_list)
+        self._write()
+
+    def remove_codes(self, codes):
+        self.subscription.remove_codes(codes)
+        self._write()
+
+    def poll(self):
+        """
+        轮询一次，有变化时写入共享内存
+        """
+        return self.subscription.poll()
+
+    def start(self):
+        self.subscription.start()
+
+    def stop(self, timeout=None):
+        self.subscription.stop(timeout)
+
+    def close(self, unlink=True):
+        """
+        :param unlink: 是否删除共享内存文件，已打开的 QuoteReader 仍可读取最后的行情
+        """
+        self.stop()
+        if self._table is not None:
+            self._table.close()
+            self._table = None
+        if unlink:
+            try:
+                # 同名的新发布进程已替换共享内存文件时不删除
+                if self._get_file_id(os.stat(self.file_path)) == self._file_id:
+                    os.remove(self.file_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class QuoteReader:
+    """
+    读取共享内存中的行情，例如：
+    reader = QuoteReader('a_share')
+    data_df = reader.read()
+    seq = reader.wait_update(seq, timeout=5)
+    values 属性为共享内存的 numpy 视图（不复制，但可能读到正在写入的数据），read、read_values 通过 seqlock 保证一致性
+    """
+
+    def __init__(self, name):
+        """
+        :param name: 共享内存名称，与 QuotePublisher 一致
+        """
+        self.name = name
+        self.file_path = get_shm_path(name)
+        with open(self.file_path, 'rb') as file:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._table = _QuoteTable(mm)
+        self.field_list = [field.decode('utf-8') for field in self._table.field_arr]
+        self._code_version = None
+        self._code_list = []
+        self._code_index_dic = {}
+
+    @property
+    def seq(self) -> int:
+        """
+        写入序号，每次写入完成后增加 2，奇数表示正在写入
+        """
+        return int(self._table.seq[0])
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        共享内存中行情数组的视图（只读，不复制），行与 codes 对应
+        """
+        return self._table.value_arr[:int(self._table.code_count[0])]
+
+    @property
+    def update_time(self) -> float:
+        return float(self._table.update_time[0])
+
+    def _read_consistent(self, func):
+        """
+        seqlock 读取：写入期间或读取前后 seq 不一致时重新读取
+        """
+        timeout_time = time.time() + READ_TIMEOUT
+        while True:
+            seq = int(self._table.seq[0])
+            if seq % 2 == 0:
+                ret = func()
+                if int(self._table.seq[0]) == seq:
+                    return ret
+            if time.time() > timeout_time:
+                raise TimeoutError('读取 %s 超时' % self.file_path)
+            time.sleep(0)
+
+    def _refresh_codes(self):
+        """
+        代码变化时重新读取代码列表，需在 _read_consistent 中调用
+        """
+        code_version = int(self._table.code_version[0])
+        if code_version != self._code_version:
+            code_list = [code.decode('utf-8') for code in self._table.code_arr[:int(self._table.code_count[0])]]
+            self._code_list = code_list
+            self._code_index_dic = {code: row for row, code in enumerate(code_list)}
+            self._code_version = code_version
+        return self._code_list
+
+    @property
+    def codes(self) -> list:
+        return list(self._read_consistent(self._refresh_codes))
+
+    def read_values(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        读取一致的行情数组
+        :param out: 预分配的数组，行数不小于代码数量，None 则新建数组
+        :return: 行与 codes 对应
+        """
+        def read():
+            count = len(self._refresh_codes())
+            if out is None:
+                return self._table.value_arr[:count].copy()
+            np.copyto(out[:count], self._table.value_arr[:count])
+            return out[:count]
+
+        return self._read_consistent(read)
+
+    def read(self, codes=None) -> pd.DataFrame:
+        """
+        读取一致的行情
+        :param codes: 代码列表，None 为全部代码，不在共享内存中的代码为 NaN
+        :return: index 为代码，columns 为指标
+        """
+        def read():
+            code_list = self._refresh_codes()
+            if codes is None:
+                return list(code_list), self._table.value_arr[:len(code_list)].copy()
+            code_list = codes.split(',') if isinstance(codes, str) else list(codes)
+            values = np.full((len(code_list), len(self.field_list)), np.nan)
+            for pos, code in enumerate(code_list):
+                row = self._code_index_dic.get(code, None)
+                if row is not None:
+                    values[pos] = self._table.value_arr[row]
+            return code_list, values
+
+        code_list, values = self._read_consistent(read)
+        return pd.DataFrame(values, index=code_list, columns=self.field_list)
+
+    def wait_update(self, seq=None, timeout=None, poll_interval=0.01) -> int:
+        """
+        等待行情更新
+        :param seq: 上次读取时的 seq，None 则使用当前 seq
+        :param timeout: 最长等待时间（秒），None 为一直等待
+        :param poll_interval: 检查间隔（秒）
+        :return: 更新后的 seq，超时返回当前 seq
+        """
+        seq = self.seq if seq is None else seq
+        timeout_time = None if timeout is None else time.time() + timeout
+        while True:
+            new_seq = self.seq
+            if new_seq != seq and new_seq % 2 == 0:
+                return new_seq
+            if timeout_time is not None and time.time() > timeout_time:
+                return new_seq
+            time.sleep(poll_interval)
+
+    def close(self):
+        if self._table is not None:
+            self._table.close()
+            self._table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/19 9:30
+@File    : subscription.py
+@contact : mmmaaaggg@163.com
+@desc    : 实时行情订阅，定时轮询 wsq / THS_RealtimeQuotes，仅将发生变化的单元格推送给回调函数
+最新行情保存在预分配的二维数组中（代码 x 指标），每次轮询对整个数组向量化比较，不再每次重建完整的 DataFrame
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+# A 股交易时段（含集合竞价）
+MARKET_SESSION_LIST = [('09:15', '11:30'), ('13:00', '15:00')]
+# 预分配数组的最小行数
+MIN_CAPACITY = 64
+
+
+def _parse_session_list(session_list) -> list:
+    return [(datetime.strptime(begin_str, '%H:%M').time(), datetime.strptime(end_str, '%H:%M').time())
+            for begin_str, end_str in session_list]
+
+
+class QuoteSubscription:
+    """
+    实时行情订阅，例如：
+    def on_change(delta_df):
+        print(delta_df)
+    sub = QuoteSubscription(invoker, ['600000.SH', '600001.SH'], 'rt_last,rt_vol', callback=on_change)
+    sub.start()
+    sub.add_codes(['600004.SH'])
+    ...
+    sub.stop()
+    回调函数的参数为变化的单元格 DataFrame，列为 code、field、value、prev，首次轮询时全部单元格均视为变化（prev 为 NaN）
+    """
+
+    def __init__(self, invoker, codes, fields, options="", callback=None, interval=3, idle_interval=60,
+                 session_list=None, max_code_num=None, max_workers=None):
+        """
+        :param invoker: WindRestInvoker 使用 wsq 接口，IFinDInvoker 使用 THS_RealtimeQuotes 接口
+        :param codes: 代码列表，或以 "," 分隔的代码字符串
+        :param fields: 指标列表，wind 以 "," 分隔，iFinD 以 ";" 分隔，指标值按数值处理，无法转换为数值的为 NaN
+        :param options: 可选参数，wind 为 options，iFinD 为 jsonparam
+        :param callback: 回调函数 callback(delta_df)，也可通过 add_callback 添加
+        :param interval: 交易时段内的轮询间隔（秒）
+        :param idle_interval: 非交易时段的轮询间隔（秒），不超过距下一个交易时段开始的时间，None 为非交易时段不轮询
+        :param session_list: 交易时段列表 [('09:15', '11:30'), ...]，None 则使用 MARKET_SESSION_LIST
+        :param max_code_num: 每次请求最大代码数量，None 则使用 invoker 的设置
+        :param max_workers: 分段并发请求数，None 则使用 invoker 的设置
+        """
+        self.invoker = invoker
+        self.is_wind = hasattr(invoker, 'wsq')
+        if isinstance(fields, str):
+            fields = fields.split(',' if self.is_wind else ';')
+        self.field_list = [field.strip() for field in fields if field.strip() != '']
+        # wind 返回的指标名称为大写
+        self._column_list = [field.upper() for field in self.field_list] if self.is_wind else self.field_list
+        self.options = options
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.session_list = _parse_session_list(MARKET_SESSION_LIST if session_list is None else session_list)
+        self.max_code_num = max_code_num
+        self.max_workers = max_workers
+        self._callback_list = [] if callback is None else [callback]
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # 代码 -> 数组中的行号，数组前 len(self._code_list) 行有效
+        self._code_list = []
+        self._code_index_dic = {}
+        self._values = np.full((MIN_CAPACITY, len(self.field_list)), np.nan)
+        self._stat_dic = {'poll_count': 0, 'error_count': 0, 'changed_count': 0, 'last_poll_time': None}
+        self.add_codes(codes)
+
+    def add_callback(self, callback):
+        with self._lock:
+            self._callback_list.append(callback)
+
+    def remove_callback(self, callback):
+        with self._lock:
+            self._callback_list.remove(callback)
+
+    def add_codes(self, codes):
+        """
+        增加订阅的代码，下次轮询时生效，新代码的全部指标作为变化推送
+        """
+        code_list = codes.split(',') if isinstance(codes, str) else list(codes)
+        with self._lock:
+            new_code_list = [code for code in OrderedDict.fromkeys(code_list) if code not in self._code_index_dic]
+            count = len(self._code_list) + len(new_code_list)
+            if count > self._values.shape[0]:
+                # 容量不足时按 2 倍扩容
+                values = np.full((max(count, self._values.shape[0] * 2), len(self.field_list)), np.nan)
+                values[:len(self._code_list)] = self._values[:len(self._code_list)]
+                self._values = values
+            for code in new_code_list:
+                self._code_index_dic[code] = len(self._code_list)
+                self._code_list.append(code)
+
+    def remove_codes(self, codes):
+        """
+        取消订阅的代码，将最后一行移到被删除的位置，保持数组前部连续
+        """
+        code_list = codes.split(',') if isinstance(codes, str) else list(codes)
+        with self._lock:
+            for code in code_list:
+                row = self._code_index_dic.pop(code, None)
+                if row is None:
+                    continue
+                last_row = len(self._code_list) - 1
+                if row != last_row:
+                    last_code = self._code_list[last_row]
+                    self._values[row] = self._values[last_row]
+                    self._code_list[row] = last_code
+                    self._code_index_dic[last_code] = row
+                self._values[last_row] = np.nan
+                self._code_list.pop()
+
+    def get_codes(self) -> list:
+        with self._lock:
+            return list(self._code_list)
+
+    def get_snapshot(self) -> pd.DataFrame:
+        """
+        最新行情，index 为代码，columns 为指标
+        """
+        with self._lock:
+            return pd.DataFrame(self._values[:len(self._code_list)].copy(), index=list(self._code_list),
+                                columns=self.field_list)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stat_dic = self._stat_dic.copy()
+            stat_dic['code_count'] = len(self._code_list)
+        return stat_dic
+
+    def _query(self, code_list) -> np.ndarray:
+        """
+        查询实时行情，返回按 code_list、field_list 排列的二维数组
+        """
+        if self.is_wind:
+            data_df = self.invoker.wsq(code_list, ','.join(self.field_list), self.options,
+                                       max_code_num=self.max_code_num, max_workers=self.max_workers)
+        else:
+            data_df = self.invoker.THS_RealtimeQuotes(code_list, ';'.join(self.field_list), self.options,
+                                                      max_code_num=self.max_code_num, max_workers=self.max_workers)
+            if data_df is not None and data_df.shape[0] > 0:
+                data_df = data_df.drop_duplicates('thscode', keep='last').set_index('thscode')
+        if data_df is None or data_df.shape[0] == 0:
+            return np.full((len(code_list), len(self.field_list)), np.nan)
+        data_df = data_df.reindex(index=code_list, columns=self._column_list)
+        return data_df.apply(pd.to_numeric, errors='coerce').values.astype('float64')
+
+    def poll(self) -> pd.DataFrame:
+        """
+        轮询一次，将变化的单元格推送给回调函数
+        :return: 变化的单元格，列为 code、field、value、prev，没有变化时为 None
+        """
+        code_list = self.get_codes()
+        if len(code_list) == 0:
+            return None
+        values = self._query(code_list)
+        with self._lock:
+            # 查询期间代码可能增减，只更新仍在订阅中的代码
+            if code_list == self._code_list:
+                row_arr = np.arange(len(code_list))
+                new_values = values
+            else:
+                pos_list = [(pos, self._code_index_dic[code]) for pos, code in enumerate(code_list)
+                            if code in self._code_index_dic]
+                if len(pos_list) == 0:
+                    return None
+                pos_arr, row_arr = (np.array(arr) for arr in zip(*pos_list))
+                new_values = values[pos_arr]
+            old_values = self._values[row_arr]
+            changed_arr = (new_values != old_values) & ~(np.isnan(new_values) & np.isnan(old_values))
+            row_idx, col_idx = np.nonzero(changed_arr)
+            self._values[row_arr] = new_values
+            code_arr = np.array(self._code_list, dtype=object)[row_arr]
+            self._stat_dic['poll_count'] += 1
+            self._stat_dic['changed_count'] += len(row_idx)
+            self._stat_dic['last_poll_time'] = datetime.now()
+            callback_list = list(self._callback_list)
+        if len(row_idx) == 0:
+            return None
+        delta_df = pd.DataFrame({
+            'code': code_arr[row_idx],
+            'field': np.array(self.field_list, dtype=object)[col_idx],
+            'value': new_values[row_idx, col_idx],
+            'prev': old_values[row_idx, col_idx],
+        }, columns=['code', 'field', 'value', 'prev'])
+        for callback in callback_list:
+            try:
+                callback(delta_df)
+            except Exception:
+                logger.exception('回调函数 %s 执行出错', callback)
+        return delta_df
+
+    def is_trade_date(self, dt: datetime) -> bool:
+        calendar = getattr(self.invoker, 'calendar', None)
+        if calendar is not None:
+            return calendar.is_trade_date(dt)
+        return dt.weekday() < 5
+
+    def next_interval(self, now=None):
+        """
+        距下次轮询的时间（秒）：交易时段内为 interval；非交易时段为 idle_interval，且不超过距下一个交易时段开始的时间
+        """
+        now = datetime.now() if now is None else now
+        trade_date = self.is_trade_date(now)
+        if trade_date and any(begin <= now.time() <= end for begin, end in self.session_list):
+            return self.interval
+        # 下一个交易时段的开始时间
+        next_begin = None
+        for day in range(15):
+            dt = now + timedelta(days=day)
+            if day > 0 and not self.is_trade_date(dt):
+                continue
+            if day == 0 and not trade_date:
+                continue
+            begin_list = [datetime.combine(dt.date(), begin) for begin, _ in self.session_list]
+            begin_list = [begin_dt for begin_dt in begin_list if begin_dt > now]
+            if len(begin_list) > 0:
+                next_begin = min(begin_list)
+                break
+        # 之后 15 天均无交易日时（例如长假交易日历未更新）按 1 天后重新检查
+        wait_time = 86400 if next_begin is None else (next_begin - now).total_seconds()
+        return wait_time if self.idle_interval is None else min(self.idle_interval, wait_time)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            now = datetime.now()
+            if self.idle_interval is not None or self.next_interval(now) == self.interval:
+                start_time = time.time()
+                try:
+                    self.poll()
+                except Exception:
+                    with self._lock:
+                        self._stat_dic['error_count'] += 1
+                    logger.exception('轮询实时行情出错')
+                wait_time = self.next_interval() - (time.time() - start_time)
+            else:
+                # 非交易时段不轮询，等待到下一个交易时段
+                wait_time = self.next_interval(now)
+            self._stop_event.wait(max(wait_time, 0))
+
+    def start(self):
+        """
+        在后台线程中开始轮询
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='QuoteSubscription', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
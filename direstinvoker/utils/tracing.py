@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/14 9:15
+@File    : tracing.py
+@contact : mmmaaaggg@163.com
+@desc    : 请求各阶段的跟踪回调及抽样分析
+invoker 在请求的每个阶段完成后依次调用 trace hook：hook(path, phase, elapsed_time, size)
+hook 可提供 sample() 方法，invoker 在每次顶层调用开始时调用一次，返回 False 时本次调用的各阶段均不调用该 hook
+"""
+import random
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+# 请求阶段
+ENCODE = 'encode'  # 请求参数 json 编码，size 为请求数据字符数
+NETWORK = 'network'  # 发送请求并接收返回数据，size 为接收的字节数
+DECODE = 'decode'  # 返回数据 json 解码，size 为解码前的字节数
+FRAME = 'frame'  # 将 json 数据转换为 DataFrame 等结果，size 为单元格数
+CONCAT = 'concat'  # 合并各分段结果，size 为单元格数
+COMPACT = 'compact'  # 压缩合并结果的内存占用，size 为单元格数
+PHASE_LIST = [ENCODE, NETWORK, DECODE, FRAME, CONCAT, COMPACT]
+
+
+class Profiler:
+    """
+    按接口、阶段汇总耗时的 trace hook，例如：
+    profiler = Profiler(sample_rate=0.1)
+    invoker.add_trace_hook(profiler)
+    ...
+    print(profiler.dump())
+    """
+
+    def __init__(self, sample_rate=1.0):
+        """
+        :param sample_rate: 抽样比例，按顶层调用随机抽样（被抽中调用的各阶段全部记录），1 为全部记录
+        """
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        # {接口: {阶段: [次数, 总耗时, 最大耗时, 总 size]}}
+        self._stat_dic = OrderedDict()
+
+    def sample(self) -> bool:
+        """
+        invoker 每次顶层调用开始时调用，决定本次调用是否抽样
+        """
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, path, phase, elapsed_time, size):
+        endpoint = path.strip('/')
+        with self._lock:
+            phase_dic = self._stat_dic.setdefault(endpoint, OrderedDict())
+            stat_list = phase_dic.get(phase, None)
+            if stat_list is None:
+                phase_dic[phase] = [1, elapsed_time, elapsed_time, size]
+            else:
+                stat_list[0] += 1
+                stat_list[1] += elapsed_time
+                stat_list[2] = max(stat_list[2], elapsed_time)
+                stat_list[3] += size
+
+    def get_report(self) -> dict:
+        """
+        :return: {接口: {阶段: {count 抽样次数，total_time 总耗时，avg_time 平均耗时，max_time 最大耗时，
+        ratio 占该接口各阶段总耗时的比例，size 总数据量}}}，阶段按 PHASE_LIST 排序
+        """
+        report_dic = OrderedDict()
+        with self._lock:
+            for endpoint, phase_dic in self._stat_dic.items():
+                total_time = sum(stat_list[1] for stat_list in phase_dic.values())
+                report_dic[endpoint] = OrderedDict(
+                    (phase, {
+                        'count': phase_dic[phase][0],
+                        'total_time': phase_dic[phase][1],
+                        'avg_time': phase_dic[phase][1] / phase_dic[phase][0],
+                        'max_time': phase_dic[phase][2],
+                        'ratio': phase_dic[phase][1] / total_time if total_time > 0 else None,
+                        'size': phase_dic[phase][3],
+                    }) for phase in PHASE_LIST if phase in phase_dic)
+        return report_dic
+
+    def dump(self) -> str:
+        """
+        各接口各阶段耗时的文本报表
+        :return:
+        """
+        line_list = ['%-28s %-8s %8s %10s %10s %10s %7s %14s' % (
+            'endpoint', 'phase', 'count', 'total(s)', 'avg(s)', 'max(s)', 'ratio', 'size')]
+        for endpoint, phase_dic in self.get_report().items():
+            for phase, stat_dic in phase_dic.items():
+                line_list.append('%-28s %-8s %8d %10.4f %10.4f %10.4f %6.1f%% %14d' % (
+                    endpoint, phase, stat_dic['count'], stat_dic['total_time'], stat_dic['avg_time'],
+                    stat_dic['max_time'], 0 if stat_dic['ratio'] is None else stat_dic['ratio'] * 100,
+                    stat_dic['size']))
+        return '\n'.join(line_list)
+
+    def reset(self):
+        with self._lock:
+            self._stat_dic.clear()
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/3 13:40
+@File    : trade_calendar.py
+@contact : mmmaaaggg@163.com
+@desc    : 本地交易日历
+通过 tdays、THS_DateQuery 一次性加载交易日，以排序的 numpy 数组保存，偏移、区间、是否交易日等查询均在本地通过二分查找完成
+"""
+import logging
+import threading
+from datetime import date, timedelta
+import numpy as np
+from direstinvoker.utils.fh_utils import try_2_date
+
+logger = logging.getLogger(__name__)
+
+
+def _to_datetime64(dt) -> np.datetime64:
+    return np.datetime64(try_2_date(dt), 'D')
+
+
+class TradingCalendar:
+    """
+    线程安全的本地交易日历
+    已加载的日期区间截止日临近时（refresh_days 天内）在后台线程中刷新，查询日期超出已加载区间时同步加载
+    """
+
+    def __init__(self, invoker=None, load_func=None, date_from='2000-01-01', forward_days=365, refresh_days=30):
+        """
+        :param invoker: WindRestInvoker 或 IFinDInvoker（同步版本），通过其 get_trade_date_list 方法加载交易日
+        :param load_func: load_func(date_from, date_to) -> date 列表，不为空时替代 invoker 加载交易日
+        :param date_from: 加载交易日的起始日期
+        :param forward_days: 加载截止日期为当天之后 forward_days 天
+        :param refresh_days: 距离已加载区间截止日期不足 refresh_days 天时后台刷新
+        """
+        if load_func is None:
+            if invoker is None:
+                raise ValueError('invoker、load_func 不能同时为空')
+            load_func = invoker.get_trade_date_list
+        self.load_func = load_func
+        self.date_from = try_2_date(date_from)
+        self.forward_days = forward_days
+        self.refresh_days = refresh_days
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # 排序的交易日数组 datetime64[D]
+        self._date_arr = None
+        self._loaded_from = None
+        self._loaded_to = None
+
+    def _load(self, date_to=None):
+        """
+        加载 [date_from, date_to] 区间内的交易日
+        :param date_to: 为空则加载到当天之后 forward_days 天
+        :return:
+        """
+        date_to_default = date.today() + timedelta(days=self.forward_days)
+        date_to = date_to_default if date_to is None else max(try_2_date(date_to), date_to_default)
+        date_list = self.load_func(self.date_from, date_to)
+        date_arr = np.unique(np.array([_to_datetime64(dt) for dt in date_list], dtype='datetime64[D]'))
+        with self._lock:
+            self._date_arr = date_arr
+            self._loaded_from = _to_datetime64(self.date_from)
+            self._loaded_to = _to_datetime64(date_to)
+        logger.debug('加载交易日 %s ~ %s 共 %d 天', self.date_from, date_to, date_arr.shape[0])
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._load()
+            except Exception:
+                logger.exception('后台刷新交易日历失败')
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name='TradingCalendarRefresh', daemon=True).start()
+
+    def refresh(self):
+        """
+        同步刷新交易日历
+        """
+        self._load()
+
+    def _get_date_arr(self, *dt_list) -> np.ndarray:
+        """
+        确保 dt_list 中的日期在已加载区间内，并返回交易日数组
+        """
+        dt64_list = [_to_datetime64(dt) for dt in dt_list]
+        if self._date_arr is None:
+            self._load(max(dt64_list).astype(date) if len(dt64_list) > 0 else None)
+        elif any(dt64 > self._loaded_to for dt64 in dt64_list):
+            self._load(max(dt64_list).astype(date))
+        elif np.datetime64(date.today(), 'D') + np.timedelta64(self.refresh_days, 'D') > self._loaded_to:
+            self._refresh_in_background()
+        if any(dt64 < self._loaded_from for dt64 in dt64_list):
+            self.date_from = min(dt64_list).astype(date)
+            self._load(self._loaded_to.astype(date))
+        return self._date_arr
+
+    def is_trade_date(self, dt) -> bool:
+        """
+        是否交易日
+        :param dt:
+        :return:
+        """
+        date_arr = self._get_date_arr(dt)
+        dt64 = _to_datetime64(dt)
+        idx = np.searchsorted(date_arr, dt64)
+        return bool(idx < date_arr.shape[0] and date_arr[idx] == dt64)
+
+    def nearest(self, dt, forward=False) -> date:
+        """
+        最近的交易日
+        :param dt:
+        :param forward: False 返回不晚于 dt 的最近交易日，True 返回不早于 dt 的最近交易日
+        :return: 不存在则返回 None
+        """
+        date_arr = self._get_date_arr(dt)
+        dt64 = _to_datetime64(dt)
+        if forward:
+            idx = np.searchsorted(date_arr, dt64, side='left')
+        else:
+            idx = np.searchsorted(date_arr, dt64, side='right') - 1
+        if idx < 0 or idx >= date_arr.shape[0]:
+            return None
+        return date_arr[idx].astype(date)
+
+    def offset(self, dt, offset: int) -> date:
+        """
+        获取偏移 offset 个交易日对应的日期，与 tdaysoffset 一致：
+        offset >= 0 时以不晚于 dt 的最近交易日为基准，offset < 0 时以不早于 dt 的最近交易日为基准
+        :param dt: 基准日
+        :param offset: 偏移交易日数
+        :return: 超出已加载区间返回 None
+        """
+        date_arr = self._get_date_arr(dt)
+        dt64 = _to_datetime64(dt)
+        if offset >= 0:
+            idx = np.searchsorted(date_arr, dt64, side='right') - 1 + offset
+        else:
+            idx = np.searchsorted(date_arr, dt64, side='left') + offset
+        if idx < 0:
+            return None
+        if idx >= date_arr.shape[0]:
+            # 超出已加载区间，按平均每周 5 个交易日估算需要加载的截止日期
+            self._get_date_arr(dt64.astype(date) + timedelta(days=offset * 7 // 5 + 30))
+            return self.offset(dt, offset) if idx < self._date_arr.shape[0] else None
+        return date_arr[idx].astype(date)
+
+    def get_range(self, date_from, date_to) -> list:
+        """
+        获取区间内的交易日列表
+        :param date_from:
+        :param date_to:
+        :return: date 列表
+        """
+        date_arr = self._get_date_arr(date_from, date_to)
+        idx_from = np.searchsorted(date_arr, _to_datetime64(date_from), side='left')
+        idx_to = np.searchsorted(date_arr, _to_datetime64(date_to), side='right')
+        return date_arr[idx_from:idx_to].astype(date).tolist()
+
+    def count(self, date_from, date_to) -> int:
+        """
+        区间内的交易日数量
+        """
+        date_arr = self._get_date_arr(date_from, date_to)
+        return int(np.searchsorted(date_arr, _to_datetime64(date_to), side='right')
+                   - np.searchsorted(date_arr, _to_datetime64(date_from), side='left'))
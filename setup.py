@@ -44,4 +44,9 @@ setup(name='DIRestInvoker',
           'pandas>=0.23.0',
           'requests>=2.19.1',
           'xlrd>=1.1.0',
-      ])
+      ],
+      extras_require={
+          'aio': ['aiohttp>=3.3'],
+          'cache': ['pyarrow>=0.10.0'],
+          'fast_json': ['orjson'],
+      })
@@ -0,0 +1,34 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 9:30
+@File    : conftest.py
+@contact : mmmaaaggg@163.com
+@desc    : 测试公共 fixture，通过本地 MockDIRestServer 模拟 DIRestPlus 服务
+"""
+import pytest
+from direstinvoker.iwind import WindRestInvoker
+from direstinvoker.ifind import IFinDInvoker
+from direstinvoker.utils.mock_server import MockDIRestServer
+from direstinvoker.utils.retry import RetryPolicy
+
+
+@pytest.fixture(scope='session')
+def mock_server():
+    with MockDIRestServer(fail_code_set={'BAD.SH'}) as server:
+        yield server
+
+
+@pytest.fixture
+def wind_invoker(mock_server):
+    invoker = WindRestInvoker(mock_server.wind_url, retry_policy=RetryPolicy(max_retries=0))
+    yield invoker
+    invoker.close()
+
+
+@pytest.fixture
+def ifind_invoker(mock_server):
+    invoker = IFinDInvoker(mock_server.ifind_url, retry_policy=RetryPolicy(max_retries=0))
+    yield invoker
+    invoker.close()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 13:20
+@File    : test_aio.py
+@contact : mmmaaaggg@163.com
+@desc    : 异步 invoker 的磁盘 IO、交易日历加载不阻塞事件循环
+"""
+import uuid
+import asyncio
+import threading
+from datetime import date
+import pytest
+from direstinvoker.utils.cache import ResponseCache
+from direstinvoker.utils.trade_calendar import TradingCalendar
+
+pytest.importorskip('aiohttp')
+from direstinvoker.aio import AsyncWindRestInvoker
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class _ThreadRecordCache(ResponseCache):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.thread_id_list = []
+
+    def get(self, path, req_data_dic):
+        self.thread_id_list.append(threading.get_ident())
+        return super().get(path, req_data_dic)
+
+    def put(self, path, req_data_dic, data_df):
+        self.thread_id_list.append(threading.get_ident())
+        return super().put(path, req_data_dic, data_df)
+
+
+def test_cache_io_off_loop(mock_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    cache = _ThreadRecordCache('cache_%s' % uuid.uuid4().hex)
+
+    async def fetch_twice():
+        async with AsyncWindRestInvoker(mock_server.wind_url, cache=cache) as invoker:
+            first_df = await invoker.wsd('600000.SH,600001.SH', 'close', '2018-01-01', '2018-01-31')
+            second_df = await invoker.wsd('600000.SH,600001.SH', 'close', '2018-01-01', '2018-01-31')
+        return first_df, second_df
+
+    first_df, second_df = _run(fetch_twice())
+    assert first_df.equals(second_df)
+    assert cache.get_stats()['hit'] == 1
+    # get、put、get 均不在事件循环所在的线程中执行
+    assert len(cache.thread_id_list) == 3
+    assert threading.get_ident() not in cache.thread_id_list
+
+
+def test_tdaysoffset_calendar_off_loop(mock_server):
+    thread_id_list = []
+
+    def load_func(date_from, date_to):
+        thread_id_list.append(threading.get_ident())
+        return [date(2018, 1, 2), date(2018, 1, 3), date(2018, 1, 4), date(2018, 1, 5)]
+
+    async def offset():
+        async with AsyncWindRestInvoker(mock_server.wind_url,
+                                        calendar=TradingCalendar(load_func=load_func)) as invoker:
+            return await invoker.tdaysoffset(2, '2018-01-02')
+
+    assert _run(offset()) == '2018-01-04'
+    assert len(thread_id_list) == 1
+    assert thread_id_list[0] != threading.get_ident()
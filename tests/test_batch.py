@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 9:30
+@File    : test_batch.py
+@contact : mmmaaaggg@163.com
+@desc    : 批量查询的合并、拆分及逐个重新执行
+"""
+from direstinvoker import APIError
+from direstinvoker.utils.batch import MissingCodeError
+
+
+def test_merged_wss_split_by_codes(wind_invoker):
+    batch = wind_invoker.batch(max_workers=1)
+    batch.add('a', 'wss', ['600000.SH', '600010.SH'], 'close', 'tradeDate=20180105')
+    batch.add('b', 'wss', '600016.SH', 'close', 'tradeDate=20180105')
+    assert len(batch.plan()) == 1
+    ret_dic = batch.run()
+    assert len(batch.error_dic) == 0
+    assert list(ret_dic['a'].index) == ['600000.SH', '600010.SH']
+    assert list(ret_dic['b'].index) == ['600016.SH']
+    whole_df = wind_invoker.wss('600000.SH,600010.SH,600016.SH', 'close', 'tradeDate=20180105')
+    assert ret_dic['b'].loc['600016.SH', 'CLOSE'] == whole_df.loc['600016.SH', 'CLOSE']
+
+
+def test_merged_wss_failed_chunk_rerun(wind_invoker):
+    wind_invoker.max_code_num_dic['wss/'] = 2
+    try:
+        batch = wind_invoker.batch(max_workers=1)
+        batch.add('a', 'wss', ['600000.SH', '600010.SH'], 'close', 'tradeDate=20180105')
+        batch.add('b', 'wss', 'BAD.SH', 'close', 'tradeDate=20180105')
+        ret_dic = batch.run()
+    finally:
+        del wind_invoker.max_code_num_dic['wss/']
+    # 失败的分段只影响包含该代码的查询
+    assert list(ret_dic['a'].index) == ['600000.SH', '600010.SH']
+    assert 'a' not in batch.error_dic
+    assert ret_dic['b'] is None
+    assert isinstance(batch.error_dic['b'], APIError)
+
+
+def test_single_code_edb_rerun_relabelled(wind_invoker):
+    batch = wind_invoker.batch(max_workers=1)
+    batch.add('a', 'edb', ['M0017126', 'BAD.SH'], '2018-01-01', '2018-01-31', '')
+    batch.add('b', 'edb', 'M0017127', '2018-01-01', '2018-01-31', '')
+    ret_dic = batch.run()
+    assert isinstance(batch.error_dic['a'], APIError)
+    # 单一代码重新执行时结果列名为指标名称，不应误报 MissingCodeError
+    assert 'b' not in batch.error_dic
+    assert list(ret_dic['b'].columns) == ['M0017127']
+
+
+def test_merged_single_code_edb(wind_invoker):
+    batch = wind_invoker.batch(max_workers=1)
+    batch.add('a', 'edb', 'M0017126', '2018-01-01', '2018-01-31', '')
+    batch.add('b', 'edb', ['M0017126'], '2018-01-01', '2018-01-31', '')
+    ret_dic = batch.run()
+    assert len(batch.error_dic) == 0
+    assert list(ret_dic['a'].columns) == ['M0017126']
+    assert ret_dic['a'].equals(ret_dic['b'])
+
+
+def test_missing_code_error(wind_invoker, monkeypatch):
+    whole_df = wind_invoker.wss('600000.SH,600010.SH', 'close', 'tradeDate=20180105')
+    monkeypatch.setattr(wind_invoker, 'wss', lambda codes, fields, options='', **kwargs: whole_df.iloc[:1])
+    batch = wind_invoker.batch(max_workers=1)
+    batch.add('a', 'wss', ['600000.SH'], 'close', 'tradeDate=20180105')
+    batch.add('b', 'wss', ['600010.SH'], 'close', 'tradeDate=20180105')
+    ret_dic = batch.run()
+    assert 'a' not in batch.error_dic
+    assert isinstance(batch.error_dic['b'], MissingCodeError)
+    assert batch.error_dic['b'].code_list == ['600010.SH']
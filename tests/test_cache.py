@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 10:10
+@File    : test_cache.py
+@contact : mmmaaaggg@163.com
+@desc    : ResponseCache 不可变数据判断及缓存读写
+"""
+import uuid
+from datetime import date, timedelta
+import pytest
+import pandas as pd
+from direstinvoker.utils.cache import ResponseCache
+
+
+@pytest.mark.parametrize('end_time, expected', [
+    ('2018-01-05', True),
+    ('20180105', True),
+    (20180105, True),
+    (date(2018, 1, 5), True),
+    ((date.today() + timedelta(days=1)).strftime('%Y-%m-%d'), False),
+    ('', False),
+    ('-5D', False),
+    ('ED-1M', False),
+    ('today', False),
+    (None, False),
+    ([2018], False),
+])
+def test_is_immutable_end_time(end_time, expected):
+    assert ResponseCache.is_immutable({'endTime': end_time}) is expected
+
+
+@pytest.mark.parametrize('req_data_dic, expected', [
+    ({'endTime': '2018-01-05', 'options': 'PriceAdj=F'}, False),
+    ({'endTime': '2018-01-05', 'options': 'Fill=Previous;priceadj = t'}, False),
+    ({'endTime': '2018-01-05', 'options': 'PriceAdj=B'}, True),
+    ({'endtime': '2018-01-05', 'jsonparam': 'Interval:D,CPS:2,fill:Previous'}, False),
+    ({'endtime': '2018-01-05', 'jsonparam': 'Interval:D,CPS:1,fill:Previous'}, True),
+])
+def test_is_immutable_adjusted(req_data_dic, expected):
+    assert ResponseCache.is_immutable(req_data_dic) is expected
+
+
+@pytest.fixture
+def cache_factory(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+
+    def factory(**kwargs):
+        return ResponseCache('cache_%s' % uuid.uuid4().hex, **kwargs)
+
+    return factory
+
+
+def test_cache_round_trip(cache_factory):
+    # ttl < 0 时非永久数据立即过期，永久数据仍可读取
+    cache = cache_factory(ttl=-1)
+    data_df = pd.DataFrame({'CLOSE': [1.0, 2.0]}, index=pd.to_datetime(['2018-01-04', '2018-01-05']))
+    immutable_dic = {'codes': '600000.SH', 'endTime': '2018-01-05', 'options': ''}
+    relative_dic = {'codes': '600000.SH', 'endTime': 'ED-1M', 'options': ''}
+    cache.put('wsd/', immutable_dic, data_df)
+    cache.put('wsd/', relative_dic, data_df)
+    pd.testing.assert_frame_equal(cache.get('wsd/', immutable_dic), data_df, check_freq=False)
+    assert cache.get('wsd/', relative_dic) is None
+    stat_dic = cache.get_stats()
+    assert stat_dic['hit'] == 1
+    assert stat_dic['expired'] == 1
+
+
+def test_invoker_cache_hit(cache_factory, mock_server):
+    from direstinvoker.iwind import WindRestInvoker
+    invoker = WindRestInvoker(mock_server.wind_url, cache=cache_factory())
+    try:
+        first_df = invoker.wsd('600000.SH,600001.SH', 'close', '2018-01-01', '2018-01-31')
+        request_count = mock_server.get_stats()['request_count']
+        second_df = invoker.wsd('600000.SH,600001.SH', 'close', '2018-01-01', '2018-01-31')
+        assert mock_server.get_stats()['request_count'] == request_count
+        pd.testing.assert_frame_equal(first_df, second_df, check_freq=False)
+    finally:
+        invoker.close()
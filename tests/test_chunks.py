@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 9:40
+@File    : test_chunks.py
+@contact : mmmaaaggg@163.com
+@desc    : 按代码分段、按时间区间分段查询的合并结果与不分段查询一致
+"""
+import pandas as pd
+
+CODE_LIST = ['600000.SH', '600001.SH', '600002.SH']
+
+
+def test_wsi_single_code_chunk(wind_invoker):
+    """
+    最后一个代码分段只有一个代码时，合并结果与不分段查询一致
+    """
+    args = (CODE_LIST, 'open,close', '2018-01-01 09:00:00', '2018-01-10 15:00:00')
+    chunk_df = wind_invoker.wsi(*args, max_code_num=2)
+    whole_df = wind_invoker.wsi(*args)
+    assert list(chunk_df.columns) == ['time', 'windcode', 'OPEN', 'CLOSE']
+    assert chunk_df['windcode'].notnull().all()
+    assert chunk_df['time'].notnull().all()
+    assert isinstance(chunk_df.index, pd.RangeIndex)
+    assert list(chunk_df['windcode'].unique()) == CODE_LIST
+    assert (chunk_df.values == whole_df.values).all()
+
+
+def test_wst_single_code_chunks(wind_invoker):
+    args = (CODE_LIST[:2], 'last', '2018-01-02 09:30:00', '2018-01-02 10:00:00')
+    chunk_df = wind_invoker.wst(*args, max_code_num=1)
+    whole_df = wind_invoker.wst(*args)
+    assert list(chunk_df.columns) == list(whole_df.columns)
+    assert (chunk_df.values == whole_df.values).all()
+
+
+def test_wsd_single_code_chunk(wind_invoker):
+    """
+    单一代码分段的列名为代码而不是指标名称
+    """
+    data_df = wind_invoker.wsd(CODE_LIST, 'close', '2018-01-01', '2018-01-31', max_code_num=2)
+    assert list(data_df.columns) == CODE_LIST
+    assert data_df.equals(wind_invoker.wsd(CODE_LIST, 'close', '2018-01-01', '2018-01-31'))
+
+
+def test_split_time_range_with_time_windows_touch():
+    """
+    按交易日切分时，相邻区间首尾相接，周五夜盘等非交易日时段不会遗漏
+    """
+    from direstinvoker.utils.fh_utils import split_time_range
+    trade_date_list = [day.date() for day in pd.bdate_range('2018-01-01', '2018-01-31')]
+    time_range_list = split_time_range('2018-01-02 09:00:00', '2018-01-19 15:00:00', 5, trade_date_list,
+                                       with_time=True)
+    assert time_range_list[0][0] == '2018-01-02 09:00:00'
+    assert time_range_list[-1][1] == '2018-01-19 15:00:00'
+    for (_, prev_to), (next_from, _) in zip(time_range_list[:-1], time_range_list[1:]):
+        assert prev_to == next_from
+    assert ('2018-01-09 00:00:00', '2018-01-16 00:00:00') in time_range_list
+
+
+def test_merge_time_window_boundary_only():
+    """
+    仅去除区间边界处的重复数据，区间内部相同的数据保留
+    """
+    from direstinvoker.utils.fh_utils import merge_time_window_df
+    tick_time = pd.to_datetime(['2018-01-02 10:00:00', '2018-01-02 10:00:00', '2018-01-03 00:00:00'])
+    first_df = pd.DataFrame({'LAST': [1.0, 1.0, 2.0]}, index=tick_time)
+    second_df = pd.DataFrame({'LAST': [2.0, 3.0]}, index=pd.to_datetime(['2018-01-03 00:00:00',
+                                                                         '2018-01-03 09:30:00']))
+    merged_df = merge_time_window_df([first_df, None, second_df])
+    assert merged_df['LAST'].tolist() == [1.0, 1.0, 2.0, 3.0]
+
+
+def test_merge_time_window_ifind_range_index():
+    from direstinvoker.utils.fh_utils import merge_time_window_df
+    first_df = pd.DataFrame({'thscode': ['A', 'A', 'B', 'B'], 'time': ['2018-01-02', '2018-01-03'] * 2,
+                             'close': [1.0, 2.0, 3.0, 4.0]})
+    second_df = pd.DataFrame({'thscode': ['A', 'A', 'B', 'B'], 'time': ['2018-01-03', '2018-01-04'] * 2,
+                              'close': [2.0, 5.0, 4.0, 6.0]})
+    merged_df = merge_time_window_df([first_df, second_df], time_col='time', code_col='thscode')
+    assert merged_df['thscode'].tolist() == ['A'] * 3 + ['B'] * 3
+    assert merged_df['close'].tolist() == [1.0, 2.0, 5.0, 3.0, 4.0, 6.0]
+    assert isinstance(merged_df.index, pd.RangeIndex)
+
+
+def test_wsi_windows_match_whole(wind_invoker):
+    args = (CODE_LIST, 'close', '2018-01-02 09:30:00', '2018-01-12 15:00:00')
+    trade_date_list = [day.date() for day in pd.bdate_range('2018-01-01', '2018-01-31')]
+    window_df = wind_invoker.wsi(*args, window_days=2, trade_date_list=trade_date_list, max_code_num=2)
+    whole_df = wind_invoker.wsi(*args)
+    assert window_df.shape == whole_df.shape
+    assert (window_df.values == whole_df.values).all()
+
+
+def test_hfs_windows_match_whole(ifind_invoker):
+    args = (','.join(CODE_LIST), 'close', '', '2018-01-02 09:30:00', '2018-01-05 15:00:00')
+    window_df = ifind_invoker.THS_HighFrequenceSequence(*args, window_days=1, max_code_num=2)
+    whole_df = ifind_invoker.THS_HighFrequenceSequence(*args)
+    # 各代码分段的 index 为分段内的行号
+    pd.testing.assert_frame_equal(window_df.reset_index(drop=True), whole_df)
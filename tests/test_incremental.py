@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 10:40
+@File    : test_incremental.py
+@contact : mmmaaaggg@163.com
+@desc    : IncrementalFetcher 覆盖区间记录及本地合并
+"""
+import uuid
+from datetime import date
+import pytest
+import pandas as pd
+from direstinvoker import APIError
+from direstinvoker.iwind import WindRestInvoker
+from direstinvoker.utils.incremental import IncrementalFetcher
+
+
+@pytest.fixture
+def new_fetcher(wind_invoker, tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    store_folder_name = 'incremental_%s' % uuid.uuid4().hex
+
+    def new_fetcher():
+        return IncrementalFetcher(wind_invoker, store_folder_name=store_folder_name)
+
+    return new_fetcher
+
+
+def test_second_fetch_no_request(new_fetcher, mock_server):
+    code_list = ['600000.SH', '600010.SH']
+    data_df = new_fetcher().wsd(code_list, 'close,open', '2018-01-01', '2018-01-31')
+    assert sorted(set(data_df.index.get_level_values('code'))) == code_list
+    assert list(data_df.columns) == ['close', 'open']
+    request_count = mock_server.get_stats()['request_count']
+    # 新建的 fetcher 从本地文件读取覆盖区间及数据
+    fetcher = new_fetcher()
+    reload_df = fetcher.wsd(code_list, 'close,open', '2018-01-01', '2018-01-31')
+    assert fetcher.request_count == 0
+    assert mock_server.get_stats()['request_count'] == request_count
+    assert reload_df.equals(data_df)
+
+
+def test_code_without_rows_covered(new_fetcher, wind_invoker, monkeypatch):
+    def json_2_ts_chunk_df(json_dic):
+        return WindRestInvoker._json_2_ts_chunk_df(json_dic).drop(columns=['600010.SH'])
+
+    monkeypatch.setattr(wind_invoker, '_json_2_ts_chunk_df', json_2_ts_chunk_df)
+    fetcher = new_fetcher()
+    fetcher.wsd(['600000.SH', '600010.SH'], 'close', '2018-01-01', '2018-01-31')
+    # 请求成功，没有返回数据的代码同样记录为已覆盖
+    store = fetcher._get_store('wsd/', '')
+    assert store.get_gaps('600010.SH', 'close', date(2018, 1, 1), date(2018, 1, 31)) == []
+    fetcher.wsd(['600000.SH', '600010.SH'], 'close', '2018-01-01', '2018-01-31')
+    assert fetcher.request_count == 1
+
+
+def test_failed_chunk_not_covered(new_fetcher, wind_invoker):
+    wind_invoker.max_code_num_dic['wsd/'] = 1
+    fetcher = new_fetcher()
+    data_df = fetcher.wsd(['600000.SH', 'BAD.SH'], 'close', '2018-01-01', '2018-01-31')
+    assert set(data_df.index.get_level_values('code')) == {'600000.SH'}
+    store = fetcher._get_store('wsd/', '')
+    assert store.get_gaps('600000.SH', 'close', date(2018, 1, 1), date(2018, 1, 31)) == []
+    assert store.get_gaps('BAD.SH', 'close', date(2018, 1, 1), date(2018, 1, 31)) == [
+        (date(2018, 1, 1), date(2018, 1, 31))]
+    # 仅重新请求失败的代码，全部失败时抛出异常
+    with pytest.raises(APIError):
+        fetcher.wsd(['600000.SH', 'BAD.SH'], 'close', '2018-01-01', '2018-01-31')
+
+
+def test_save_once_per_code(new_fetcher, monkeypatch):
+    path_list = []
+    to_pickle = pd.DataFrame.to_pickle
+
+    def counted_to_pickle(data_df, path, *args, **kwargs):
+        path_list.append(path)
+        return to_pickle(data_df, path, *args, **kwargs)
+
+    monkeypatch.setattr(pd.DataFrame, 'to_pickle', counted_to_pickle)
+    fetcher = new_fetcher()
+    fetcher.wsd(['600000.SH', '600010.SH'], 'close,open', '2018-01-01', '2018-01-31')
+    assert fetcher.request_count == 2
+    assert len(path_list) == 2
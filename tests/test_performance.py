@@ -0,0 +1,248 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/27 10:20
+@File    : test_performance.py
+@contact : mmmaaaggg@163.com
+@desc    : calc_performance 向量化计算与原逐行循环实现的结果一致
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from direstinvoker.utils.fh_utils import try_2_date, get_last, _get_df_between_date_by_index, calc_performance
+
+
+def _calc_performance_loop(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='weekly', rf=0.02, suffix_name=None):
+    """
+    改为向量化计算之前的逐行循环实现（pandas 新版本兼容的写法除外），作为对照
+    """
+    nav_sorted_df = nav_df.copy()
+    nav_sorted_df.index = [try_2_date(idx) for idx in nav_sorted_df.index]
+    nav_sorted_df.sort_index(inplace=True)
+    # 计算数据实际频率是日频、周频、月頻
+    data_count = nav_sorted_df.shape[0]
+    day_per_data = (nav_sorted_df.index[data_count - 1] - nav_sorted_df.index[0]).days / data_count
+    if day_per_data <= 0.008:
+        freq_real = 'minute'
+    elif day_per_data <= 0.2:
+        freq_real = 'hour'
+    elif day_per_data <= 2:
+        freq_real = 'daily'
+    elif day_per_data <= 10:
+        freq_real = 'weekly'
+    else:
+        freq_real = 'monthly'
+    if freq is None:
+        freq = freq_real
+    elif freq != freq_real:
+        warnings_msg = "data freq wrong, expect %s, but %s was detected" % (freq, freq_real)
+        # warnings.warn(warnings_msg)
+        # logging.warning(warnings_msg)
+        raise ValueError(warnings_msg)
+
+    freq_str = ''
+    if freq == 'weekly':
+        data_count_per_year = 50
+        freq_str = '周'
+    elif freq == 'monthly':
+        data_count_per_year = 12
+        freq_str = '月'
+    elif freq == 'daily':
+        data_count_per_year = 250
+        freq_str = '日'
+    elif freq == 'hour':
+        data_count_per_year = 1250
+        freq_str = '时'
+    elif freq == 'minute':
+        data_count_per_year = 75000
+        freq_str = '分'
+    else:
+        raise ValueError('freq=%s 只接受 daily weekly monthly 三种之一', freq)
+    stat_dic_dic = OrderedDict()
+    if type(date_frm) is str:
+        date_frm = datetime.strptime(date_frm, '%Y-%m-%d').date()
+    if type(date_to) is str:
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+
+    col_name_list = list(nav_sorted_df.columns)
+    # date_col_name = col_name_list[0]
+    # col_name_list = col_name_list[1:]
+    for col_name in col_name_list:
+        data_sub_df = nav_sorted_df[[col_name]].dropna()
+        if data_sub_df.shape[0] == 0:
+            continue
+        # rr_df = (1 + data_sub_df.pct_change().fillna(0)).cumprod()
+        # rr_df.index = [try_2_date(d) for d in rr_df.index]
+        # data_df = rr_df.reset_index()
+        # data_df.columns = ['Date', 'Value']
+        # 2018-07-01 不再重置索引，index为日期字段
+        data_df = _get_df_between_date_by_index(data_sub_df, date_frm, date_to)
+        data_df.columns = ['Value']
+        rr_df = data_df.Value.pct_change().fillna(0)
+        data_df.Value = (1 + rr_df).cumprod()
+        data_df['ret'] = rr_df
+        date_list = list(data_df.index)
+        date_latest = date_list[-1]
+        nav_latest = data_df.Value.loc[date_latest]
+        # 计算 近7天，近30天，近365天收益率
+        date_week_ago = date_latest - timedelta(days=7)
+        date_month_ago = date_latest - timedelta(days=30)
+        date_year_ago = date_latest - timedelta(days=365)
+        date_week_ago = get_last(date_list, lambda x: x <= date_week_ago)
+        date_month_ago = get_last(date_list, lambda x: x <= date_month_ago)
+        date_year_ago = get_last(date_list, lambda x: x <= date_year_ago)
+        rr_week = (nav_latest / data_df.Value.loc[date_week_ago] - 1) if date_week_ago is not None else None
+        rr_month = (nav_latest / data_df.Value.loc[date_month_ago] - 1) if date_month_ago is not None else None
+        rr_year = (nav_latest / data_df.Value.loc[date_year_ago] - 1) if date_year_ago is not None else None
+
+        # 计算时间跨度
+        date_span = date_list[-1] - date_list[0]
+        date_span_fraction = 365 / date_span.days if date_span.days > 0 else 1
+        # basic indicators
+        CAGR = data_df.Value[date_latest] ** date_span_fraction - 1
+        # 相当于余额宝倍数
+        times_yeb = (CAGR - 1) / 0.03
+        rr_tot = data_df.Value[date_latest] - 1
+        ann_vol = np.std(data_df.ret, ddof=1) * np.sqrt(data_count_per_year)
+        down_side_vol = np.std(data_df.ret[data_df.ret < 0], ddof=1) * np.sqrt(data_count_per_year)
+        # WeeksNum = data.shape[0]
+        profit_loss_ratio = -np.mean(data_df.ret[data_df.ret > 0]) / np.mean(data_df.ret[data_df.ret < 0])
+        win_ratio = len(data_df.ret[data_df.ret >= 0]) / len(data_df.ret)
+        min_value = min(data_df.Value)
+        final_value = data_df.Value[data_df.index[-1]]
+        max_ret = max(data_df.ret)
+        min_ret = min(data_df.ret)
+        # End of basic indicators
+        # max dropdown related
+        data_df['mdd'] = data_df.Value / data_df.Value.cummax() - 1
+        mdd_size = min(data_df.mdd)
+        droparray = pd.Series(data_df.index[data_df.mdd == 0])
+        if len(droparray) == 1:
+            mdd_max_period = len(data_df.mdd)
+        else:
+            if float(data_df.Value[droparray.tail(1)].iloc[0]) > float(data_df.Value.tail(1).iloc[0]):
+                droparray = pd.concat([droparray, pd.Series([data_df.index[-1]])], ignore_index=True)  # , ignore_index=True
+            mdd_max_period = max(droparray.diff().dropna()).days - 1
+        # End of max dropdown related
+        # High level indicators
+        sharpe_ratio = (CAGR - rf) / ann_vol
+        sortino_ratio = (CAGR - rf) / down_side_vol
+        calmar_ratio = CAGR / (-mdd_size)
+        #  Natural month return
+        j = 1
+        for i, (date_4_df_idx, item) in enumerate(data_df.T.items()):
+            if i == 0:
+                month_ret = pd.DataFrame([[date_4_df_idx, item.Value]], columns=('Date', 'Value'))
+            else:
+                date_last_4_last = data_df.index[i - 1]
+                if date_4_df_idx.month != date_last_4_last.month:
+                    month_ret.loc[j] = [date_last_4_last, data_df.Value[date_last_4_last]]
+                    j += 1
+
+        month_ret.loc[j] = [date_latest, nav_latest]
+        month_ret['ret'] = month_ret.Value.pct_change().fillna(0)
+        max_rr_month = max(month_ret.ret)
+        min_rr_month = min(month_ret.ret)
+        # End of Natural month return
+        date_begin = date_list[0]  # .date()
+        date_end = date_list[-1]
+        stat_dic = OrderedDict([('date_begen', date_begin),
+                                ('date_end', date_end),
+                                ('rr_tot', rr_tot),
+                                ('rr_week', rr_week),
+                                ('rr_month', rr_month),
+                                ('rr_year', rr_year),
+                                ('final_value', final_value),
+                                ('min_value', min_value),
+                                ('CAGR', CAGR),
+                                ('ann_vol', ann_vol),
+                                ('down_side_vol', down_side_vol),
+                                ('mdd', mdd_size),
+                                ('sharpe_ratio', sharpe_ratio),
+                                ('sortino_ratio', sortino_ratio),
+                                ('calmar_ratio', calmar_ratio),
+                                ('profit_loss_ratio', profit_loss_ratio),  # 盈亏比
+                                ('win_ratio', '%.2f' % win_ratio),  # 胜率
+                                ('mdd_max_period', mdd_max_period),  # 最长不创新高周期数
+                                ('freq', freq_str),  # 周期类型
+                                ('max_ret', max_ret),  # 统计周期最大收益
+                                ('min_ret', min_ret),  # 统计周期最大亏损
+                                ('max_rr_month', max_rr_month),  # 最大月收益
+                                ('min_rr_month', min_rr_month),  # 最大月亏损
+                                ])
+        stat_dic_dic[col_name if suffix_name is None else col_name + "_" + suffix_name] = stat_dic
+
+    return stat_dic_dic
+
+
+def make_nav_df(n, freq, col_count=5, seed=0, to_date=False):
+    """
+    生成净值数据，各列分别为：完整数据、前 1/3 缺失、后 1/2 缺失、随机缺失、仅前 5 个数据，多于 5 列时其余列全部缺失
+    """
+    random_state = np.random.RandomState(seed)
+    idx = pd.date_range('2015-01-05', periods=n, freq=freq)
+    nav_df = pd.DataFrame(np.cumprod(1 + random_state.normal(0.0005, 0.01, (n, col_count)), axis=0),
+                          index=idx, columns=['c%d' % num for num in range(col_count)])
+    nav_df.iloc[:n // 3, 1] = np.nan
+    nav_df.iloc[n // 2:, 2] = np.nan
+    nav_df.iloc[random_state.randint(0, n, n // 10), 3] = np.nan
+    nav_df.iloc[5:, 4] = np.nan
+    if col_count > 5:
+        nav_df.iloc[:, 5:] = np.nan
+    if to_date:
+        nav_df.index = [dt.date() for dt in idx]
+    return nav_df
+
+
+def _calc_performance_by_col(nav_df, date_frm, date_to, freq):
+    stat_dic_dic = OrderedDict()
+    for col_name in nav_df.columns:
+        try:
+            stat_dic_dic.update(_calc_performance_loop(nav_df[[col_name]], date_frm, date_to, freq=freq))
+        except IndexError:
+            # 原实现中统计区间内没有数据的列报错，新实现跳过该列
+            pass
+    return stat_dic_dic
+
+
+def assert_stat_equal(expected_dic, stat_dic):
+    assert list(stat_dic) == list(expected_dic)
+    for col_name, expected_stat_dic in expected_dic.items():
+        assert list(stat_dic[col_name]) == list(expected_stat_dic)
+        for key, expected in expected_stat_dic.items():
+            value = stat_dic[col_name][key]
+            if isinstance(expected, (float, np.floating)):
+                assert np.isclose(value, expected, rtol=1e-9, atol=1e-12, equal_nan=True), (col_name, key)
+            else:
+                assert value == expected, (col_name, key)
+
+
+@pytest.mark.parametrize('date_frm, date_to', [(None, None), ('2015-06-01', None), (None, '2016-03-01')])
+@pytest.mark.parametrize('n, freq, freq_name, kwargs', [
+    (500, 'B', 'daily', {}),
+    (300, 'W', 'weekly', {'to_date': True}),
+    (100, 'MS', 'monthly', {}),
+    (500, 'B', 'daily', {'col_count': 6}),
+    (3, 'B', 'daily', {}),
+])
+def test_calc_performance_same_as_loop(n, freq, freq_name, kwargs, date_frm, date_to):
+    nav_df = make_nav_df(n, freq, **kwargs)
+    expected_dic = _calc_performance_by_col(nav_df, date_frm, date_to, freq_name)
+    assert_stat_equal(expected_dic, calc_performance(nav_df, date_frm, date_to, freq=freq_name))
+
+
+def test_calc_performance_detect_freq():
+    idx = pd.date_range('2018-01-02 09:30', periods=240 * 60, freq='min')
+    random_state = np.random.RandomState(1)
+    nav_df = pd.DataFrame(np.cumprod(1 + random_state.normal(0, 0.001, (len(idx), 3)), axis=0),
+                          index=idx, columns=['a', 'b', 'c'])
+    nav_df.iloc[:1000, 1] = np.nan
+    daily_df = nav_df.resample('D').last().dropna(how='all')
+    assert_stat_equal(_calc_performance_loop(daily_df, freq=None), calc_performance(daily_df, freq=None))
+    # 分钟数据
+    stat_dic = calc_performance(nav_df, freq='minute')
+    assert stat_dic['a']['freq'] == '分'
+    assert np.isclose(stat_dic['a']['final_value'], nav_df['a'].iloc[-1] / nav_df['a'].iloc[0])
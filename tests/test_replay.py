@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 14:00
+@File    : test_replay.py
+@contact : mmmaaaggg@163.com
+@desc    : 请求录制、回放
+"""
+import os
+import asyncio
+import pytest
+from direstinvoker import APIError
+from direstinvoker.iwind import WindRestInvoker
+from direstinvoker.utils.replay import ReplayArchive, ReplayMissError, RECORD, REPLAY
+from direstinvoker.utils.retry import RetryPolicy
+
+# 回放时不发送请求，使用无法连接的地址
+UNREACHABLE_URL = 'http://127.0.0.1:1/wind/'
+
+
+def _record(mock_server, file_path):
+    archive = ReplayArchive(file_path, RECORD)
+    invoker = WindRestInvoker(mock_server.wind_url, archive=archive, retry_policy=RetryPolicy(max_retries=0))
+    try:
+        wss_df = invoker.wss('600000.SH,600010.SH', 'close,open', 'tradeDate=20180105')
+        wsd_df = invoker.wsd('600000.SH', 'close', '2018-01-01', '2018-01-31')
+        with pytest.raises(APIError) as exc_info:
+            invoker.wss('BAD.SH', 'close', 'tradeDate=20180105')
+    finally:
+        invoker.close()
+        archive.close()
+    return wss_df, wsd_df, exc_info.value
+
+
+def test_record_replay_round_trip(mock_server, tmp_path):
+    file_path = str(tmp_path / 'wind_archive')
+    wss_df, wsd_df, record_exp = _record(mock_server, file_path)
+    archive = ReplayArchive(file_path, REPLAY)
+    invoker = WindRestInvoker(UNREACHABLE_URL, archive=archive, retry_policy=RetryPolicy(max_retries=0))
+    try:
+        assert invoker.wss('600000.SH,600010.SH', 'close,open', 'tradeDate=20180105').equals(wss_df)
+        assert invoker.wsd('600000.SH', 'close', '2018-01-01', '2018-01-31').equals(wsd_df)
+        # 错误返回同样回放
+        with pytest.raises(APIError) as exc_info:
+            invoker.wss('BAD.SH', 'close', 'tradeDate=20180105')
+        assert exc_info.value.error_code == record_exp.error_code
+        with pytest.raises(ReplayMissError):
+            invoker.wss('600016.SH', 'close', 'tradeDate=20180105')
+        stat_dic = archive.get_stats()
+    finally:
+        invoker.close()
+        archive.close()
+    assert stat_dic['entry_count'] == 3
+    assert stat_dic['hit_count'] == 3
+    assert stat_dic['miss_count'] == 1
+    assert [item[0] for item in archive.get_misses()] == ['wss/']
+
+
+def test_append_and_rebuild_index(mock_server, tmp_path):
+    file_path = str(tmp_path / 'wind_archive')
+    wss_df, _, _ = _record(mock_server, file_path)
+    # 追加录制时扫描已有数据文件，同一请求保留最后一次
+    _record(mock_server, file_path)
+    os.remove(file_path + '.idx')
+    archive = ReplayArchive(file_path, REPLAY)
+    invoker = WindRestInvoker(UNREACHABLE_URL, archive=archive)
+    try:
+        assert invoker.wss('600000.SH,600010.SH', 'close,open', 'tradeDate=20180105').equals(wss_df)
+        assert archive.get_stats()['entry_count'] == 3
+    finally:
+        invoker.close()
+        archive.close()
+
+
+def test_async_replay(mock_server, tmp_path):
+    pytest.importorskip('aiohttp')
+    from direstinvoker.aio import AsyncWindRestInvoker
+    file_path = str(tmp_path / 'wind_archive')
+    wss_df, wsd_df, _ = _record(mock_server, file_path)
+    archive = ReplayArchive(file_path, REPLAY)
+
+    async def replay():
+        async with AsyncWindRestInvoker(UNREACHABLE_URL, archive=archive) as invoker:
+            return await asyncio.gather(
+                invoker.wss('600000.SH,600010.SH', 'close,open', 'tradeDate=20180105'),
+                invoker.wsd('600000.SH', 'close', '2018-01-01', '2018-01-31'))
+
+    loop = asyncio.new_event_loop()
+    try:
+        replay_wss_df, replay_wsd_df = loop.run_until_complete(replay())
+    finally:
+        loop.close()
+        archive.close()
+    assert replay_wss_df.equals(wss_df)
+    assert replay_wsd_df.equals(wsd_df)
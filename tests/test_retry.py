@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 11:10
+@File    : test_retry.py
+@contact : mmmaaaggg@163.com
+@desc    : RetryPolicy 错误分类及按错误码重试
+"""
+import pytest
+import requests
+from direstinvoker import APIError
+from direstinvoker.iwind import WindRestInvoker
+from direstinvoker.utils.mock_server import MockDIRestServer
+from direstinvoker.utils.retry import RetryPolicy, RETRYABLE, NO_DATA, FATAL
+
+
+def _api_error(error_code, status=500):
+    return APIError(status, {'error_code': error_code, 'message': ''})
+
+
+@pytest.mark.parametrize('exp, expected', [
+    (_api_error(-40520008), RETRYABLE),
+    (_api_error(-40521010), RETRYABLE),
+    (_api_error(-40520007), NO_DATA),
+    (APIError(400, {'errcode': -4001}), NO_DATA),
+    (_api_error(-40522001, 400), FATAL),
+    (_api_error(-40520005), FATAL),
+    (_api_error(-40522017), FATAL),
+    (APIError(502, None), RETRYABLE),
+    (APIError(400, None), FATAL),
+    (requests.exceptions.ConnectionError(), RETRYABLE),
+    (requests.exceptions.ReadTimeout(), RETRYABLE),
+    (ValueError(), FATAL),
+])
+def test_classify(exp, expected):
+    assert RetryPolicy().classify(exp) == expected
+
+
+def test_classify_override():
+    retry_policy = RetryPolicy(error_code_category_dic={-40522017: RETRYABLE})
+    assert retry_policy.classify(_api_error(-40522017)) == RETRYABLE
+
+
+@pytest.mark.parametrize('no_data_as_empty, expected', [(False, FATAL), (True, NO_DATA)])
+def test_check_no_data(no_data_as_empty, expected):
+    retry_policy = RetryPolicy(no_data_as_empty=no_data_as_empty)
+    assert retry_policy.check(_api_error(-40520007), 0) == (expected, None)
+    assert retry_policy.get_stats()['no_data_count'] == 1
+
+
+def test_check_max_retries_and_budget():
+    retry_policy = RetryPolicy(max_retries=2, budget=3, base_delay=1, max_delay=2)
+    exp = _api_error(-40520008)
+    budget = retry_policy.new_budget()
+    category, delay = retry_policy.check(exp, 0, budget)
+    assert category == RETRYABLE and 0.5 <= delay <= 1
+    assert retry_policy.check(exp, 1, budget)[0] == RETRYABLE
+    # 单个请求超过 max_retries
+    assert retry_policy.check(exp, 2, budget) == (FATAL, None)
+    # 各分段共用的预算用完
+    assert retry_policy.check(exp, 0, budget)[0] == RETRYABLE
+    assert retry_policy.check(exp, 0, budget) == (FATAL, None)
+    assert retry_policy.get_stats() == {'retry_count': 3, 'no_data_count': 0, 'give_up_count': 2}
+
+
+def test_retry_against_server():
+    with MockDIRestServer(error_rate=0.5, seed=1) as server:
+        retry_policy = RetryPolicy(max_retries=20, budget=None, base_delay=0, max_delay=0)
+        invoker = WindRestInvoker(server.wind_url, retry_policy=retry_policy)
+        try:
+            for _ in range(5):
+                data_df = invoker.wss('600000.SH,600010.SH', 'close', 'tradeDate=20180105')
+                assert list(data_df.index) == ['600000.SH', '600010.SH']
+        finally:
+            invoker.close()
+        assert retry_policy.get_stats()['retry_count'] > 0
+        assert server.get_stats()['request_count'] == 5 + retry_policy.get_stats()['retry_count']
+
+
+def test_quota_error_not_retried():
+    with MockDIRestServer(error_rate=1.0, error_code=-40522017) as server:
+        invoker = WindRestInvoker(server.wind_url, retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+        try:
+            with pytest.raises(APIError) as exc_info:
+                invoker.wss('600000.SH', 'close', 'tradeDate=20180105')
+        finally:
+            invoker.close()
+        assert exc_info.value.error_code == -40522017
+        assert server.get_stats()['request_count'] == 1
@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/27 14:30
+@File    : test_return_risk.py
+@contact : mmmaaaggg@163.com
+@desc    : return_risk_analysis 向量化计算与原逐行循环实现的结果一致
+"""
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from direstinvoker.utils.fh_utils import try_2_date, get_df_between_date, _resample_month_last, \
+    return_risk_analysis, format_return_risk_stat
+
+
+def _return_risk_analysis_loop(nav_df: pd.DataFrame, date_frm=None, date_to=None, freq='weekly', rf=0.02, suffix_name=None):
+    """
+    改为向量化计算之前的逐行循环实现（pandas 新版本兼容的写法除外），作为对照
+    """
+    nav_sorted_df = nav_df.copy()
+    nav_sorted_df.index = pd.to_datetime([try_2_date(idx) for idx in nav_sorted_df.index])
+    nav_sorted_df.sort_index(inplace=True)
+    # 计算数据实际频率是日频、周频、月頻
+    data_count = nav_sorted_df.shape[0]
+    day_per_data = (nav_sorted_df.index[data_count - 1] - nav_sorted_df.index[0]).days / data_count
+    if day_per_data <= 0.008:
+        freq_real = 'minute'
+    elif day_per_data <= 0.2:
+        freq_real = 'hour'
+    elif day_per_data <= 2:
+        freq_real = 'daily'
+    elif day_per_data <= 10:
+        freq_real = 'weekly'
+    else:
+        freq_real = 'monthly'
+    if freq is None:
+        freq = freq_real
+    elif freq != freq_real:
+        warnings_msg = "data freq wrong, expect %s, but %s was detected" % (freq, freq_real)
+        # warnings.warn(warnings_msg)
+        # logging.warning(warnings_msg)
+        raise ValueError(warnings_msg)
+
+    freq_str = ''
+    if freq == 'weekly':
+        data_count_per_year = 50
+        freq_str = '周'
+    elif freq == 'monthly':
+        data_count_per_year = 12
+        freq_str = '月'
+    elif freq == 'daily':
+        data_count_per_year = 250
+        freq_str = '日'
+    elif freq == 'hour':
+        data_count_per_year = 1250
+        freq_str = '时'
+    elif freq == 'minute':
+        data_count_per_year = 75000
+        freq_str = '分'
+    else:
+        raise ValueError('freq=%s 只接受 daily weekly monthly 三种之一', freq)
+    stat_dic_dic = OrderedDict()
+    mon_rr_dic = {}
+    if type(date_frm) is str:
+        date_frm = datetime.strptime(date_frm, '%Y-%m-%d').date()
+    if type(date_to) is str:
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+
+    col_name_list = list(nav_sorted_df.columns)
+    # date_col_name = col_name_list[0]
+    # col_name_list = col_name_list[1:]
+    for col_name in col_name_list:
+        data_sub_df = nav_sorted_df[[col_name]].dropna()
+        if data_sub_df.shape[0] == 0:
+            continue
+        rr_df = (1 + data_sub_df.pct_change().fillna(0)).cumprod()
+        # rr_df.index = [try_2_date(d) for d in rr_df.index]
+        data_df = rr_df.reset_index()
+        data_df.columns = ['Date', 'Value']
+        data_df = get_df_between_date(data_df, date_frm, date_to)
+        data_df.Value = data_df.Value / data_df.Value[0]
+        data_df['ret'] = data_df.Value.pct_change().fillna(0)
+        date_span = data_df.Date[data_df.index[-1]] - data_df.Date[data_df.index[0]]
+        date_span_fraction = 365 / date_span.days if date_span.days > 0 else 1
+        # basic indicators
+        CAGR = data_df.Value[data_df.index[-1]] ** date_span_fraction - 1
+        period_rr = data_df.Value[data_df.index[-1]] - 1
+        ann_vol = np.std(data_df.ret, ddof=1) * np.sqrt(data_count_per_year)
+        down_side_vol = np.std(data_df.ret[data_df.ret < 0], ddof=1) * np.sqrt(data_count_per_year)
+        # WeeksNum = data.shape[0]
+        profit_loss_ratio = -np.mean(data_df.ret[data_df.ret > 0]) / np.mean(data_df.ret[data_df.ret < 0])
+        win_ratio = len(data_df.ret[data_df.ret >= 0]) / len(data_df.ret)
+        min_value = min(data_df.Value)
+        final_value = data_df.Value[data_df.index[-1]]
+        max_ret = max(data_df.ret)
+        min_ret = min(data_df.ret)
+        # End of basic indicators
+        # max dropdown related
+        data_df['mdd'] = data_df.Value / data_df.Value.cummax() - 1
+        mdd_size = min(data_df.mdd)
+        droparray = pd.Series(data_df.index[data_df.mdd == 0])
+        if len(droparray) == 1:
+            mdd_max_period = len(data_df.mdd)
+        else:
+            if float(data_df.Value[droparray.tail(1)].iloc[0]) > float(data_df.Value.tail(1).iloc[0]):
+                droparray = pd.concat([droparray, pd.Series([data_df.index[-1]])], ignore_index=True)  # , ignore_index=True
+            mdd_max_period = max(droparray.diff().dropna()) - 1
+        # End of max dropdown related
+        # High level indicators
+        sharpe_ratio = (CAGR - rf) / ann_vol
+        sortino_ratio = (CAGR - rf) / down_side_vol
+        calmar_ratio = CAGR / (-mdd_size)
+        #  Natural month return
+        j = 1
+        for i in data_df.index:
+            if i == 0:
+                month_ret = pd.DataFrame([[data_df.Date[i], data_df.Value[i]]], columns=('Date', 'Value'))
+            else:
+                if data_df.Date[i].month != data_df.Date[i - 1].month:
+                    month_ret.loc[j] = [data_df.Date[i - 1], data_df.Value[i - 1]]
+                    j += 1
+        month_ret.loc[j] = [data_df.Date[data_df.index[-1]], data_df.Value[data_df.index[-1]]]
+        month_ret['ret'] = month_ret.Value.pct_change().fillna(0)
+        max_rr_month = max(month_ret.ret)
+        min_rr_month = min(month_ret.ret)
+        # End of Natural month return
+        data_len = data_df.shape[0]
+        date_begin = data_df.Date[0]  # .date()
+        date_end = data_df.Date[data_len-1]
+        stat_dic = OrderedDict([('起始日期', date_begin),
+                                ('截止日期', date_end),
+                                ('区间收益率', '%.2f%%' % (period_rr * 100)),
+                                ('最终净值', '%.4f' % final_value),
+                                ('最低净值', '%.4f' % min_value),
+                                ('年化收益率', '%.2f%%' % (CAGR * 100)),
+                                ('年化波动率', '%.2f%%' % (ann_vol * 100)),
+                                ('年化下行波动率', '%.2f%%' % (down_side_vol * 100)),
+                                ('最大回撤', '%.2f%%' % (mdd_size * 100)),
+                                ('夏普率', '%.2f' % sharpe_ratio),
+                                ('索提诺比率', '%.2f' % sortino_ratio),
+                                ('卡马比率', '%.2f' % calmar_ratio),
+                                ('盈亏比', '%.2f' % profit_loss_ratio),
+                                ('胜率', '%.2f' % win_ratio),
+                                ('最长不创新高（%s）' % freq_str, mdd_max_period),
+                                ('统计周期最大收益', '%.2f%%' % (max_ret * 100)),
+                                ('统计周期最大亏损', '%.2f%%' % (min_ret * 100)),
+                                ('最大月收益', '%.2f%%' % (max_rr_month * 100)),
+                                ('最大月亏损', '%.2f%%' % (min_rr_month * 100))])
+        stat_dic_dic[col_name if suffix_name is None else col_name + "_" + suffix_name] = stat_dic
+
+        # 按时间周期进行相关统计
+        data_df = data_df.set_index('Date')[['Value']]
+        # data_df_g = data_df.groupby(pd.Grouper(freq='M'))
+        # TODO: 首月收益未被计算进去，以后再修复
+        monthly_rr_df = _resample_month_last(data_df).ffill().pct_change().fillna(0)
+        mon_rr_dic[col_name if suffix_name is None else col_name + "_" + suffix_name] = monthly_rr_df
+
+    if len(stat_dic_dic) > 0:
+        stat_df = pd.DataFrame(stat_dic_dic)
+        stat_df = stat_df.loc[list(stat_dic.keys())]
+    else:
+        stat_df = None
+
+    return stat_df, mon_rr_dic
+
+
+def make_nav_df(n, freq, seed=1):
+    """
+    生成净值数据，各列分别为：完整数据、前 1/3 缺失、后 1/2 缺失、随机缺失、仅前 5 个数据、中间连续数月缺失
+    """
+    random_state = np.random.RandomState(seed)
+    idx = pd.date_range('2015-01-05', periods=n, freq=freq)
+    nav_df = pd.DataFrame(np.cumprod(1 + random_state.normal(0.0005, 0.01, (n, 6)), axis=0),
+                          index=idx, columns=['c%d' % num for num in range(6)])
+    nav_df.iloc[:n // 3, 1] = np.nan
+    nav_df.iloc[n // 2:, 2] = np.nan
+    nav_df.iloc[random_state.randint(0, n, n // 10), 3] = np.nan
+    nav_df.iloc[5:, 4] = np.nan
+    nav_df.iloc[n // 4:n // 2, 5] = np.nan
+    return nav_df
+
+
+@pytest.mark.parametrize('date_frm, date_to', [
+    (None, None), (pd.Timestamp('2015-06-01'), None), (None, pd.Timestamp('2016-03-01'))])
+@pytest.mark.parametrize('n, freq, freq_name', [
+    (600, 'B', 'daily'),
+    (300, 'W', 'weekly'),
+    (100, 'MS', 'monthly'),
+    (4, 'B', 'daily'),
+])
+def test_return_risk_analysis_same_as_loop(n, freq, freq_name, date_frm, date_to):
+    nav_df = make_nav_df(n, freq)
+    expected_stat_dic, expected_mon_dic = OrderedDict(), {}
+    for col_name in nav_df.columns:
+        try:
+            col_stat_df, col_mon_dic = _return_risk_analysis_loop(nav_df[[col_name]], date_frm, date_to, freq=freq_name)
+        except (KeyError, IndexError):
+            # 原实现中统计区间内没有数据的列报错，新实现跳过该列
+            continue
+        expected_stat_dic[col_name] = col_stat_df[col_name]
+        expected_mon_dic.update(col_mon_dic)
+    expected_df = pd.DataFrame(expected_stat_dic)
+
+    stat_df, mon_rr_dic = return_risk_analysis(nav_df, date_frm, date_to, freq=freq_name)
+    if len(expected_stat_dic) == 0:
+        # 统计区间内全部列都没有数据
+        assert stat_df is None
+        return
+    assert list(stat_df.columns) == list(expected_df.columns)
+    assert list(stat_df.index) == list(expected_df.index)
+    for col_name in expected_df.columns:
+        for key in expected_df.index:
+            expected, value = expected_df.loc[key, col_name], stat_df.loc[key, col_name]
+            # 格式化后的字符串完全一致，最长不创新高为数值
+            assert value == expected or float(value) == float(expected), (col_name, key)
+        expected_mon_df, mon_df = expected_mon_dic[col_name], mon_rr_dic[col_name]
+        assert mon_df.index.equals(expected_mon_df.index)
+        assert np.allclose(mon_df.values, expected_mon_df.values, rtol=1e-12, equal_nan=True)
+
+    # 不格式化的数值结果格式化后与默认结果一致
+    num_df, _ = return_risk_analysis(nav_df, date_frm, date_to, freq=freq_name, formatted=False)
+    assert format_return_risk_stat(num_df).equals(stat_df)
@@ -0,0 +1,42 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/26 11:40
+@File    : test_schema.py
+@contact : mmmaaaggg@163.com
+@desc    : compact_df 数值类型降级
+"""
+import numpy as np
+import pandas as pd
+from direstinvoker.utils.schema import compact_df
+
+
+def test_compact_keeps_float_fields():
+    df = pd.DataFrame({
+        'CLOSE': [10.0, 11.0, 12.0],
+        'volume': [1000.0, 2000.0, 3000.0],
+        'PCT_CHG': [1.0, 0.0, -1.0],
+        'NUM': [1.0, 2.0, 3.0],
+        'RATIO': [0.1, 0.2, 0.3],
+        'CNT': [1, 2, 3],
+    })
+    compacted_df = compact_df(df)
+    # 价格、成交量等字段数值均为整数时仍保持 float
+    assert compacted_df['CLOSE'].dtype == np.float32
+    assert compacted_df['volume'].dtype == np.float32
+    assert compacted_df['PCT_CHG'].dtype.kind == 'f'
+    # 未注册字段的整数值转换为最小整数类型
+    assert compacted_df['NUM'].dtype == np.int8
+    assert compacted_df['CNT'].dtype == np.int8
+    # 0.1 等转换为 float32 后数值改变的未注册字段保持 float64
+    assert compacted_df['RATIO'].dtype == np.float64
+    assert np.allclose(compacted_df.astype('float64').values, df.astype('float64').values)
+
+
+def test_compact_float_field_decimals():
+    df = pd.DataFrame({'CLOSE': [10.12, 11.5, np.nan]})
+    compacted_df = compact_df(df)
+    assert compacted_df['CLOSE'].dtype == np.float32
+    assert np.isnan(compacted_df['CLOSE'].values[2])
+    assert np.allclose(compacted_df['CLOSE'].values[:2], [10.12, 11.5])
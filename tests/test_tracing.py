@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author  : MG
+@Time    : 2018/9/14 9:15
+@File    : test_tracing.py
+@contact : mmmaaaggg@163.com
+@desc    : trace hook 按调用抽样
+"""
+from direstinvoker.utils.tracing import Profiler, NETWORK, FRAME, CONCAT
+
+CODE_LIST = ['600000.SH', '600010.SH', '600016.SH']
+
+
+class _RecordHook:
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.sample_count = 0
+        self.event_list = []
+
+    def sample(self):
+        self.sample_count += 1
+        return self.sampled
+
+    def __call__(self, path, phase, elapsed_time, size):
+        self.event_list.append((path, phase))
+
+
+def test_sample_once_per_chunked_call(wind_invoker):
+    hook = _RecordHook(True)
+    wind_invoker.add_trace_hook(hook)
+    wind_invoker.max_code_num_dic['wsd/'] = 1
+    try:
+        wind_invoker.wsd(CODE_LIST, 'close', '2018-01-01', '2018-01-31')
+    finally:
+        wind_invoker.remove_trace_hook(hook)
+        del wind_invoker.max_code_num_dic['wsd/']
+    # 分段请求各分段共用一次抽样结果
+    assert hook.sample_count == 1
+    phase_list = [phase for _, phase in hook.event_list]
+    assert phase_list.count(NETWORK) == len(CODE_LIST)
+    assert phase_list.count(FRAME) == len(CODE_LIST)
+    assert phase_list.count(CONCAT) == 1
+
+
+def test_unsampled_call_not_traced(wind_invoker, monkeypatch):
+    hook = _RecordHook(False)
+    wind_invoker.add_trace_hook(hook)
+    time_called_list = []
+    monkeypatch.setattr(wind_invoker, '_trace', lambda *args: time_called_list.append(args))
+    try:
+        wind_invoker.wss(CODE_LIST, 'close', 'tradeDate=20180105')
+    finally:
+        wind_invoker.remove_trace_hook(hook)
+    assert hook.sample_count == 1
+    assert hook.event_list == []
+    assert time_called_list == []
+
+
+def test_profiler_records_whole_call(wind_invoker):
+    profiler = Profiler(sample_rate=0.5)
+    wind_invoker.add_trace_hook(profiler)
+    try:
+        for _ in range(20):
+            wind_invoker.wss(CODE_LIST, 'close', 'tradeDate=20180105')
+    finally:
+        wind_invoker.remove_trace_hook(profiler)
+    # 被抽中的调用各阶段全部记录，各阶段的抽样次数一致
+    count_set = {stat_dic['count'] for stat_dic in profiler.get_report().get('wss', {}).values()}
+    assert len(count_set) <= 1